@@ -2,42 +2,24 @@
 Brief Agent - AI 行业热点简报生成器
 搜索 AI 行业 24h 热点，提取工具名、用途、评价，输出社交媒体简报
 """
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+from langchain_core.runnables import RunnableConfig
 from core.state import AgentState
-from tools.search import search_content
-from tools.llm_engine import get_llm
+from tools.search import search_results, asearch_results, format_results
+from tools.llm_engine import get_llm, nostream_config
+from tools.context_budget import fit_search_results, describe_savings
 
+# 多话题模式：同时处理的子话题数上限，以及每个子话题的搜索结果数
+BRIEF_TOPIC_CONCURRENCY = int(os.getenv("BRIEF_TOPIC_CONCURRENCY", "4"))
+BRIEF_TOPIC_MAX_RESULTS = int(os.getenv("BRIEF_TOPIC_MAX_RESULTS", "3"))
 
-def brief_generate_node(state: AgentState) -> AgentState:
-    """
-    生成 AI 行业热点简报
-    
-    Args:
-        state: AgentState 状态对象，包含 input_query
-    
-    Returns:
-        更新后的 AgentState，包含生成的简报内容
-    """
-    input_query = state.get("input_query", "").strip()
-    
-    if not input_query:
-        # 如果没有输入查询，使用默认的 AI 行业热点搜索
-        search_query = "AI industry news latest 24 hours tools"
-    else:
-        search_query = f"AI industry {input_query} latest 24 hours tools"
-    
-    try:
-        # 搜索 AI 行业 24h 热点
-        # 如果缺少 API key，使用模拟数据（仅用于测试）
-        import os
-        use_mock_search = not bool(os.getenv("TAVILY_API_KEY"))
-        use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
-        search_results = search_content(search_query, max_results=5, use_mock=use_mock_search)
-        
-        # 获取 LLM 实例（如果缺少 API key，使用模拟 LLM）
-        llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
-        
-        # 构建 System Prompt
-        system_prompt = """你是一位专业的 AI 行业分析师，擅长从搜索结果中提取关键信息并生成社交媒体简报。
+# 提示词模板：system 消息与 user 消息开头的说明每次调用都完全相同，搜索结果放在最后，
+# 使请求前缀稳定，可命中 DeepSeek 的上下文缓存（按前缀匹配，命中部分按缓存单价计费）
+SYSTEM_PROMPT = """你是一位专业的 AI 行业分析师，擅长从搜索结果中提取关键信息并生成社交媒体简报。
 
 你的任务：
 1. 从搜索结果中提取 AI 工具/产品的名称
@@ -57,28 +39,289 @@ def brief_generate_node(state: AgentState) -> AgentState:
 ...
 
 **总结**: [一句话总结今日 AI 行业趋势]"""
-        
-        # 构建用户提示
-        user_prompt = f"""请基于以下搜索结果，生成一份 AI 行业热点简报：
+
+USER_PROMPT_TEMPLATE = """请基于下面的搜索结果生成一份 AI 行业热点简报。请严格按照输出格式要求，提取工具名、用途、评价，并生成社交媒体简报。
+
+搜索结果：
+{search_results}"""
+
+# 多话题模式的 map 提示词：每个子话题只生成工具小节，标题与总结留给合并步骤
+TOPIC_PROMPT_TEMPLATE = """这是多话题 AI 热点简报中的一个子话题。请基于下面的搜索结果，只输出与该子话题相关的工具小节（每个工具一个「### 工具/产品名称」小节，包含用途、亮点、评价），不要输出简报标题和总结。
+
+子话题：{topic}
 
 搜索结果：
-{search_results}
+{search_results}"""
+
+# reduce 提示词：合并各子话题的小节为一份完整简报
+MERGE_PROMPT_TEMPLATE = """下面是按子话题分别整理的工具小节。请将它们合并为一份 AI 行业热点简报：去掉重复的工具，保留各子话题中最重要的内容，严格按照输出格式要求输出，并用一句话总结覆盖所有子话题的今日趋势。
+
+{sections}"""
+
+
+def _query_for(topic: str) -> str:
+    """根据话题构建搜索查询"""
+    if not topic:
+        # 如果没有输入查询，使用默认的 AI 行业热点搜索
+        return "AI industry news latest 24 hours tools"
+    return f"AI industry {topic} latest 24 hours tools"
+
 
-请严格按照输出格式要求，提取工具名、用途、评价，并生成社交媒体简报。"""
+def _search_query(state: AgentState) -> str:
+    """根据 input_query 构建搜索查询"""
+    return _query_for(state.get("input_query", "").strip())
+
+
+def _build_messages(search_results: str) -> List[Dict[str, str]]:
+    """
+    构建简报生成的消息列表
+    
+    Args:
+        search_results: 清洗后的搜索结果文本
+    
+    Returns:
+        LLM 消息列表
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT_TEMPLATE.format(search_results=search_results)}
+    ]
+
+
+def _content(response: Any) -> str:
+    """提取 LLM 响应文本"""
+    return response.content if hasattr(response, 'content') else str(response)
+
+
+def _build_result(response: Any, search_query: str, results: List[Dict[str, str]], savings: str = "") -> Dict[str, Any]:
+    """将 LLM 响应转换为状态更新，并记录搜索结果的链接供 Reviewer 核对来源"""
+    return {
+        "content": _content(response),
+        "sources": [result.get("url", "") for result in results if result.get("url")],
+        "steps": [f"步骤: brief_generate - 已生成 AI 行业热点简报（搜索: {search_query}{savings}）"]
+    }
+
+
+def _build_topic_messages(topic: str, search_results: str) -> List[Dict[str, str]]:
+    """构建单个子话题的消息列表（与整篇生成共用 system 消息）"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": TOPIC_PROMPT_TEMPLATE.format(topic=topic, search_results=search_results)}
+    ]
+
+
+def _build_merge_messages(topics: List[str], sections: List[str]) -> List[Dict[str, str]]:
+    """构建合并各子话题小节的消息列表"""
+    blocks = [f"【子话题：{topic}】\n{text.strip()}" for topic, text in zip(topics, sections)]
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": MERGE_PROMPT_TEMPLATE.format(sections="\n\n---\n\n".join(blocks))}
+    ]
+
+
+# 单个子话题的 map 结果：(工具小节, 搜索结果, 压缩前 token 数, 压缩后 token 数)
+TopicOutput = Tuple[str, List[Dict[str, str]], int, int]
+
+
+def _generate_topic(topic: str, llm: Any, use_mock_search: bool) -> TopicOutput:
+    """map：搜索单个子话题并生成其工具小节"""
+    query = _query_for(topic)
+    results = search_results(query, max_results=BRIEF_TOPIC_MAX_RESULTS, use_mock=use_mock_search, task_type="brief")
+    fitted, before, after = fit_search_results(results, query, "brief_topic")
+    # 子话题的中间结果不输出到 messages / custom 流，避免与合并后的简报拼接或交错；只流式输出合并结果
+    response = llm.invoke(_build_topic_messages(topic, format_results(fitted, query)), config=nostream_config())
+    return _content(response), results, before, after
+
+
+async def _agenerate_topic(topic: str, llm: Any, use_mock_search: bool) -> TopicOutput:
+    """_generate_topic 的异步版本"""
+    query = _query_for(topic)
+    results = await asearch_results(query, max_results=BRIEF_TOPIC_MAX_RESULTS, use_mock=use_mock_search, task_type="brief")
+    fitted, before, after = fit_search_results(results, query, "brief_topic")
+    response = await llm.ainvoke(_build_topic_messages(topic, format_results(fitted, query)), config=nostream_config())
+    return _content(response), results, before, after
+
+
+# 子话题的执行结果：成功时为 TopicOutput，失败时为异常
+TopicOutcome = Union[TopicOutput, Exception]
+
+
+def _split_outcomes(
+    topics: List[str],
+    outcomes: List[TopicOutcome]
+) -> Tuple[List[str], List[TopicOutput], List[str]]:
+    """
+    区分成功与失败的子话题，失败的子话题记录到步骤日志后跳过
+    
+    Returns:
+        (成功的子话题, 对应的 map 结果, 失败步骤日志)
+    
+    Raises:
+        RuntimeError: 所有子话题都失败
+    """
+    succeeded, outputs, failures = [], [], []
+    for topic, outcome in zip(topics, outcomes):
+        if isinstance(outcome, Exception):
+            failures.append(f"步骤: brief_generate - 子话题「{topic}」生成失败，已跳过: {str(outcome)}")
+        else:
+            succeeded.append(topic)
+            outputs.append(outcome)
+    if not outputs:
+        first = next(outcome for outcome in outcomes if isinstance(outcome, Exception))
+        raise RuntimeError(f"所有子话题均生成失败（{'、'.join(topics)}）: {str(first)}") from first
+    return succeeded, outputs, failures
+
+
+def _build_topics_result(
+    response: Any,
+    topics: List[str],
+    outputs: List[TopicOutput],
+    failures: List[str]
+) -> Dict[str, Any]:
+    """将合并后的简报转换为状态更新，来源链接取所有成功子话题的搜索结果"""
+    results = [result for _, topic_results, _, _ in outputs for result in topic_results]
+    savings = describe_savings(sum(output[2] for output in outputs), sum(output[3] for output in outputs))
+    return {
+        "content": _content(response),
+        "sources": list(dict.fromkeys(result.get("url", "") for result in results if result.get("url"))),
+        "steps": failures + [f"步骤: brief_generate - 已按 {len(topics)} 个子话题并行生成并合并简报（子话题: {'、'.join(topics)}{savings}）"]
+    }
+
+
+def generate_topics(
+    topics: List[str],
+    llm: Any,
+    use_mock_search: bool,
+    config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """
+    多话题简报：各子话题在线程池中并发搜索并生成工具小节（map），再由一次 LLM 调用合并（reduce）
+    
+    单个子话题失败时跳过并记录到步骤日志，只合并成功的子话题。
+    
+    Args:
+        topics: 子话题列表
+        llm: LLM 实例
+        use_mock_search: 是否使用模拟搜索
+        config: LangGraph 运行配置，只透传给合并步骤
+    
+    Returns:
+        状态更新
+    """
+    outcomes: List[TopicOutcome] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(BRIEF_TOPIC_CONCURRENCY, len(topics)))) as executor:
+        # 每个任务复制当前上下文，使搜索与 LLM 调用的指标仍归属 brief_generate 节点
+        futures = [
+            executor.submit(contextvars.copy_context().run, _generate_topic, topic, llm, use_mock_search)
+            for topic in topics
+        ]
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+    
+    succeeded, outputs, failures = _split_outcomes(topics, outcomes)
+    response = llm.invoke(_build_merge_messages(succeeded, [output[0] for output in outputs]), config=config)
+    return _build_topics_result(response, succeeded, outputs, failures)
+
+
+async def agenerate_topics(
+    topics: List[str],
+    llm: Any,
+    use_mock_search: bool,
+    config: Optional[RunnableConfig] = None
+) -> Dict[str, Any]:
+    """
+    generate_topics 的异步版本，各子话题以有限并发的协程执行
+    
+    Returns:
+        状态更新
+    """
+    semaphore = asyncio.Semaphore(max(1, BRIEF_TOPIC_CONCURRENCY))
+    
+    async def run(topic: str) -> TopicOutcome:
+        async with semaphore:
+            try:
+                return await _agenerate_topic(topic, llm, use_mock_search)
+            except Exception as e:
+                return e
+    
+    outcomes = await asyncio.gather(*(run(topic) for topic in topics))
+    succeeded, outputs, failures = _split_outcomes(topics, list(outcomes))
+    response = await llm.ainvoke(_build_merge_messages(succeeded, [output[0] for output in outputs]), config=config)
+    return _build_topics_result(response, succeeded, outputs, failures)
+
+
+def brief_generate_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    生成 AI 行业热点简报
+    
+    Args:
+        state: AgentState 状态对象，包含 input_query 和可选的 sub_topics
+        config: LangGraph 运行配置，透传给 LLM 以支持 messages 模式的 token 流式输出
+    
+    Returns:
+        更新后的 AgentState，包含生成的简报内容
+    """
+    search_query = _search_query(state)
+    topics = state.get("sub_topics") or []
+    
+    try:
+        # 搜索 AI 行业 24h 热点
+        # 如果缺少 API key，使用模拟数据（仅用于测试）
+        use_mock_search = not bool(os.getenv("TAVILY_API_KEY"))
+        use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+        
+        # 多话题模式：各子话题并行搜索与生成，合并为一份简报后统一审查与配图
+        if topics:
+            llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
+            return generate_topics(topics, llm, use_mock_search, config)
+        
+        results = search_results(search_query, max_results=5, use_mock=use_mock_search, task_type="brief")
+        
+        # 去重并按相关性裁剪搜索结果，控制上下文 token 数
+        fitted, before, after = fit_search_results(results, search_query, "brief_generate")
+        
+        # 获取 LLM 实例（如果缺少 API key，使用模拟 LLM）
+        llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
         
         # 调用 LLM 生成简报
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        response = llm.invoke(_build_messages(format_results(fitted, search_query)), config=config)
+        return _build_result(response, search_query, results, describe_savings(before, after))
         
-        response = llm.invoke(messages)
-        content = response.content if hasattr(response, 'content') else str(response)
+    except Exception as e:
+        error_msg = f"生成简报失败: {str(e)}"
+        raise RuntimeError(f"步骤: brief_generate - {error_msg}") from e
+
+
+async def abrief_generate_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    brief_generate_node 的异步版本，搜索与 LLM 调用均不阻塞事件循环
+    
+    Args:
+        state: AgentState 状态对象，包含 input_query 和可选的 sub_topics
+        config: LangGraph 运行配置，透传给 LLM 以支持 messages 模式的 token 流式输出
+    
+    Returns:
+        更新后的 AgentState，包含生成的简报内容
+    """
+    search_query = _search_query(state)
+    topics = state.get("sub_topics") or []
+    
+    try:
+        use_mock_search = not bool(os.getenv("TAVILY_API_KEY"))
+        use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+        if topics:
+            llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
+            return await agenerate_topics(topics, llm, use_mock_search, config)
+        
+        results = await asearch_results(search_query, max_results=5, use_mock=use_mock_search, task_type="brief")
+        fitted, before, after = fit_search_results(results, search_query, "brief_generate")
         
-        return {
-            "content": content,
-            "steps": [f"步骤: brief_generate - 已生成 AI 行业热点简报（搜索: {search_query}）"]
-        }
+        llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
+        response = await llm.ainvoke(_build_messages(format_results(fitted, search_query)), config=config)
+        return _build_result(response, search_query, results, describe_savings(before, after))
         
     except Exception as e:
         error_msg = f"生成简报失败: {str(e)}"
@@ -2,40 +2,16 @@
 CV Expert - 计算机视觉项目/趋势分析专家
 搜索特定 CV 项目/趋势，严谨提取技术栈，分析落地场景，禁止脑补
 """
+import os
+from typing import Any, Dict, List, Optional
+from langchain_core.runnables import RunnableConfig
 from core.state import AgentState
-from tools.search import search_content
+from tools.search import search_results, asearch_results, format_results
 from tools.llm_engine import get_llm
+from tools.context_budget import fit_search_results, describe_savings
 
-
-def cv_generate_node(state: AgentState) -> AgentState:
-    """
-    生成 CV 项目/趋势分析报告
-    
-    Args:
-        state: AgentState 状态对象，包含 input_query（CV 项目/趋势关键词）
-    
-    Returns:
-        更新后的 AgentState，包含生成的分析报告
-    """
-    input_query = state.get("input_query", "").strip()
-    
-    if not input_query:
-        raise ValueError("input_query 不能为空，请提供 CV 项目或趋势关键词")
-    
-    try:
-        # 搜索特定 CV 项目/趋势
-        # 如果缺少 API key，使用模拟数据（仅用于测试）
-        import os
-        use_mock_search = not bool(os.getenv("TAVILY_API_KEY"))
-        use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
-        search_query = f"computer vision {input_query} project technology stack"
-        search_results = search_content(search_query, max_results=5, use_mock=use_mock_search)
-        
-        # 获取 LLM 实例（如果缺少 API key，使用模拟 LLM）
-        llm = get_llm(temperature=0.5, use_mock=use_mock_llm)  # 使用较低温度以确保严谨性
-        
-        # 构建 System Prompt
-        system_prompt = """你是一位严谨的计算机视觉专家，擅长从搜索结果中提取技术信息并进行分析。
+# system 消息固定不变，user 消息先放通用要求、最后放查询与搜索结果，保持请求前缀稳定以命中上下文缓存
+SYSTEM_PROMPT = """你是一位严谨的计算机视觉专家，擅长从搜索结果中提取技术信息并进行分析。
 
 重要原则：
 1. **禁止脑补**：所有信息必须基于搜索结果，不得添加搜索结果中没有的内容
@@ -63,28 +39,111 @@ def cv_generate_node(state: AgentState) -> AgentState:
 [基于搜索结果总结的技术特点和创新点]
 
 **数据来源**: 所有信息均基于搜索结果，无脑补内容"""
-        
-        # 构建用户提示
-        user_prompt = f"""请基于以下搜索结果，对 CV 项目/趋势 '{input_query}' 进行严谨分析：
+
+USER_PROMPT_TEMPLATE = """重要：请严格遵守"禁止脑补"原则，所有信息必须基于搜索结果。如果搜索结果中没有相关信息，请明确标注"搜索结果中未找到相关信息"。
+
+请基于以下搜索结果，对 CV 项目/趋势 '{input_query}' 进行严谨分析：
 
 搜索结果：
-{search_results}
+{search_results}"""
+
+
+def _search_query(state: AgentState) -> str:
+    """根据 input_query 构建搜索查询"""
+    input_query = state.get("input_query", "").strip()
+    
+    if not input_query:
+        raise ValueError("input_query 不能为空，请提供 CV 项目或趋势关键词")
+    return f"computer vision {input_query} project technology stack"
+
+
+def _build_messages(input_query: str, search_results: str) -> List[Dict[str, str]]:
+    """
+    构建 CV 分析的消息列表
+    
+    Args:
+        input_query: CV 项目/趋势关键词
+        search_results: 清洗后的搜索结果文本
+    
+    Returns:
+        LLM 消息列表
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT_TEMPLATE.format(input_query=input_query, search_results=search_results)}
+    ]
+
 
-重要：请严格遵守"禁止脑补"原则，所有信息必须基于搜索结果。如果搜索结果中没有相关信息，请明确标注"搜索结果中未找到相关信息"。"""
+def _build_result(response: Any, input_query: str, results: List[Dict[str, str]], savings: str = "") -> Dict[str, Any]:
+    """将 LLM 响应转换为状态更新，并记录搜索结果的链接供 Reviewer 核对来源"""
+    content = response.content if hasattr(response, 'content') else str(response)
+    
+    return {
+        "content": content,
+        "sources": [result.get("url", "") for result in results if result.get("url")],
+        "steps": [f"步骤: cv_generate - 已生成 CV 项目分析报告（查询: {input_query}{savings}）"]
+    }
+
+
+def cv_generate_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    生成 CV 项目/趋势分析报告
+    
+    Args:
+        state: AgentState 状态对象，包含 input_query（CV 项目/趋势关键词）
+        config: LangGraph 运行配置，透传给 LLM 以支持 messages 模式的 token 流式输出
+    
+    Returns:
+        更新后的 AgentState，包含生成的分析报告
+    """
+    search_query = _search_query(state)
+    input_query = state.get("input_query", "").strip()
+    
+    try:
+        # 搜索特定 CV 项目/趋势
+        # 如果缺少 API key，使用模拟数据（仅用于测试）
+        use_mock_search = not bool(os.getenv("TAVILY_API_KEY"))
+        use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+        results = search_results(search_query, max_results=5, use_mock=use_mock_search, task_type="cv")
+        
+        # 去重并按相关性裁剪搜索结果，控制上下文 token 数
+        fitted, before, after = fit_search_results(results, search_query, "cv_generate")
+        
+        # 获取 LLM 实例（如果缺少 API key，使用模拟 LLM）
+        llm = get_llm(temperature=0.5, use_mock=use_mock_llm)  # 使用较低温度以确保严谨性
         
         # 调用 LLM 生成分析报告
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        response = llm.invoke(_build_messages(input_query, format_results(fitted, search_query)), config=config)
+        return _build_result(response, input_query, results, describe_savings(before, after))
         
-        response = llm.invoke(messages)
-        content = response.content if hasattr(response, 'content') else str(response)
+    except Exception as e:
+        error_msg = f"生成 CV 分析报告失败: {str(e)}"
+        raise RuntimeError(f"步骤: cv_generate - {error_msg}") from e
+
+
+async def acv_generate_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    cv_generate_node 的异步版本，搜索与 LLM 调用均不阻塞事件循环
+    
+    Args:
+        state: AgentState 状态对象，包含 input_query（CV 项目/趋势关键词）
+        config: LangGraph 运行配置，透传给 LLM 以支持 messages 模式的 token 流式输出
+    
+    Returns:
+        更新后的 AgentState，包含生成的分析报告
+    """
+    search_query = _search_query(state)
+    input_query = state.get("input_query", "").strip()
+    
+    try:
+        use_mock_search = not bool(os.getenv("TAVILY_API_KEY"))
+        use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+        results = await asearch_results(search_query, max_results=5, use_mock=use_mock_search, task_type="cv")
+        fitted, before, after = fit_search_results(results, search_query, "cv_generate")
         
-        return {
-            "content": content,
-            "steps": [f"步骤: cv_generate - 已生成 CV 项目分析报告（查询: {input_query}）"]
-        }
+        llm = get_llm(temperature=0.5, use_mock=use_mock_llm)
+        response = await llm.ainvoke(_build_messages(input_query, format_results(fitted, search_query)), config=config)
+        return _build_result(response, input_query, results, describe_savings(before, after))
         
     except Exception as e:
         error_msg = f"生成 CV 分析报告失败: {str(e)}"
@@ -0,0 +1,159 @@
+"""
+Paper Agent 子图
+fetch_arxiv -> ingest_pdf -> pyramid_summarize -> reflection_critic -> [condition] -> pyramid_summarize / END
+"""
+from functools import lru_cache
+from typing import Any, Callable, Dict, Literal, Optional
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import StateGraph, END
+from core.state import AgentState, PaperState
+from agents.prereview import MAX_ITERATIONS, is_pass
+from agents.paper_agent.nodes import (
+    fetch_arxiv_node,
+    afetch_arxiv_node,
+    pyramid_summarize_node,
+    apyramid_summarize_node,
+    reflection_critic_node,
+    areflection_critic_node,
+)
+from agents.paper_agent.ingest import ingest_pdf_node, aingest_pdf_node
+from tools.metrics import instrument_node, ainstrument_node
+
+# 子图内输出面向用户文案的节点
+PAPER_STREAMING_NODES = ("summarize",)
+
+
+def should_revise(state: PaperState) -> Literal["summarize", "end"]:
+    """
+    判断是否根据审稿意见重新总结
+    
+    Args:
+        state: PaperState 状态对象
+    
+    Returns:
+        "summarize" 重新总结, "end" 结束子图
+    """
+    critique = state.get("critique", "")
+    iteration = state.get("iteration", 0)
+    
+    # 与主图一致：审查通过或 iteration >= 2 时结束
+    if is_pass(critique):
+        return "end"
+    elif iteration >= MAX_ITERATIONS:
+        return "end"
+    else:
+        return "summarize"
+
+
+def _node(name: str, func: Callable, afunc: Callable) -> RunnableLambda:
+    """组合同步与异步实现，并记录节点指标（指标名带 paper. 前缀）"""
+    return RunnableLambda(
+        instrument_node(f"paper.{name}", func),
+        afunc=ainstrument_node(f"paper.{name}", afunc),
+        name=func.__name__
+    )
+
+
+def create_paper_graph() -> StateGraph:
+    """
+    创建 Paper Agent 子图
+    
+    Returns:
+        编译后的子图
+    """
+    workflow = StateGraph(PaperState)
+    
+    workflow.add_node("fetch", _node("fetch", fetch_arxiv_node, afetch_arxiv_node))
+    workflow.add_node("ingest", _node("ingest", ingest_pdf_node, aingest_pdf_node))
+    workflow.add_node("summarize", _node("summarize", pyramid_summarize_node, apyramid_summarize_node))
+    workflow.add_node("critic", _node("critic", reflection_critic_node, areflection_critic_node))
+    
+    workflow.set_entry_point("fetch")
+    workflow.add_edge("fetch", "ingest")
+    workflow.add_edge("ingest", "summarize")
+    workflow.add_edge("summarize", "critic")
+    workflow.add_conditional_edges(
+        "critic",
+        should_revise,
+        {
+            "summarize": "summarize",
+            "end": END
+        }
+    )
+    
+    return workflow.compile()
+
+
+@lru_cache(maxsize=None)
+def get_paper_graph() -> StateGraph:
+    """获取编译后的子图：首次运行 paper 任务时才编译"""
+    return create_paper_graph()
+
+
+def __getattr__(name: str) -> Any:
+    """兼容 paper_graph 属性访问"""
+    if name == "paper_graph":
+        return get_paper_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _initial_paper_state(state: AgentState) -> PaperState:
+    """从主图状态构建子图的初始状态（累加字段从零开始）"""
+    return PaperState(
+        input_query=state.get("input_query", ""),
+        arxiv_ids=[],
+        papers=[],
+        raw_data="",
+        fulltext_notes="",
+        content="",
+        critique="",
+        iteration=0,
+        steps=[],
+        metrics=[]
+    )
+
+
+def _to_agent_update(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将子图最终状态映射回主图的状态更新
+    
+    iteration/steps/metrics 在主图中使用 operator.add 合并，
+    子图从零开始累加，因此这里返回的正好是本次子图产生的增量。
+    """
+    return {
+        "content": result.get("content", ""),
+        "critique": result.get("critique", ""),
+        "iteration": result.get("iteration", 0),
+        "steps": result.get("steps", []),
+        "metrics": result.get("metrics", []),
+    }
+
+
+def paper_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    主图中的 Paper Agent 节点：运行子图，完成抓取、总结与审稿循环
+    
+    Args:
+        state: AgentState 状态对象，input_query 为一个或多个 Arxiv ID
+        config: LangGraph 运行配置，透传给子图以支持流式输出
+    
+    Returns:
+        更新后的 AgentState，包含总结内容和审稿意见
+    """
+    result = get_paper_graph().invoke(_initial_paper_state(state), config)
+    return _to_agent_update(result)
+
+
+async def apaper_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    paper_node 的异步版本
+    
+    Args:
+        state: AgentState 状态对象，input_query 为一个或多个 Arxiv ID
+        config: LangGraph 运行配置，透传给子图以支持流式输出
+    
+    Returns:
+        更新后的 AgentState，包含总结内容和审稿意见
+    """
+    result = await get_paper_graph().ainvoke(_initial_paper_state(state), config)
+    return _to_agent_update(result)
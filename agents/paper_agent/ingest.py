@@ -0,0 +1,242 @@
+"""
+Paper Agent 全文解析
+流式解析论文 PDF 并按章节做 map-reduce 总结：各章节并发总结（map），再合并为全文要点（reduce）
+"""
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+from core.state import PaperState
+import tools.arxiv_fetch as arxiv_fetch
+from tools.llm_engine import get_llm
+from tools.pdf_ingest import extract_sections
+
+# 是否解析 PDF 全文（关闭时仅使用标题、作者和摘要）
+PAPER_FULLTEXT = os.getenv("PAPER_FULLTEXT", "1").lower() in ("1", "true", "yes")
+# 单篇论文同时进行的章节总结数
+PDF_SUMMARY_CONCURRENCY = int(os.getenv("PDF_SUMMARY_CONCURRENCY", "4"))
+# reduce 阶段单次合并的最大字符数，超过时分组逐级合并
+PDF_MERGE_MAX_CHARS = int(os.getenv("PDF_MERGE_MAX_CHARS", "16000"))
+
+
+def _build_section_messages(title: str, text: str) -> List[Dict[str, str]]:
+    """
+    构建章节总结（map）的消息列表
+    
+    Args:
+        title: 章节标题
+        text: 章节正文
+    
+    Returns:
+        LLM 消息列表
+    """
+    system_prompt = """你是一位严谨的论文阅读助手，负责提炼单个章节的要点。
+
+要求：
+1. 用 3~6 条要点概括本章节的核心内容
+2. 原样保留所有实验数据、指标数值、数据集和对比基线名称
+3. 不要编造章节中没有的信息"""
+    
+    user_prompt = f"""章节：{title}
+
+{text}"""
+    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _build_merge_messages(notes: str) -> List[Dict[str, str]]:
+    """
+    构建章节要点合并（reduce）的消息列表
+    
+    Args:
+        notes: 按章节排列的要点文本
+    
+    Returns:
+        LLM 消息列表
+    """
+    system_prompt = """你是一位严谨的论文阅读助手，负责将各章节要点合并为全文要点。
+
+要求：
+1. 按“问题 / 方法 / 实验与关键指标 / 局限”组织
+2. 原样保留所有实验数据和指标数值
+3. 删除重复内容，不要编造信息"""
+    
+    user_prompt = f"""请合并以下各章节要点：
+
+{notes}"""
+    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _content(response: Any) -> str:
+    """提取 LLM 响应文本"""
+    return response.content if hasattr(response, 'content') else str(response)
+
+
+def _group(notes: List[str], max_chars: int) -> List[List[str]]:
+    """将要点按字符数分组，每组不超过 max_chars（单条超长时独占一组）"""
+    groups: List[List[str]] = [[]]
+    size = 0
+    for note in notes:
+        if groups[-1] and size + len(note) > max_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(note)
+        size += len(note)
+    return groups
+
+
+def _map_in_threads(executor: ThreadPoolExecutor, fn: Callable[[Any], str], items: List[Any]) -> List[str]:
+    """在线程池中并发执行，每个任务复制当前上下文，使指标与流式输出仍归属当前节点"""
+    futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def summarize_document(sections: List[Dict[str, str]], llm: Any) -> str:
+    """
+    对一篇论文做 map-reduce 总结（同步版本，章节总结在线程池中并发执行）
+    
+    Args:
+        sections: extract_sections() 返回的章节列表
+        llm: LLM 实例
+    
+    Returns:
+        全文要点
+    """
+    with ThreadPoolExecutor(max_workers=PDF_SUMMARY_CONCURRENCY) as executor:
+        summaries = _map_in_threads(
+            executor,
+            lambda section: _content(llm.invoke(_build_section_messages(section["title"], section["text"]))),
+            sections
+        )
+        notes = [f"### {section['title']}\n{summary}" for section, summary in zip(sections, summaries)]
+        
+        # reduce：超过单次合并上限时分组合并，直到只剩一组
+        while True:
+            groups = _group(notes, PDF_MERGE_MAX_CHARS)
+            merged = _map_in_threads(
+                executor,
+                lambda group: _content(llm.invoke(_build_merge_messages("\n\n".join(group)))),
+                groups
+            )
+            if len(merged) == 1:
+                return merged[0]
+            notes = merged
+
+
+async def asummarize_document(sections: List[Dict[str, str]], llm: Any) -> str:
+    """
+    summarize_document 的异步版本，章节总结以有限并发的协程执行
+    
+    Args:
+        sections: extract_sections() 返回的章节列表
+        llm: LLM 实例
+    
+    Returns:
+        全文要点
+    """
+    semaphore = asyncio.Semaphore(PDF_SUMMARY_CONCURRENCY)
+    
+    async def call(messages: List[Dict[str, str]]) -> str:
+        async with semaphore:
+            return _content(await llm.ainvoke(messages))
+    
+    summaries = await asyncio.gather(*(
+        call(_build_section_messages(section["title"], section["text"])) for section in sections
+    ))
+    notes = [f"### {section['title']}\n{summary}" for section, summary in zip(sections, summaries)]
+    
+    while True:
+        groups = _group(notes, PDF_MERGE_MAX_CHARS)
+        merged = await asyncio.gather(*(call(_build_merge_messages("\n\n".join(group))) for group in groups))
+        if len(merged) == 1:
+            return merged[0]
+        notes = list(merged)
+
+
+def _fulltext_enabled() -> bool:
+    """离线模式或关闭 PAPER_FULLTEXT 时跳过全文解析"""
+    return PAPER_FULLTEXT and not arxiv_fetch.ARXIV_OFFLINE
+
+
+def _format_notes(results: List[Dict[str, str]]) -> str:
+    """拼接各篇论文的全文要点"""
+    return "\n\n".join(f"### {r['title']}\n{r['notes']}" for r in results)
+
+
+def ingest_pdf_node(state: PaperState) -> PaperState:
+    """
+    全文解析节点：逐篇流式解析 PDF，章节并发总结后合并为全文要点
+    
+    论文逐篇处理，单篇的内存占用受 PDF_SPOOL_BYTES / PDF_MAX_CHARS 限制；
+    某篇解析失败时记录日志并退回仅使用摘要，不中断工作流。
+    
+    Args:
+        state: PaperState 状态对象，包含 papers
+    
+    Returns:
+        更新后的 PaperState，包含 fulltext_notes
+    """
+    papers = state.get("papers", [])
+    if not _fulltext_enabled() or not papers:
+        return {"steps": ["步骤: ingest_pdf - 跳过全文解析"]}
+    
+    use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+    llm = get_llm(temperature=0.3, use_mock=use_mock_llm)
+    
+    results, steps = [], []
+    for paper in papers:
+        try:
+            sections = extract_sections(paper["pdf_url"])
+            if not sections:
+                raise ValueError("未能从 PDF 中抽取到文本")
+            results.append({"title": paper["title"], "notes": summarize_document(sections, llm)})
+            steps.append(f"步骤: ingest_pdf - 已解析 {paper['id']} 全文（{len(sections)} 个章节）")
+        except Exception as e:
+            steps.append(f"步骤: ingest_pdf - {paper['id']} 全文解析失败，仅使用摘要: {str(e)}")
+    
+    return {
+        "fulltext_notes": _format_notes(results),
+        "steps": steps
+    }
+
+
+async def aingest_pdf_node(state: PaperState) -> PaperState:
+    """
+    ingest_pdf_node 的异步版本：PDF 下载与文本抽取在线程中执行，章节总结并发调用 LLM
+    
+    Args:
+        state: PaperState 状态对象，包含 papers
+    
+    Returns:
+        更新后的 PaperState，包含 fulltext_notes
+    """
+    papers = state.get("papers", [])
+    if not _fulltext_enabled() or not papers:
+        return {"steps": ["步骤: ingest_pdf - 跳过全文解析"]}
+    
+    use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+    llm = get_llm(temperature=0.3, use_mock=use_mock_llm)
+    
+    results, steps = [], []
+    for paper in papers:
+        try:
+            sections = await asyncio.to_thread(extract_sections, paper["pdf_url"])
+            if not sections:
+                raise ValueError("未能从 PDF 中抽取到文本")
+            results.append({"title": paper["title"], "notes": await asummarize_document(sections, llm)})
+            steps.append(f"步骤: ingest_pdf - 已解析 {paper['id']} 全文（{len(sections)} 个章节）")
+        except Exception as e:
+            steps.append(f"步骤: ingest_pdf - {paper['id']} 全文解析失败，仅使用摘要: {str(e)}")
+    
+    return {
+        "fulltext_notes": _format_notes(results),
+        "steps": steps
+    }
@@ -2,92 +2,140 @@
 Paper Agent 节点实现
 包含论文抓取、总结和审查的核心逻辑
 """
-import arxiv
-from core.state import AgentState
+import os
+import re
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from langchain_core.runnables import RunnableConfig
+from core.state import PaperState
+from agents.prereview import is_pass
+from tools.arxiv_fetch import parse_id_list, fetch_papers, format_paper
 from tools.llm_engine import get_llm
+from tools.context_budget import budget_for, fit_text
 
 
-def fetch_arxiv_node(state: AgentState) -> AgentState:
+def _is_arxiv_url(token: str) -> bool:
+    """是否为 arxiv.org 域名下的链接"""
+    host = (urlparse(token).hostname or "").lower()
+    return host == "arxiv.org" or host.endswith(".arxiv.org")
+
+
+def _split_sources(input_query: str) -> Tuple[List[str], List[str]]:
+    """
+    拆分输入：本地文件与非 arXiv 链接视为 PDF 来源，其余按 Arxiv ID 解析
+    
+    Returns:
+        (Arxiv ID 列表, PDF 来源列表)
+    """
+    tokens = [t for t in re.split(r"[\s,;]+", input_query.strip()) if t]
+    pdf_sources = [
+        t for t in tokens
+        if os.path.isfile(t) or (t.startswith(("http://", "https://")) and not _is_arxiv_url(t))
+    ]
+    ids = " ".join(t for t in tokens if t not in pdf_sources)
+    return (parse_id_list(ids) if ids else []), pdf_sources
+
+
+def pdf_sources(input_query: str) -> List[str]:
+    """
+    输入中的 PDF 来源（本地文件与非 arXiv 链接）
+    
+    服务模式默认拒绝这类输入，避免远程调用方读取服务器上的文件或让服务器访问内网地址。
+    
+    Args:
+        input_query: paper 任务的输入
+    
+    Returns:
+        PDF 来源列表
+    """
+    return _split_sources(input_query)[1]
+
+
+def _pdf_paper(source: str) -> Dict[str, Any]:
+    """为直接提供的 PDF 构建论文元数据（标题、摘要等信息来自全文解析）"""
+    name = os.path.basename(source.rstrip("/")) or source
+    return {
+        "id": name,
+        "title": name,
+        "authors": [],
+        "summary": "（未提供摘要，请参考全文要点）",
+        "pdf_url": source,
+        "published": "",
+        "updated": "",
+        "primary_category": "",
+        "categories": [],
+    }
+
+
+def fetch_arxiv_node(state: PaperState) -> PaperState:
     """
     从 Arxiv 抓取论文信息
     
+    input_query 可以包含多个 Arxiv ID（逗号或空白分隔），所有未命中缓存的 ID
+    合并为一次 arxiv.Search(id_list=...) 请求；也可以直接给出本地 PDF 路径或 PDF 链接。
+    
     Args:
-        state: AgentState 状态对象，包含 task_input (Arxiv ID)
+        state: PaperState 状态对象，包含 input_query (Arxiv ID)
     
     Returns:
-        更新后的 AgentState，包含 raw_data（论文的标题、摘要、作者和 PDF 链接）
+        更新后的 PaperState，包含 arxiv_ids、papers 和 raw_data（论文的标题、摘要、作者和 PDF 链接）
     """
-    task_input = state.get("task_input", "").strip()
+    input_query = state.get("input_query", "").strip()
     
-    if not task_input:
-        raise ValueError("task_input 不能为空，请提供有效的 Arxiv ID")
+    if not input_query:
+        raise ValueError("input_query 不能为空，请提供有效的 Arxiv ID")
     
     try:
-        # 搜索论文（支持 Arxiv ID 格式，如 "2301.12345" 或 "arXiv:2301.12345"）
-        arxiv_id = task_input.replace("arXiv:", "").replace("arxiv:", "").strip()
-        
-        # 使用 arxiv 库搜索论文
-        search = arxiv.Search(
-            id_list=[arxiv_id],
-            max_results=1
-        )
+        # 支持 Arxiv ID 格式，如 "2301.12345"、"arXiv:2301.12345v2" 或 abs/pdf 链接
+        arxiv_ids, pdf_sources = _split_sources(input_query)
         
-        paper = next(search.results(), None)
+        papers = (fetch_papers(arxiv_ids) if arxiv_ids else []) + [_pdf_paper(s) for s in pdf_sources]
         
-        if paper is None:
-            raise ValueError(f"未找到 Arxiv ID 为 {arxiv_id} 的论文")
-        
-        # 提取论文信息：title, summary, authors, pdf_url
-        title = paper.title
-        summary = paper.summary
-        authors = [author.name for author in paper.authors]
-        authors_str = ", ".join(authors)
-        pdf_url = paper.pdf_url
+        if not papers:
+            raise ValueError(f"未找到 Arxiv ID 为 {', '.join(arxiv_ids)} 的论文")
         
         # 构建原始数据字符串，包含所有必需信息
-        raw_data = f"""标题: {title}
-
-作者: {authors_str}
-
-摘要:
-{summary}
-
-PDF 链接: {pdf_url}
-"""
+        raw_data = "\n---\n\n".join(format_paper(paper) for paper in papers)
+        titles = "; ".join(f"{paper['title']} (ID: {paper['id']})" for paper in papers)
         
         return {
+            "arxiv_ids": arxiv_ids,
+            "papers": papers,
             "raw_data": raw_data,
-            "steps": [f"步骤: fetch_arxiv - 成功抓取论文: {title} (ID: {arxiv_id})"]
+            "steps": [f"步骤: fetch_arxiv - 成功获取 {len(papers)}/{len(arxiv_ids) + len(pdf_sources)} 篇论文: {titles}"]
         }
-        
-    except arxiv.ArxivError as e:
-        error_msg = f"Arxiv API 错误: {str(e)}"
-        raise RuntimeError(f"步骤: fetch_arxiv - {error_msg}") from e
+    
     except Exception as e:
         error_msg = f"抓取 Arxiv 论文失败: {str(e)}"
         raise RuntimeError(f"步骤: fetch_arxiv - {error_msg}") from e
 
 
-def pyramid_summarize_node(state: AgentState) -> AgentState:
+async def afetch_arxiv_node(state: PaperState) -> PaperState:
     """
-    使用金字塔原理对论文进行总结
+    fetch_arxiv_node 的异步版本：arxiv 库为同步实现，在线程中执行以免阻塞事件循环
     
     Args:
-        state: AgentState 状态对象，包含 raw_data 和可选的 critique
+        state: PaperState 状态对象，包含 input_query (Arxiv ID)
     
     Returns:
-        更新后的 AgentState，包含生成的总结内容
+        更新后的 PaperState
     """
-    raw_data = state.get("raw_data", "")
-    critique = state.get("critique")
-    current_iteration = state.get("iteration", 0)
-    
-    if not raw_data:
-        raise ValueError("raw_data 为空，请先执行 fetch_arxiv_node")
+    return await asyncio.to_thread(fetch_arxiv_node, state)
+
+
+def _build_summarize_messages(raw_data: str, fulltext_notes: str, critique: Optional[str]) -> List[Dict[str, str]]:
+    """
+    构建金字塔原理总结的消息列表
     
-    # 获取 LLM 实例
-    llm = get_llm(temperature=0.7)
+    Args:
+        raw_data: 论文原始信息
+        fulltext_notes: PDF 全文要点（可为空）
+        critique: 上一轮的审查意见
     
+    Returns:
+        LLM 消息列表
+    """
     # 构建 System Prompt：扮演资深视觉算法专家
     system_prompt = """你是一位资深的视觉算法专家，擅长使用"金字塔原理"对学术论文进行结构化总结。
 
@@ -116,8 +164,15 @@ def pyramid_summarize_node(state: AgentState) -> AgentState:
 
 {raw_data}"""
     
+    # 有全文要点时，关键性能指标应以全文中的实验数据为准
+    if fulltext_notes:
+        user_prompt += f"""
+
+全文要点（来自 PDF 正文，“关键性能指标”请以此为准）：
+{fulltext_notes}"""
+    
     # 如果 state['critique'] 中存在反馈，必须在 Prompt 中要求 Agent 根据反馈进行针对性修正
-    if critique and critique.strip().upper() != "PASS":
+    if critique and not is_pass(critique):
         user_prompt += f"""
 
 重要：请根据以下审查意见进行针对性修正：
@@ -125,48 +180,112 @@ def pyramid_summarize_node(state: AgentState) -> AgentState:
 
 请确保在本次生成的总结中显式修正上述问题，避免重复相同的错误。"""
     
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _fit_paper_context(state: PaperState, node: str) -> Tuple[str, str]:
+    """
+    按节点的上下文预算压缩论文原始信息与全文要点
+    
+    原始信息（标题、摘要等）优先；全文要点使用剩余预算，按与原始信息的相关性保留段落。
+    
+    Returns:
+        (raw_data, fulltext_notes)
+    """
+    raw_data, _, used = fit_text(state.get("raw_data", ""), state.get("input_query", ""), node)
+    notes = state.get("fulltext_notes", "")
+    if notes:
+        notes, _, _ = fit_text(notes, raw_data, node, budget=max(0, budget_for(node) - used))
+    return raw_data, notes
+
+
+def _build_summarize_result(response: Any, current_iteration: int) -> Dict[str, Any]:
+    """将 LLM 响应转换为状态更新"""
+    content = response.content if hasattr(response, 'content') else str(response)
+    
+    return {
+        "content": content,
+        "steps": [f"步骤: pyramid_summarize - 已生成金字塔原理总结（迭代: {current_iteration + 1}）"]
+    }
+
+
+def pyramid_summarize_node(state: PaperState, config: Optional[RunnableConfig] = None) -> PaperState:
+    """
+    使用金字塔原理对论文进行总结
+    
+    Args:
+        state: PaperState 状态对象，包含 raw_data 和可选的 critique
+        config: LangGraph 运行配置，透传给 LLM 以支持 token 流式输出
+    
+    Returns:
+        更新后的 PaperState，包含生成的总结内容
+    """
+    raw_data = state.get("raw_data", "")
+    critique = state.get("critique")
+    current_iteration = state.get("iteration", 0)
+    
+    if not raw_data:
+        raise ValueError("raw_data 为空，请先执行 fetch_arxiv_node")
+    
+    # 获取 LLM 实例（如果缺少 API key，使用模拟 LLM）
+    use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+    llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
+    
     try:
         # 调用 LLM 生成总结
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-        
-        response = llm.invoke(messages)
-        content = response.content if hasattr(response, 'content') else str(response)
-        
-        return {
-            "content": content,
-            "steps": [f"步骤: pyramid_summarize - 已生成金字塔原理总结（迭代: {current_iteration + 1}）"]
-        }
-        
+        response = llm.invoke(_build_summarize_messages(*_fit_paper_context(state, "pyramid_summarize"), critique), config=config)
+        return _build_summarize_result(response, current_iteration)
+    
     except Exception as e:
         error_msg = f"生成总结失败: {str(e)}"
         raise RuntimeError(f"步骤: pyramid_summarize - {error_msg}") from e
 
 
-def reflection_critic_node(state: AgentState) -> AgentState:
+async def apyramid_summarize_node(state: PaperState, config: Optional[RunnableConfig] = None) -> PaperState:
     """
-    作为冷酷的学术审稿人，审查生成的摘要
+    pyramid_summarize_node 的异步版本
     
     Args:
-        state: AgentState 状态对象，包含 content（生成的总结）和 raw_data（原始论文信息）
+        state: PaperState 状态对象，包含 raw_data 和可选的 critique
+        config: LangGraph 运行配置，透传给 LLM 以支持 token 流式输出
     
     Returns:
-        更新后的 AgentState，包含 critique（审查意见，如果通过则为 'PASS'）和增加的 iteration
+        更新后的 PaperState，包含生成的总结内容
     """
-    content = state.get("content", "")
     raw_data = state.get("raw_data", "")
-    
-    if not content:
-        raise ValueError("content 为空，请先执行 pyramid_summarize_node")
+    critique = state.get("critique")
+    current_iteration = state.get("iteration", 0)
     
     if not raw_data:
-        raise ValueError("raw_data 为空，无法进行对比审查")
+        raise ValueError("raw_data 为空，请先执行 fetch_arxiv_node")
     
-    # 获取 LLM 实例（使用较低温度以确保严谨性）
-    llm = get_llm(temperature=0.3)
+    use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+    llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
+    
+    try:
+        response = await llm.ainvoke(_build_summarize_messages(*_fit_paper_context(state, "pyramid_summarize"), critique), config=config)
+        return _build_summarize_result(response, current_iteration)
+    
+    except Exception as e:
+        error_msg = f"生成总结失败: {str(e)}"
+        raise RuntimeError(f"步骤: pyramid_summarize - {error_msg}") from e
+
+
+def _build_critic_messages(content: str, raw_data: str, fulltext_notes: str) -> List[Dict[str, str]]:
+    """
+    构建学术审稿的消息列表
+    
+    Args:
+        content: 生成的总结
+        raw_data: 论文原始信息
+        fulltext_notes: PDF 全文要点（可为空）
     
+    Returns:
+        LLM 消息列表
+    """
     # 构建 System Prompt：扮演冷酷的学术审稿人
     system_prompt = """你是一位冷酷的学术审稿人，以严格的标准审查论文摘要。
 
@@ -187,46 +306,110 @@ def reflection_critic_node(state: AgentState) -> AgentState:
 
 请严格对比原始摘要和生成的总结，确保审查的准确性和客观性。"""
     
-    # 构建用户提示：对比 raw_data 中的原始摘要和生成的 content
+    # 构建用户提示：对比 raw_data 中的原始摘要（及全文要点）和生成的 content
+    source = raw_data
+    if fulltext_notes:
+        source += f"""
+
+全文要点（来自 PDF 正文）：
+{fulltext_notes}"""
+    
     user_prompt = f"""请对比以下原始论文摘要和生成的总结，进行严格审查：
 
 原始论文摘要（来自 raw_data）：
-{raw_data}
+{source}
 
 生成的总结（来自 content）：
 {content}
 
 请严格按照审查任务进行检查，对比两者的一致性，并给出审查结果。"""
     
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def _build_critic_result(response: Any) -> Dict[str, Any]:
+    """将 LLM 响应转换为状态更新"""
+    critique = response.content if hasattr(response, 'content') else str(response)
+    
+    # 清理输出；"PASS." 等写法统一为 PASS
+    critique_clean = critique.strip()
+    passed = is_pass(critique_clean)
+    
+    result = {
+        "critique": "PASS" if passed else critique_clean,
+        "steps": [f"步骤: reflection_critic - 审查结果: {'通过' if passed else '需要修改'}"]
+    }
+    
+    # 若不合格，增加 iteration 计数
+    # 由于 iteration 使用 Annotated[int, add]，返回 1 会自动与当前值相加
+    if not passed:
+        result["iteration"] = 1
+    
+    return result
+
+
+def reflection_critic_node(state: PaperState) -> PaperState:
+    """
+    作为冷酷的学术审稿人，审查生成的摘要
+    
+    Args:
+        state: PaperState 状态对象，包含 content（生成的总结）和 raw_data（原始论文信息）
+    
+    Returns:
+        更新后的 PaperState，包含 critique（审查意见，如果通过则为 'PASS'）和增加的 iteration
+    """
+    content = state.get("content", "")
+    raw_data = state.get("raw_data", "")
+    
+    if not content:
+        raise ValueError("content 为空，请先执行 pyramid_summarize_node")
+    
+    if not raw_data:
+        raise ValueError("raw_data 为空，无法进行对比审查")
+    
+    # 获取 LLM 实例（使用较低温度以确保严谨性）
+    use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+    llm = get_llm(temperature=0.3, use_mock=use_mock_llm)
+    
     try:
         # 调用 LLM 进行审查
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-        
-        response = llm.invoke(messages)
-        critique = response.content if hasattr(response, 'content') else str(response)
-        
-        # 清理输出，确保 PASS 是精确匹配
-        critique_clean = critique.strip()
-        
-        # 判断是否通过
-        is_pass = critique_clean.upper() == "PASS"
-        
-        # 若不合格，增加 iteration 计数
-        # 由于 iteration 使用 Annotated[int, add]，返回 1 会自动与当前值相加
-        result = {
-            "critique": critique_clean,
-            "steps": [f"步骤: reflection_critic - 审查结果: {'通过' if is_pass else '需要修改'}"]
-        }
-        
-        # 若不合格，增加 iteration 计数
-        if not is_pass:
-            result["iteration"] = 1
-        
-        return result
-        
+        response = llm.invoke(_build_critic_messages(content, *_fit_paper_context(state, "reflection_critic")))
+        return _build_critic_result(response)
+    
+    except Exception as e:
+        error_msg = f"审查失败: {str(e)}"
+        raise RuntimeError(f"步骤: reflection_critic - {error_msg}") from e
+
+
+async def areflection_critic_node(state: PaperState) -> PaperState:
+    """
+    reflection_critic_node 的异步版本
+    
+    Args:
+        state: PaperState 状态对象，包含 content（生成的总结）和 raw_data（原始论文信息）
+    
+    Returns:
+        更新后的 PaperState，包含 critique 和增加的 iteration
+    """
+    content = state.get("content", "")
+    raw_data = state.get("raw_data", "")
+    
+    if not content:
+        raise ValueError("content 为空，请先执行 pyramid_summarize_node")
+    
+    if not raw_data:
+        raise ValueError("raw_data 为空，无法进行对比审查")
+    
+    use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+    llm = get_llm(temperature=0.3, use_mock=use_mock_llm)
+    
+    try:
+        response = await llm.ainvoke(_build_critic_messages(content, *_fit_paper_context(state, "reflection_critic")))
+        return _build_critic_result(response)
+    
     except Exception as e:
         error_msg = f"审查失败: {str(e)}"
         raise RuntimeError(f"步骤: reflection_critic - {error_msg}") from e
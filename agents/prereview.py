@@ -0,0 +1,155 @@
+"""
+本地预审
+在调用 LLM Reviewer 之前，用确定性规则检查格式约定、来源链接和长度；
+结论确定时直接给出 PASS 或修改意见，省去一次 LLM 调用
+"""
+import os
+import re
+from typing import Iterable, List, Optional
+
+# 主图与 Paper 子图的最大优化轮数，达到后无论审查结果如何都结束循环
+MAX_ITERATIONS = 2
+
+# 是否启用本地预审
+PREREVIEW_ENABLED = os.getenv("PREREVIEW_ENABLED", "true").lower() in ("1", "true", "yes")
+# 格式、来源、长度全部合格时是否直接判定 PASS（跳过 LLM 的事实性审查，默认关闭）
+PREREVIEW_PASS_ON_CLEAN = os.getenv("PREREVIEW_PASS_ON_CLEAN", "false").lower() in ("1", "true", "yes")
+# 内容长度范围（字符数）
+PREREVIEW_MIN_CHARS = int(os.getenv("PREREVIEW_MIN_CHARS", "80"))
+PREREVIEW_MAX_CHARS = int(os.getenv("PREREVIEW_MAX_CHARS", "6000"))
+
+# 简报中每个工具小节必须包含的字段
+BRIEF_FIELDS = ("用途", "亮点", "评价")
+# CV 分析报告必须包含的小节
+CV_SECTIONS = ("技术栈", "落地场景", "技术特点")
+
+_URL_PATTERN = re.compile(r"https?://[^\s<>()\[\]\"'，。；、）]+")
+# 容忍 "PASS."、"**PASS**"、"审查结果：PASS" 等写法，但不接受附带其他意见的回复
+_PASS_PATTERN = re.compile(r"^[\W_]*(?:(?:审查)?结果|结论|verdict)?[\W_]*PASS[\W_]*$", re.IGNORECASE)
+
+
+def is_pass(critique: Optional[str]) -> bool:
+    """
+    审查意见是否表示通过
+    
+    Args:
+        critique: Reviewer 的输出
+    
+    Returns:
+        通过时为 True
+    """
+    return bool(critique) and bool(_PASS_PATTERN.match(critique.strip()))
+
+
+def _normalize_url(url: str) -> str:
+    """去掉锚点、末尾标点与斜杠，便于比对"""
+    url = url.split("#", 1)[0].rstrip(".,;:!?*_`")
+    return url.rstrip("/").lower()
+
+
+def _check_brief(content: str) -> List[str]:
+    """检查简报格式：标题、工具小节及其字段、总结"""
+    problems = []
+    if not re.search(r"^##\s+.*AI 热点简报", content, re.MULTILINE):
+        problems.append("缺少标题「## 🔥 AI 热点简报」，请按输出格式添加")
+    
+    sections = re.split(r"^###\s+", content, flags=re.MULTILINE)[1:]
+    if not sections:
+        problems.append("缺少工具小节，请以「### 工具名称」分节介绍每个工具")
+    for section in sections:
+        name = section.splitlines()[0].strip() if section.strip() else "未命名"
+        missing = [field for field in BRIEF_FIELDS if f"**{field}**" not in section]
+        if missing:
+            problems.append(f"工具「{name}」缺少字段: {'、'.join(missing)}，请补充")
+    
+    if "**总结**" not in content:
+        problems.append("缺少「**总结**」，请用一句话总结今日 AI 行业趋势")
+    return problems
+
+
+def _check_cv(content: str) -> List[str]:
+    """检查 CV 分析报告格式：标题与必需小节"""
+    problems = []
+    if not re.search(r"^##\s+.*CV 项目/趋势分析", content, re.MULTILINE):
+        problems.append("缺少标题「## 🎯 CV 项目/趋势分析」，请按输出格式添加")
+    for section in CV_SECTIONS:
+        if not re.search(rf"^###\s+{section}", content, re.MULTILINE):
+            problems.append(f"缺少小节「### {section}」，请基于搜索结果补充")
+    return problems
+
+
+def _check_sources(content: str, sources: Iterable[str]) -> List[str]:
+    """检查内容中的链接是否都来自搜索结果"""
+    known = {_normalize_url(url) for url in sources if url}
+    if not known:
+        return []
+    ungrounded = []
+    for url in _URL_PATTERN.findall(content):
+        normalized = _normalize_url(url)
+        if normalized not in known and normalized not in ungrounded:
+            ungrounded.append(normalized)
+    if not ungrounded:
+        return []
+    return [f"以下链接不在搜索结果中，可能是编造的来源，请删除或替换为搜索结果中的链接: {', '.join(ungrounded)}"]
+
+
+def _check_length(content: str) -> List[str]:
+    """检查内容长度是否在 PREREVIEW_MIN_CHARS 与 PREREVIEW_MAX_CHARS 之间"""
+    length = len(content.strip())
+    if length < PREREVIEW_MIN_CHARS:
+        return [f"内容过短（{length} 字），请按输出格式补充完整"]
+    if length > PREREVIEW_MAX_CHARS:
+        return [f"内容过长（{length} 字，上限 {PREREVIEW_MAX_CHARS}），请精简到适合社交媒体发布的篇幅"]
+    return []
+
+
+def check_draft(content: str, task_type: str, sources: Iterable[str] = ()) -> List[str]:
+    """
+    按任务类型检查草稿
+    
+    Args:
+        content: 待审查的内容
+        task_type: 任务类型（brief/cv；其他类型只检查长度与来源）
+        sources: 搜索结果中的链接
+    
+    Returns:
+        问题列表，合格时为空
+    """
+    problems = _check_length(content)
+    if task_type == "brief":
+        problems += _check_brief(content)
+    elif task_type == "cv":
+        problems += _check_cv(content)
+    return problems + _check_sources(content, sources)
+
+
+def format_critique(problems: List[str]) -> str:
+    """按 Reviewer 的输出规范拼接修改意见"""
+    lines = ["修改意见："]
+    lines += [f"{i}. {problem}" for i, problem in enumerate(problems, 1)]
+    return "\n".join(lines)
+
+
+def prereview(content: str, task_type: str, sources: Iterable[str] = ()) -> Optional[str]:
+    """
+    本地预审
+    
+    格式、来源或长度不合格时，无论 LLM 如何判断都需要修改，直接返回修改意见；
+    全部合格且开启 PREREVIEW_PASS_ON_CLEAN 时返回 PASS；其余情况返回 None，交给 LLM 审查。
+    
+    Args:
+        content: 待审查的内容
+        task_type: 任务类型
+        sources: 搜索结果中的链接
+    
+    Returns:
+        "PASS"、修改意见，或 None（结论不确定）
+    """
+    if not PREREVIEW_ENABLED:
+        return None
+    problems = check_draft(content, task_type, sources)
+    if problems:
+        return format_critique(problems)
+    if PREREVIEW_PASS_ON_CLEAN and task_type in ("brief", "cv"):
+        return "PASS"
+    return None
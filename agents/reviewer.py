@@ -2,8 +2,123 @@
 通用 Reviewer 节点
 作为严谨的编辑，检查 Agent 输出的内容质量
 """
+import os
+from typing import Any, Dict, List, Optional, Tuple
 from core.state import AgentState
+from agents.prereview import MAX_ITERATIONS, is_pass, prereview
 from tools.llm_engine import get_llm
+from tools.metrics import registry
+from tools.md_sections import split_sections, join_sections, normalize_title
+
+# 审查准则与检查要点对所有任务相同，放在请求开头；任务类型与待审查内容放在最后
+SYSTEM_PROMPT = """你是一位严谨的编辑，负责审查社交媒体内容的质量。
+
+你的审查准则：
+1. **内容专业性**：检查内容是否专业、准确，是否符合行业标准
+2. **AI 幻觉检测**：检查是否存在 AI 幻觉（虚假信息、不实描述、过度夸大）
+3. **配图描述**：检查配图描述是否足够酷、吸引人，是否与内容匹配
+
+输出规范：
+- 如果内容完全合格，请只输出：PASS
+- 如果内容不合格，请输出具体的修改意见，格式如下：
+
+修改意见：
+1. [具体问题1及修改建议]
+2. [具体问题2及修改建议]
+3. [具体问题3及修改建议]
+...
+
+请严格审查，确保内容质量。"""
+
+USER_PROMPT_TEMPLATE = """请严格按照审查准则进行检查，特别关注：
+1. 内容是否专业、准确
+2. 是否存在 AI 幻觉（虚假信息、不实描述）
+3. 配图描述是否足够酷、吸引人
+
+给出审查结果。待审查的是一份{task_context}：
+
+{content}"""
+
+# 各任务类型在用户提示中的描述
+TASK_CONTEXTS = {
+    "brief": "AI 行业热点简报",
+    "cv": "CV 项目/趋势分析报告",
+}
+
+
+def _build_messages(content: str, task_type: str, partial: bool = False) -> List[Dict[str, str]]:
+    """
+    构建审查的消息列表
+    
+    Args:
+        content: 待审查的内容
+        task_type: 任务类型
+        partial: content 是否只包含上一轮修改过的章节
+    
+    Returns:
+        LLM 消息列表
+    """
+    task_context = TASK_CONTEXTS.get(task_type, "生成的内容")
+    if partial:
+        task_context += "中根据上一轮审查意见修改过的章节（其余章节已通过审查，无需复查）"
+    
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT_TEMPLATE.format(task_context=task_context, content=content)}
+    ]
+
+
+def _build_result(response: Any) -> Dict[str, Any]:
+    """将 LLM 响应转换为状态更新"""
+    critique = response.content if hasattr(response, 'content') else str(response)
+    
+    # 清理输出；"PASS." 等写法统一为 PASS，避免多走一轮优化
+    critique_clean = critique.strip()
+    passed = is_pass(critique_clean)
+    
+    return {
+        "critique": "PASS" if passed else critique_clean,
+        "steps": [f"步骤: reviewer - 审查结果: {'通过' if passed else '需要修改'}"]
+    }
+
+
+def _local_result(state: AgentState, content: str, task_type: str) -> Optional[Dict[str, Any]]:
+    """
+    本地预审：结论确定时返回状态更新，否则返回 None
+    
+    已达到最大迭代次数时，无论审查结果如何都会进入可视化，LLM 审查不影响流程，同样跳过。
+    """
+    critique = prereview(content, task_type, state.get("sources") or [])
+    if critique is not None:
+        decision = "pass" if is_pass(critique) else "revise"
+        registry.inc("sma_prereview_total", 1, "本地预审直接给出结论的次数", decision=decision)
+        return {
+            "critique": critique,
+            "steps": [f"步骤: reviewer - 审查结果: {'通过' if decision == 'pass' else '需要修改'}（本地预审）"]
+        }
+    if state.get("iteration", 0) >= MAX_ITERATIONS:
+        registry.inc("sma_prereview_total", 1, "本地预审直接给出结论的次数", decision="final")
+        return {
+            "critique": "",
+            "steps": ["步骤: reviewer - 已达最大迭代次数，跳过 LLM 审查"]
+        }
+    return None
+
+
+def _review_scope(state: AgentState, content: str) -> Tuple[str, bool]:
+    """
+    确定交给 LLM 审查的范围：章节级优化之后只复查修改过的章节
+    
+    Returns:
+        (待审查文本, 是否为部分章节)
+    """
+    changed = {normalize_title(title) for title in state.get("changed_sections") or []}
+    if not changed:
+        return content, False
+    sections = [section for section in split_sections(content) if normalize_title(section[0]) in changed]
+    if not sections:
+        return content, False
+    return join_sections(sections), True
 
 
 def reviewer_node(state: AgentState) -> AgentState:
@@ -22,70 +137,53 @@ def reviewer_node(state: AgentState) -> AgentState:
     if not content:
         raise ValueError("content 为空，请先执行生成节点")
     
+    # 格式、来源、长度问题无需 LLM 即可判定
+    local = _local_result(state, content, task_type)
+    if local is not None:
+        return local
+    
     # 获取 LLM 实例（如果缺少 API key，使用模拟 LLM）
-    import os
     use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
     llm = get_llm(temperature=0.3, use_mock=use_mock_llm)
     
-    # 构建 System Prompt
-    system_prompt = """你是一位严谨的编辑，负责审查社交媒体内容的质量。
-
-你的审查准则：
-1. **内容专业性**：检查内容是否专业、准确，是否符合行业标准
-2. **AI 幻觉检测**：检查是否存在 AI 幻觉（虚假信息、不实描述、过度夸大）
-3. **配图描述**：检查配图描述是否足够酷、吸引人，是否与内容匹配
-
-输出规范：
-- 如果内容完全合格，请只输出：PASS
-- 如果内容不合格，请输出具体的修改意见，格式如下：
+    try:
+        # 调用 LLM 进行审查（章节级优化之后只复查修改过的章节）
+        scope, partial = _review_scope(state, content)
+        response = llm.invoke(_build_messages(scope, task_type, partial))
+        return _build_result(response)
+        
+    except Exception as e:
+        error_msg = f"审查失败: {str(e)}"
+        raise RuntimeError(f"步骤: reviewer - {error_msg}") from e
 
-修改意见：
-1. [具体问题1及修改建议]
-2. [具体问题2及修改建议]
-3. [具体问题3及修改建议]
-...
 
-请严格审查，确保内容质量。"""
+async def areviewer_node(state: AgentState) -> AgentState:
+    """
+    reviewer_node 的异步版本
+    
+    Args:
+        state: AgentState 状态对象，包含 content（生成的内容）
     
-    # 根据任务类型构建不同的用户提示
-    if task_type == "brief":
-        task_context = "这是一份 AI 行业热点简报"
-    elif task_type == "cv":
-        task_context = "这是一份 CV 项目/趋势分析报告"
-    else:
-        task_context = "这是一份生成的内容"
+    Returns:
+        更新后的 AgentState，包含 critique（审查意见，如果通过则为 'PASS'）
+    """
+    content = state.get("content", "")
+    task_type = state.get("task_type", "").lower()
     
-    user_prompt = f"""请审查以下{task_context}：
-
-{content}
-
-请严格按照审查准则进行检查，特别关注：
-1. 内容是否专业、准确
-2. 是否存在 AI 幻觉（虚假信息、不实描述）
-3. 配图描述是否足够酷、吸引人
-
-给出审查结果。"""
+    if not content:
+        raise ValueError("content 为空，请先执行生成节点")
+    
+    local = _local_result(state, content, task_type)
+    if local is not None:
+        return local
+    
+    use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+    llm = get_llm(temperature=0.3, use_mock=use_mock_llm)
     
     try:
-        # 调用 LLM 进行审查
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-        
-        response = llm.invoke(messages)
-        critique = response.content if hasattr(response, 'content') else str(response)
-        
-        # 清理输出，确保 PASS 是精确匹配
-        critique_clean = critique.strip()
-        
-        # 判断是否通过
-        is_pass = critique_clean.upper() == "PASS"
-        
-        return {
-            "critique": critique_clean,
-            "steps": [f"步骤: reviewer - 审查结果: {'通过' if is_pass else '需要修改'}"]
-        }
+        scope, partial = _review_scope(state, content)
+        response = await llm.ainvoke(_build_messages(scope, task_type, partial))
+        return _build_result(response)
         
     except Exception as e:
         error_msg = f"审查失败: {str(e)}"
@@ -0,0 +1,4 @@
+"""
+流水线基准测试
+使用可配置延迟的本地替身（DeepSeek / Tavily / fal.ai）离线运行编译后的工作流图
+"""
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+基准测试命令行入口
+
+示例:
+    python -m benchmarks --tasks brief,cv --requests 40 --concurrency 1,8,32 \
+        --llm-latency 800 --search-latency 300 --image-latency 1500
+"""
+import sys
+import json
+import argparse
+from typing import Any, Dict, List
+
+from benchmarks.pipeline import run_benchmark, compare_with_baseline
+
+
+def _int_list(value: str) -> List[int]:
+    """解析逗号分隔的整数列表"""
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """
+    打印基准测试报告
+
+    Args:
+        report: run_benchmark() 返回的报告
+    """
+    config = report["config"]
+    print(
+        f"📊 任务: {','.join(config['tasks'])} | 请求数: {config['requests']} | "
+        f"模拟延迟 LLM/搜索/图片: {config['llm_latency'] * 1000:.0f}/"
+        f"{config['search_latency'] * 1000:.0f}/{config['image_latency'] * 1000:.0f} ms | "
+        f"配图推测执行: {'开' if config['speculative_image'] else '关'} | "
+        f"缓存: {'开' if config['use_cache'] else '关'} | "
+        f"请求合并: {'开' if config.get('singleflight', config['use_cache']) else '关'}"
+    )
+    print("-" * 78)
+    print(f"{'并发':>6} {'p50(ms)':>10} {'p95(ms)':>10} {'p99(ms)':>10} {'吞吐(任务/秒)':>14} {'失败':>6}")
+    for level in report["levels"]:
+        print(
+            f"{level['concurrency']:>6} {level['p50_ms']:>10} {level['p95_ms']:>10} "
+            f"{level['p99_ms']:>10} {level['throughput_rps']:>14} {level['errors']:>6}"
+        )
+    print("-" * 78)
+    for level in report["levels"]:
+        breakdown = ", ".join(f"{node}={ms}" for node, ms in level["node_mean_ms"].items())
+        print(f"并发 {level['concurrency']} 节点平均耗时(ms): {breakdown}")
+        for error in level["error_samples"]:
+            print(f"  ❌ {error}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="Social Media Assistant 流水线基准测试（离线，使用本地替身）"
+    )
+    parser.add_argument("--tasks", type=str, default="brief,cv", help="任务类型，逗号分隔（brief/cv/paper）")
+    parser.add_argument("--requests", type=int, default=20, help="每个并发度下的请求总数")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16], help="并发度列表，逗号分隔")
+    parser.add_argument("--llm-latency", type=float, default=500, help="模拟 DeepSeek 延迟（毫秒）")
+    parser.add_argument("--search-latency", type=float, default=300, help="模拟 Tavily 延迟（毫秒）")
+    parser.add_argument("--image-latency", type=float, default=1000, help="模拟 fal.ai 延迟（毫秒）")
+    parser.add_argument("--speculative-image", action="store_true", help="启用配图推测执行")
+    parser.add_argument("--no-cache", action="store_true", help="关闭工具层缓存与请求合并，每次调用都付出完整延迟")
+    parser.add_argument("--json", type=str, help="将报告写入 JSON 文件")
+    parser.add_argument("--baseline", type=str, help="基线报告（JSON），用于检测性能退化")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="相对基线的容忍度，默认 0.2")
+
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        tasks=[t.strip() for t in args.tasks.split(",") if t.strip()],
+        requests=args.requests,
+        concurrency_levels=args.concurrency,
+        llm_latency=args.llm_latency / 1000,
+        search_latency=args.search_latency / 1000,
+        image_latency=args.image_latency / 1000,
+        speculative_image=args.speculative_image,
+        use_cache=not args.no_cache,
+    )
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📝 报告已写入: {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("\n⚠️  检测到性能退化:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\n✅ 未检测到性能退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+流水线基准测试核心逻辑
+统计端到端延迟分位数、不同并发下的吞吐，以及各节点耗时占比
+"""
+import os
+import time
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import tools.llm_engine as llm_engine
+import tools.search as search
+import tools.image_gen as image_gen
+import tools.arxiv_fetch as arxiv_fetch
+from core.graph import create_graph
+from core.state import initialize_state
+
+# 各任务类型的默认查询
+DEFAULT_QUERIES: Dict[str, str] = {
+    "brief": "AI agents",
+    "cv": "object detection",
+    "paper": "2301.12345",
+}
+
+
+def configure_backends(
+    llm_latency: float,
+    search_latency: float,
+    image_latency: float,
+    use_cache: bool = True
+) -> None:
+    """
+    切换到本地替身：移除 API key，使各工具走模拟分支，并设置模拟延迟
+
+    Args:
+        llm_latency: 每次 LLM 调用的延迟（秒）
+        search_latency: 每次搜索（含 arXiv 元数据抓取）的延迟（秒）
+        image_latency: 每次图片生成的延迟（秒）
+        use_cache: 是否保留工具层缓存与请求合并（single-flight）；关闭时每次调用都付出完整的模拟延迟。
+            工作负载对同一任务类型使用相同查询，不关闭请求合并时，并发下相同的 LLM / 配图调用只执行一次
+    """
+    for var in ("DEEPSEEK_API_KEY", "TAVILY_API_KEY", "FAL_KEY"):
+        os.environ.pop(var, None)
+    llm_engine.MOCK_LLM_LATENCY = llm_latency
+    search.MOCK_SEARCH_LATENCY = search_latency
+    image_gen.MOCK_IMAGE_LATENCY = image_latency
+    image_gen.IMAGE_CACHE_ENABLED = use_cache
+    llm_engine.LLM_SINGLEFLIGHT = use_cache
+    search._in_flight.enabled = use_cache
+    image_gen._in_flight.enabled = use_cache
+    arxiv_fetch.ARXIV_OFFLINE = True
+    arxiv_fetch.MOCK_ARXIV_LATENCY = search_latency
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    计算分位数（最近秩法）
+
+    Args:
+        values: 数值列表
+        p: 分位点（0~1）
+
+    Returns:
+        分位数，空列表返回 0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+
+async def run_pipeline(graph: Any, task_type: str, input_query: str) -> Dict[str, Any]:
+    """
+    运行一次流水线，记录端到端延迟和各节点耗时
+
+    节点耗时取自各节点写入 state["metrics"] 的实测值；包含子图耗时的合计记录不重复计入。
+
+    Args:
+        graph: 编译后的工作流图
+        task_type: 任务类型
+        input_query: 输入查询
+
+    Returns:
+        包含 latency、nodes、error 的结果字典
+    """
+    node_times: Dict[str, float] = defaultdict(float)
+    start = time.perf_counter()
+    error = None
+    try:
+        async for update in graph.astream(initialize_state(task_type, input_query), stream_mode="updates"):
+            for node_update in update.values():
+                for entry in (node_update or {}).get("metrics", []):
+                    if entry.get("total"):
+                        continue
+                    node_times[entry["node"]] += entry["seconds"]
+    except Exception as e:
+        error = str(e)
+    return {
+        "task_type": task_type,
+        "latency": time.perf_counter() - start,
+        "nodes": dict(node_times),
+        "error": error,
+    }
+
+
+async def run_level(
+    graph: Any,
+    workload: List[Tuple[str, str]],
+    concurrency: int
+) -> Dict[str, Any]:
+    """
+    在指定并发度下运行一组流水线
+
+    Args:
+        graph: 编译后的工作流图
+        workload: (task_type, input_query) 列表
+        concurrency: 最大并发数
+
+    Returns:
+        该并发度下的统计结果
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(task_type: str, input_query: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_pipeline(graph, task_type, input_query)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(t, q) for t, q in workload))
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r["error"] is None]
+    latencies = [r["latency"] * 1000 for r in ok]
+    node_totals: Dict[str, float] = defaultdict(float)
+    for r in ok:
+        for node, seconds in r["nodes"].items():
+            node_totals[node] += seconds * 1000
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_samples": sorted({r["error"] for r in results if r["error"]})[:3],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "node_mean_ms": {
+            node: round(total / len(ok), 1) for node, total in sorted(node_totals.items())
+        } if ok else {},
+    }
+
+
+def run_benchmark(
+    tasks: List[str],
+    requests: int,
+    concurrency_levels: List[int],
+    llm_latency: float = 0.0,
+    search_latency: float = 0.0,
+    image_latency: float = 0.0,
+    speculative_image: bool = False,
+    use_cache: bool = True,
+    queries: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    运行完整基准测试
+
+    Args:
+        tasks: 参与测试的任务类型
+        requests: 每个并发度下的请求总数（在任务类型间轮转）
+        concurrency_levels: 并发度列表
+        llm_latency: 模拟 LLM 延迟（秒）
+        search_latency: 模拟搜索延迟（秒）
+        image_latency: 模拟图片生成延迟（秒）
+        speculative_image: 是否启用配图推测执行
+        use_cache: 是否保留工具层缓存与请求合并
+        queries: 各任务类型的查询，默认使用 DEFAULT_QUERIES
+
+    Returns:
+        包含配置与各并发度统计的报告
+    """
+    configure_backends(llm_latency, search_latency, image_latency, use_cache)
+    graph = create_graph(speculative_image=speculative_image)
+    queries = {**DEFAULT_QUERIES, **(queries or {})}
+    workload = [(tasks[i % len(tasks)], queries[tasks[i % len(tasks)]]) for i in range(requests)]
+
+    levels = [asyncio.run(run_level(graph, workload, c)) for c in concurrency_levels]
+    return {
+        "config": {
+            "tasks": tasks,
+            "requests": requests,
+            "llm_latency": llm_latency,
+            "search_latency": search_latency,
+            "image_latency": image_latency,
+            "speculative_image": speculative_image,
+            "use_cache": use_cache,
+            "singleflight": use_cache,
+        },
+        "levels": levels,
+    }
+
+
+def compare_with_baseline(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float
+) -> List[str]:
+    """
+    与基线报告对比，找出 p95 延迟或吞吐退化超过容忍度的并发度
+
+    Args:
+        report: 本次报告
+        baseline: 基线报告
+        tolerance: 容忍度（如 0.2 表示 20%）
+
+    Returns:
+        退化描述列表，为空表示无退化
+    """
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    regressions = []
+    for level in report["levels"]:
+        base = baseline_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        if base["p95_ms"] > 0 and level["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"并发 {level['concurrency']}: p95 {base['p95_ms']} ms -> {level['p95_ms']} ms"
+            )
+        if base["throughput_rps"] > 0 and level["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"并发 {level['concurrency']}: 吞吐 {base['throughput_rps']} -> {level['throughput_rps']} 任务/秒"
+            )
+    return regressions
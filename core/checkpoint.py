@@ -0,0 +1,65 @@
+"""
+工作流检查点
+每个节点完成后将状态写入本地 SQLite，运行中断（如 fal.ai 故障）后可按运行 ID 从最后一个成功的节点继续，
+无需重新执行上游已付费的 LLM 调用。检查点按需开启（命令行 --checkpoint / --run-id），普通运行不写入
+"""
+import os
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+from langgraph.checkpoint.sqlite import SqliteSaver
+from tools.cache import default_cache_path
+
+# 检查点 SQLite 文件（仅在按需开启检查点的运行中写入）；设为空字符串时完全关闭检查点
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", default_cache_path("checkpoints.sqlite"))
+
+_lock = threading.Lock()
+_checkpointers: Dict[str, SqliteSaver] = {}
+
+
+def checkpoint_enabled() -> bool:
+    """是否启用检查点"""
+    return bool(CHECKPOINT_PATH)
+
+
+def get_checkpointer(path: Optional[str] = None) -> SqliteSaver:
+    """
+    获取 SQLite 检查点存储（按路径在进程内复用）
+    
+    Args:
+        path: SQLite 文件路径，默认 CHECKPOINT_PATH
+    
+    Returns:
+        SqliteSaver 实例
+    """
+    path = path or CHECKPOINT_PATH
+    with _lock:
+        saver = _checkpointers.get(path)
+        if saver is None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 节点可能在线程池中执行，连接需允许跨线程使用（SqliteSaver 内部加锁）
+            conn = sqlite3.connect(path, check_same_thread=False)
+            saver = SqliteSaver(conn)
+            _checkpointers[path] = saver
+        return saver
+
+
+def new_run_id() -> str:
+    """生成运行 ID"""
+    return uuid.uuid4().hex[:12]
+
+
+def run_config(run_id: str) -> Dict[str, Any]:
+    """
+    构建带运行 ID 的 LangGraph 配置（运行 ID 即 LangGraph 的 thread_id）
+    
+    Args:
+        run_id: 运行 ID
+    
+    Returns:
+        可传给 graph.invoke / graph.stream 的 config
+    """
+    return {"configurable": {"thread_id": run_id}}
@@ -1,15 +1,70 @@
 """
 工作流图编排
 实现 generate -> review -> [condition] -> refine -> visualize 的闭环
-隔离 paper_agent，防止程序崩溃
+paper 任务走 Paper Agent 子图（fetch -> summarize -> critic 循环）后进入 visualize
 """
-from typing import Literal
+import os
+import copy
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Literal, Optional, Tuple
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, END
-from core.state import AgentState
-from agents.brief_agent import brief_generate_node
-from agents.cv_expert import cv_generate_node
-from agents.reviewer import reviewer_node
-from tools.image_gen import generate_image
+from core.state import AgentState, initialize_state
+from agents.brief_agent import brief_generate_node, abrief_generate_node
+from agents.cv_expert import cv_generate_node, acv_generate_node
+from agents.reviewer import reviewer_node, areviewer_node
+from agents.prereview import MAX_ITERATIONS, is_pass
+from agents.paper_agent.graph import paper_node, apaper_node, PAPER_STREAMING_NODES
+from tools.image_gen import generate_image, agenerate_image, prefetch_image
+from tools.llm_engine import get_llm
+from tools.metrics import instrument_node, ainstrument_node, registry
+from tools.md_sections import Section, split_sections, join_sections, parse_items, locate_items, splice_sections
+from tools.cache import hash_key
+from tools.singleflight import SingleFlight
+from tools import startup
+
+if TYPE_CHECKING:
+    from langgraph.checkpoint.base import BaseCheckpointSaver
+
+# 合并相同的进行中流水线：并发提交的相同 (task_type, input_query) 只运行一次
+PIPELINE_SINGLEFLIGHT = os.getenv("PIPELINE_SINGLEFLIGHT", "1").lower() in ("1", "true", "yes")
+_pipelines = SingleFlight()
+
+# 优化模式：full 整篇重写；diff 只重写审查意见提及的章节并拼回原文，Reviewer 随后只复查这些章节
+REFINE_MODE = os.getenv("REFINE_MODE", "full").lower()
+
+# 优化提示词：固定的说明在前，原文与审查意见在后，使同类请求共享相同的前缀
+REFINE_SYSTEM_PROMPT = """你是一位专业的内容优化专家，擅长根据审查意见优化内容。
+
+你的任务：
+1. 仔细阅读原始内容和审查意见
+2. 根据审查意见进行针对性修正
+3. 确保修正后的内容专业、准确、无 AI 幻觉
+4. 保持内容的吸引力和可读性"""
+
+REFINE_USER_TEMPLATE = """请根据审查意见优化下面的原始内容，确保修正后的内容完全符合审查意见的要求。
+
+原始内容：
+{content}
+
+审查意见：
+{critique}"""
+
+SECTION_REFINE_SYSTEM_PROMPT = """你是一位专业的内容优化专家，擅长根据审查意见优化内容。
+
+你的任务：
+1. 下面给出的是一篇文案中被审查意见指出问题的若干章节
+2. 只根据对应的审查意见修改这些章节，确保修正后的内容专业、准确、无 AI 幻觉
+3. 按原顺序输出修改后的章节，每个章节以原标题行开头，保留章节内与问题无关的内容
+4. 不要输出其他章节，也不要添加额外的说明"""
+
+SECTION_REFINE_USER_PREFIX = "请根据审查意见修改以下章节：\n\n"
+
+# 推测执行配图：配图提示词只依赖 task_type，可与文案生成/审查并行
+SPECULATIVE_IMAGE = os.getenv("SPECULATIVE_IMAGE", "").lower() in ("1", "true", "yes")
+
+# 输出面向用户文案的节点；stream_mode="messages" 时调用方可按 metadata["langgraph_node"] 过滤
+STREAMING_NODES = ("generate", "refine") + PAPER_STREAMING_NODES
 
 
 def route_task(state: AgentState) -> AgentState:
@@ -33,12 +88,13 @@ def route_task(state: AgentState) -> AgentState:
     }
 
 
-def generate_node(state: AgentState) -> AgentState:
+def generate_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
     """
-    生成节点：根据 task_type 调用不同的 Agent 生成内容
+    生成节点：根据 task_type 调用不同的 Agent 生成内容（brief/cv；paper 任务由 paper 节点运行子图）
     
     Args:
         state: AgentState 状态对象
+        config: LangGraph 运行配置，透传给 LLM 以支持 token 流式输出
     
     Returns:
         更新后的 AgentState，包含生成的内容
@@ -46,25 +102,142 @@ def generate_node(state: AgentState) -> AgentState:
     task_type = state.get("task_type", "").lower()
     
     if task_type == "brief":
-        return brief_generate_node(state)
+        return brief_generate_node(state, config)
     elif task_type == "cv":
-        return cv_generate_node(state)
-    elif task_type == "paper":
-        # 隔离 paper_agent，暂时返回错误提示
-        return {
-            "content": "Paper Agent 暂未启用，请使用 brief 或 cv 任务类型",
-            "steps": ["步骤: generate - Paper Agent 暂未启用"]
-        }
+        return cv_generate_node(state, config)
     else:
         raise ValueError(f"不支持的任务类型: {task_type}")
 
 
-def refine_node(state: AgentState) -> AgentState:
+async def agenerate_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    generate_node 的异步版本
+    
+    Args:
+        state: AgentState 状态对象
+        config: LangGraph 运行配置，透传给 LLM 以支持 token 流式输出
+    
+    Returns:
+        更新后的 AgentState，包含生成的内容
+    """
+    task_type = state.get("task_type", "").lower()
+    
+    if task_type == "brief":
+        return await abrief_generate_node(state, config)
+    elif task_type == "cv":
+        return await acv_generate_node(state, config)
+    else:
+        raise ValueError(f"不支持的任务类型: {task_type}")
+
+
+def _build_refine_messages(content: str, critique: str) -> List[Dict[str, str]]:
+    """
+    构建内容优化的消息列表
+    
+    Args:
+        content: 原始内容
+        critique: 审查意见
+    
+    Returns:
+        LLM 消息列表
+    """
+    return [
+        {"role": "system", "content": REFINE_SYSTEM_PROMPT},
+        {"role": "user", "content": REFINE_USER_TEMPLATE.format(content=content, critique=critique)}
+    ]
+
+
+def _build_refine_result(response: Any, task_type: str) -> Dict[str, Any]:
+    """将 LLM 响应转换为状态更新"""
+    refined_content = response.content if hasattr(response, 'content') else str(response)
+    
+    registry.inc("sma_refine_total", 1, "优化次数（mode=diff 为章节级优化）", mode="full")
+    
+    # 由于 iteration 使用 Annotated[int, add]，返回 1 会自动与当前值相加
+    return {
+        "content": refined_content,
+        "changed_sections": [],
+        "iteration": 1,
+        "steps": [f"步骤: refine - 已根据审查意见优化内容（任务类型: {task_type}）"]
+    }
+
+
+def _plan_section_refine(content: str, critique: str) -> Optional[Tuple[List[Section], Dict[int, List[str]]]]:
+    """
+    diff 模式：将编号的审查意见定位到章节
+    
+    Returns:
+        (章节列表, 章节下标 -> 相关意见)；未开启、意见无法全部定位或涉及所有章节时返回 None，整篇重写
+    """
+    if REFINE_MODE != "diff":
+        return None
+    items = parse_items(critique)
+    if not items:
+        return None
+    sections = split_sections(content)
+    located = locate_items(items, sections)
+    if not located or len(located) >= sum(1 for title, _ in sections if title):
+        return None
+    return sections, located
+
+
+def _build_section_refine_messages(sections: List[Section], located: Dict[int, List[str]]) -> List[Dict[str, str]]:
+    """
+    构建章节级优化的消息列表：只发送被指出问题的章节及对应意见
+    
+    Args:
+        sections: 原文章节
+        located: 章节下标 -> 相关意见
+    
+    Returns:
+        LLM 消息列表
+    """
+    blocks = []
+    for i in sorted(located):
+        notes = "\n".join(f"- {item}" for item in located[i])
+        blocks.append(f"""章节：
+{sections[i][1].strip()}
+
+审查意见：
+{notes}""")
+    
+    return [
+        {"role": "system", "content": SECTION_REFINE_SYSTEM_PROMPT},
+        {"role": "user", "content": SECTION_REFINE_USER_PREFIX + "\n\n---\n\n".join(blocks)}
+    ]
+
+
+def _build_section_refine_result(
+    response: Any,
+    task_type: str,
+    sections: List[Section],
+    located: Dict[int, List[str]]
+) -> Optional[Dict[str, Any]]:
+    """将重写后的章节拼回原文；输出无法与章节对应时返回 None"""
+    rewritten = response.content if hasattr(response, 'content') else str(response)
+    targets = sorted(located)
+    spliced = splice_sections(sections, targets, rewritten)
+    if spliced is None:
+        registry.inc("sma_refine_total", 1, "优化次数（mode=diff 为章节级优化）", mode="diff_fallback")
+        return None
+    
+    registry.inc("sma_refine_total", 1, "优化次数（mode=diff 为章节级优化）", mode="diff")
+    changed = [spliced[i][0] for i in targets]
+    return {
+        "content": join_sections(spliced),
+        "changed_sections": changed,
+        "iteration": 1,
+        "steps": [f"步骤: refine - 已根据审查意见优化 {len(changed)}/{len(sections)} 个章节（任务类型: {task_type}）"]
+    }
+
+
+def refine_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
     """
     优化节点：根据审查意见优化内容
     
     Args:
         state: AgentState 状态对象，包含 content 和 critique
+        config: LangGraph 运行配置，透传给 LLM 以支持 token 流式输出
     
     Returns:
         更新后的 AgentState，包含优化后的内容
@@ -73,60 +246,119 @@ def refine_node(state: AgentState) -> AgentState:
     critique = state.get("critique", "")
     task_type = state.get("task_type", "").lower()
     
-    if not critique or critique.strip().upper() == "PASS":
+    if not critique or is_pass(critique):
         # 如果没有审查意见或已通过，直接返回
         return {
             "steps": ["步骤: refine - 无需优化"]
         }
     
     # 获取 LLM 实例（如果缺少 API key，使用模拟 LLM）
-    import os
-    from tools.llm_engine import get_llm
     use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
     llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
     
-    # 构建 System Prompt
-    system_prompt = """你是一位专业的内容优化专家，擅长根据审查意见优化内容。
-
-你的任务：
-1. 仔细阅读原始内容和审查意见
-2. 根据审查意见进行针对性修正
-3. 确保修正后的内容专业、准确、无 AI 幻觉
-4. 保持内容的吸引力和可读性"""
-    
-    # 构建用户提示
-    user_prompt = f"""请根据以下审查意见优化内容：
-
-原始内容：
-{content}
-
-审查意见：
-{critique}
-
-请确保修正后的内容完全符合审查意见的要求。"""
-    
     try:
-        # 调用 LLM 优化内容
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        # diff 模式下只重写被指出问题的章节；输出无法拼回原文时退回整篇重写
+        plan = _plan_section_refine(content, critique)
+        if plan is not None:
+            response = llm.invoke(_build_section_refine_messages(*plan), config=config)
+            result = _build_section_refine_result(response, task_type, *plan)
+            if result is not None:
+                return result
         
-        response = llm.invoke(messages)
-        refined_content = response.content if hasattr(response, 'content') else str(response)
+        # 调用 LLM 优化内容
+        response = llm.invoke(_build_refine_messages(content, critique), config=config)
+        return _build_refine_result(response, task_type)
         
-        # 由于 iteration 使用 Annotated[int, add]，返回 1 会自动与当前值相加
+    except Exception as e:
+        error_msg = f"优化内容失败: {str(e)}"
+        raise RuntimeError(f"步骤: refine - {error_msg}") from e
+
+
+async def arefine_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    refine_node 的异步版本
+    
+    Args:
+        state: AgentState 状态对象，包含 content 和 critique
+        config: LangGraph 运行配置，透传给 LLM 以支持 token 流式输出
+    
+    Returns:
+        更新后的 AgentState，包含优化后的内容
+    """
+    content = state.get("content", "")
+    critique = state.get("critique", "")
+    task_type = state.get("task_type", "").lower()
+    
+    if not critique or is_pass(critique):
         return {
-            "content": refined_content,
-            "iteration": 1,
-            "steps": [f"步骤: refine - 已根据审查意见优化内容（任务类型: {task_type}）"]
+            "steps": ["步骤: refine - 无需优化"]
         }
+    
+    use_mock_llm = not bool(os.getenv("DEEPSEEK_API_KEY"))
+    llm = get_llm(temperature=0.7, use_mock=use_mock_llm)
+    
+    try:
+        plan = _plan_section_refine(content, critique)
+        if plan is not None:
+            response = await llm.ainvoke(_build_section_refine_messages(*plan), config=config)
+            result = _build_section_refine_result(response, task_type, *plan)
+            if result is not None:
+                return result
+        
+        response = await llm.ainvoke(_build_refine_messages(content, critique), config=config)
+        return _build_refine_result(response, task_type)
         
     except Exception as e:
         error_msg = f"优化内容失败: {str(e)}"
         raise RuntimeError(f"步骤: refine - {error_msg}") from e
 
 
+def build_image_prompt(task_type: str) -> str:
+    """
+    构建图片生成提示词
+    
+    Args:
+        task_type: 任务类型
+    
+    Returns:
+        科技感配图描述
+    """
+    image_prompt = f"Create a modern, tech-savvy, professional illustration for {task_type} content. "
+    image_prompt += "Style: futuristic, clean, minimalist, with vibrant colors. "
+    image_prompt += "Theme: technology, innovation, digital transformation. "
+    image_prompt += "Aspect ratio: 4:3, high quality, professional design."
+    return image_prompt
+
+
+def prefetch_image_node(state: AgentState) -> AgentState:
+    """
+    预生成配图节点：与 generate 并行的分支，在后台提交配图任务后立即返回
+    
+    visualize 阶段调用参数相同的 generate_image 时会等待并复用该结果，
+    因此配图耗时与 generate/review/refine 循环重叠，而不是串行地排在最后。
+    
+    Args:
+        state: AgentState 状态对象
+    
+    Returns:
+        更新后的 AgentState（添加步骤日志）
+    """
+    task_type = state.get("task_type", "").lower()
+    
+    # 如果缺少 FAL_KEY，使用模拟图片（仅用于测试）
+    use_mock_image = not bool(os.getenv("FAL_KEY"))
+    prefetch_image(
+        prompt=build_image_prompt(task_type),
+        model="fal-ai/flux/schnell",
+        aspect_ratio="4:3",
+        use_mock=use_mock_image
+    )
+    
+    return {
+        "steps": [f"步骤: prefetch_image - 已提交配图预生成（任务类型: {task_type}）"]
+    }
+
+
 def visualize_node(state: AgentState) -> AgentState:
     """
     可视化节点：根据内容生成配图
@@ -144,18 +376,48 @@ def visualize_node(state: AgentState) -> AgentState:
         raise ValueError("content 为空，无法生成配图")
     
     try:
-        # 构建图片生成提示词
-        # 从内容中提取关键信息，生成科技感配图描述
-        image_prompt = f"Create a modern, tech-savvy, professional illustration for {task_type} content. "
-        image_prompt += "Style: futuristic, clean, minimalist, with vibrant colors. "
-        image_prompt += "Theme: technology, innovation, digital transformation. "
-        image_prompt += "Aspect ratio: 4:3, high quality, professional design."
-        
-        # 调用图片生成工具
+        # 调用图片生成工具（如果缺少 FAL_KEY，使用模拟图片）
+        use_mock_image = not bool(os.getenv("FAL_KEY"))
         image_url = generate_image(
-            prompt=image_prompt,
+            prompt=build_image_prompt(task_type),
             model="fal-ai/flux/schnell",
-            aspect_ratio="4:3"
+            aspect_ratio="4:3",
+            use_mock=use_mock_image
+        )
+        
+        return {
+            "image_url": image_url,
+            "steps": [f"步骤: visualize - 已生成配图（任务类型: {task_type}）"]
+        }
+        
+    except Exception as e:
+        error_msg = f"生成配图失败: {str(e)}"
+        raise RuntimeError(f"步骤: visualize - {error_msg}") from e
+
+
+async def avisualize_node(state: AgentState) -> AgentState:
+    """
+    visualize_node 的异步版本
+    
+    Args:
+        state: AgentState 状态对象，包含 content
+    
+    Returns:
+        更新后的 AgentState，包含生成的图片 URL
+    """
+    content = state.get("content", "")
+    task_type = state.get("task_type", "").lower()
+    
+    if not content:
+        raise ValueError("content 为空，无法生成配图")
+    
+    try:
+        use_mock_image = not bool(os.getenv("FAL_KEY"))
+        image_url = await agenerate_image(
+            prompt=build_image_prompt(task_type),
+            model="fal-ai/flux/schnell",
+            aspect_ratio="4:3",
+            use_mock=use_mock_image
         )
         
         return {
@@ -181,32 +443,68 @@ def should_continue(state: AgentState) -> Literal["refine", "visualize"]:
     critique = state.get("critique", "")
     iteration = state.get("iteration", 0)
     
-    # 如果审查结果为 'PASS'（精确匹配）或 iteration >= 2，进入可视化
-    if critique and critique.strip() == "PASS":
+    # 如果审查结果为 'PASS'（容忍 "PASS." 等写法）或 iteration >= 2，进入可视化
+    if is_pass(critique):
         return "visualize"
-    elif iteration >= 2:
+    elif iteration >= MAX_ITERATIONS:
         return "visualize"
     else:
         # 否则继续优化
         return "refine"
 
 
-def create_graph() -> StateGraph:
+def _node(name: str, func: Callable, afunc: Optional[Callable] = None) -> RunnableLambda:
+    """
+    组合同步与异步实现：graph.invoke 调用 func，graph.ainvoke 调用 afunc
+    
+    两种实现都会经过指标包装，节点耗时与节点内的外部调用记录写入 state["metrics"]。
+    
+    Args:
+        name: 节点名
+        func: 同步节点函数
+        afunc: 异步节点函数，缺省时异步运行也使用 func
+    
+    Returns:
+        同时支持两种调用方式的节点
+    """
+    return RunnableLambda(
+        instrument_node(name, func),
+        afunc=ainstrument_node(name, afunc) if afunc is not None else None,
+        name=func.__name__
+    )
+
+
+def create_graph(
+    speculative_image: Optional[bool] = None,
+    checkpointer: Optional["BaseCheckpointSaver"] = None
+) -> StateGraph:
     """
     创建并配置工作流图
     
+    编译后的图既可以用 graph.invoke 同步运行，也可以用 graph.ainvoke 在事件循环中运行；
+    异步运行时各节点使用异步的 LLM/搜索/图片客户端，单个事件循环可并发驱动多条流水线。
+    
+    Args:
+        speculative_image: 是否在 route 之后并行预生成配图，默认读取 SPECULATIVE_IMAGE 环境变量
+        checkpointer: 检查点存储（如 core.checkpoint.get_checkpointer()）；提供时每个节点完成后
+            按 config["configurable"]["thread_id"] 保存状态，失败后以 graph.invoke(None, config) 从中断处继续
+    
     Returns:
         配置好的 StateGraph 实例
     """
+    if speculative_image is None:
+        speculative_image = SPECULATIVE_IMAGE
+    
     # 创建状态图
     workflow = StateGraph(AgentState)
     
     # 添加节点
-    workflow.add_node("route", route_task)
-    workflow.add_node("generate", generate_node)
-    workflow.add_node("review", reviewer_node)
-    workflow.add_node("refine", refine_node)
-    workflow.add_node("visualize", visualize_node)
+    workflow.add_node("route", _node("route", route_task))
+    workflow.add_node("generate", _node("generate", generate_node, agenerate_node))
+    workflow.add_node("review", _node("review", reviewer_node, areviewer_node))
+    workflow.add_node("refine", _node("refine", refine_node, arefine_node))
+    workflow.add_node("visualize", _node("visualize", visualize_node, avisualize_node))
+    workflow.add_node("paper", _node("paper", paper_node, apaper_node))
     
     # 设置入口点
     workflow.set_entry_point("route")
@@ -218,10 +516,13 @@ def create_graph() -> StateGraph:
         {
             "brief": "generate",
             "cv": "generate",
-            "paper": "generate",  # 虽然暂未启用，但保持路由完整性
+            "paper": "paper",
         }
     )
     
+    # Paper Agent 子图内已完成审稿循环，直接进入可视化
+    workflow.add_edge("paper", "visualize")
+    
     # 工作流：generate -> review -> [condition] -> refine -> visualize
     workflow.add_edge("generate", "review")
     workflow.add_conditional_edges(
@@ -235,8 +536,80 @@ def create_graph() -> StateGraph:
     workflow.add_edge("refine", "review")  # 优化后重新审查
     workflow.add_edge("visualize", END)
     
-    return workflow.compile()
+    # 推测执行：route 之后并行提交配图任务，visualize 时汇合
+    if speculative_image:
+        workflow.add_node("prefetch_image", _node("prefetch_image", prefetch_image_node))
+        workflow.add_edge("route", "prefetch_image")
+        workflow.add_edge("prefetch_image", END)
+    
+    compiled = workflow.compile(checkpointer=checkpointer)
+    startup.mark("图编译完成")
+    return compiled
 
 
-# 导出编译好的图
-graph = create_graph()
+@lru_cache(maxsize=None)
+def get_graph() -> StateGraph:
+    """
+    获取默认配置的编译图：首次调用时编译，之后在进程内复用
+    
+    Returns:
+        编译后的图
+    """
+    return create_graph()
+
+
+def __getattr__(name: str) -> Any:
+    """兼容 from core.graph import graph：首次访问时才编译，导入本模块不再触发编译"""
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _pipeline_key(initial_state: AgentState) -> str:
+    """
+    流水线合并键：task_type 忽略大小写，input_query 忽略首尾空白，子话题按 initialize_state 清理后的列表比较；
+    查询内容区分大小写（最终状态中的 input_query 会原样返回给所有合并的调用方）
+    """
+    return hash_key({
+        "task_type": initial_state["task_type"].lower(),
+        "input_query": initial_state["input_query"].strip(),
+        "sub_topics": initial_state["sub_topics"],
+    })
+
+
+def run_pipeline(task_type: str, input_query: str, sub_topics: Optional[List[str]] = None) -> AgentState:
+    """
+    同步运行一条流水线；并发的相同请求共享同一次执行的结果
+    
+    Args:
+        task_type: 任务类型 (brief/cv/paper)
+        input_query: 输入查询字符串
+        sub_topics: brief 多话题模式的子话题列表
+    
+    Returns:
+        最终状态（每个调用方拿到独立的副本）
+    """
+    initial_state = initialize_state(task_type, input_query, sub_topics)
+    if not PIPELINE_SINGLEFLIGHT:
+        return get_graph().invoke(initial_state)
+    result = _pipelines.do(_pipeline_key(initial_state), get_graph().invoke, initial_state)
+    return copy.deepcopy(result)
+
+
+async def arun_pipeline(task_type: str, input_query: str, sub_topics: Optional[List[str]] = None) -> AgentState:
+    """
+    run_pipeline 的异步版本
+    
+    Args:
+        task_type: 任务类型 (brief/cv/paper)
+        input_query: 输入查询字符串
+        sub_topics: brief 多话题模式的子话题列表
+    
+    Returns:
+        最终状态（每个调用方拿到独立的副本）
+    """
+    initial_state = initialize_state(task_type, input_query, sub_topics)
+    if not PIPELINE_SINGLEFLIGHT:
+        return await get_graph().ainvoke(initial_state)
+    result = await _pipelines.ado(_pipeline_key(initial_state), get_graph().ainvoke, initial_state)
+    return copy.deepcopy(result)
@@ -0,0 +1,334 @@
+"""
+HTTP 服务模式
+常驻进程只导入依赖、编译工作流图一次；任务通过 HTTP 提交，进入有界队列，由异步 worker 池执行
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from core.graph import arun_pipeline, get_graph
+from agents.paper_agent.nodes import pdf_sources
+from core.state import initialize_state
+from tools.metrics import registry, summarize_metrics
+
+# worker 数量（同时运行的流水线数）与等待队列长度；队列满时新任务返回 429
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "4"))
+SERVE_QUEUE_SIZE = int(os.getenv("SERVE_QUEUE_SIZE", "64"))
+# 已完成任务的结果保留时长（秒）与最多保留的任务数
+SERVE_RESULT_TTL = float(os.getenv("SERVE_RESULT_TTL", "3600"))
+SERVE_MAX_JOBS = int(os.getenv("SERVE_MAX_JOBS", "10000"))
+# 队列满时建议客户端的重试间隔（秒）
+SERVE_RETRY_AFTER = int(os.getenv("SERVE_RETRY_AFTER", "5"))
+
+_FINISHED = ("ok", "error")
+
+
+class QueueFullError(RuntimeError):
+    """等待队列已满"""
+
+
+class JobService:
+    """
+    任务队列与 worker 池
+    
+    事件循环运行在后台线程中，HTTP 处理线程通过 run_coroutine_threadsafe 提交任务；
+    任务记录保存在内存中，完成后保留 result_ttl 秒。
+    paper 任务默认只接受 Arxiv ID；allow_pdf_sources 为 True 时才接受本地 PDF 路径与非 arXiv 链接。
+    """
+    
+    def __init__(
+        self,
+        workers: int = SERVE_WORKERS,
+        queue_size: int = SERVE_QUEUE_SIZE,
+        result_ttl: float = SERVE_RESULT_TTL,
+        max_jobs: int = SERVE_MAX_JOBS,
+        allow_pdf_sources: bool = False
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.result_ttl = result_ttl
+        self.max_jobs = max_jobs
+        self.allow_pdf_sources = allow_pdf_sources
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> None:
+        """在后台线程中启动事件循环与 worker"""
+        self._thread = threading.Thread(target=self._run_loop, name="job-workers", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+    
+    def _run_loop(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        for i in range(self.workers):
+            self._loop.create_task(self._worker(i))
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+    
+    def stop(self) -> None:
+        """停止事件循环（进行中的任务被丢弃）"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+    
+    async def _worker(self, index: int) -> None:
+        """从队列取任务并运行流水线，失败时记录错误而不退出"""
+        while True:
+            job_id = await self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job.update(status="running", started_at=time.time())
+            self._report()
+            if job is None:
+                self._queue.task_done()
+                continue
+            try:
+                final_state = await arun_pipeline(job["type"], job["input"], job.get("topics"))
+                update = {
+                    "status": "ok",
+                    "result": {
+                        "content": final_state.get("content", ""),
+                        "image_url": final_state.get("image_url", ""),
+                        "iteration": final_state.get("iteration", 0),
+                        "steps": final_state.get("steps", []),
+                        "metrics": summarize_metrics(final_state.get("metrics", [])),
+                    },
+                }
+            except Exception as e:
+                update = {"status": "error", "error": str(e)}
+            with self._lock:
+                job.update(update, finished_at=time.time())
+            registry.inc("sma_jobs_total", 1, "服务模式完成的任务数", type=job["type"], status=update["status"])
+            self._queue.task_done()
+            self._report()
+    
+    def _report(self) -> None:
+        registry.set("sma_job_queue_depth", self._queue.qsize(), "等待执行的任务数")
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job["status"] == "running")
+        registry.set("sma_jobs_running", running, "正在执行的任务数")
+    
+    async def _enqueue(self, job_id: str) -> None:
+        self._queue.put_nowait(job_id)
+        self._report()
+    
+    def _evict(self) -> None:
+        """清理过期的已完成任务；超过 max_jobs 时从最早的已完成任务开始清理"""
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] in _FINISHED and now - job["finished_at"] > self.result_ttl:
+                del self._jobs[job_id]
+        for job_id, job in list(self._jobs.items()):
+            if len(self._jobs) < self.max_jobs:
+                break
+            if job["status"] in _FINISHED:
+                del self._jobs[job_id]
+    
+    def submit(self, task_type: str, input_query: str, sub_topics: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        提交任务
+        
+        Args:
+            task_type: 任务类型 (brief/cv/paper)
+            input_query: 输入查询字符串
+            sub_topics: 子话题列表（仅 brief 任务）
+        
+        Returns:
+            任务记录
+        
+        Raises:
+            ValueError: 任务类型无效、输入为空，或 paper 任务包含未允许的 PDF 来源
+            QueueFullError: 等待队列已满
+        """
+        state = initialize_state(task_type, input_query, sub_topics)
+        if not input_query.strip():
+            if not state["sub_topics"]:
+                raise ValueError("input 不能为空")
+            # 与命令行一致：只给出子话题时以子话题列表作为整体查询
+            input_query = ", ".join(state["sub_topics"])
+        if task_type == "paper" and not self.allow_pdf_sources:
+            rejected = pdf_sources(input_query)
+            if rejected:
+                raise ValueError(
+                    f"服务模式只接受 Arxiv ID 或 arxiv.org 链接，不接受本地文件或其他链接: {', '.join(rejected)}"
+                    "（如需开放，请以 --allow-pdf-sources 启动服务）"
+                )
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "type": task_type.lower(),
+            "input": input_query,
+            "status": "queued",
+            "created_at": time.time(),
+        }
+        if state["sub_topics"]:
+            job["topics"] = state["sub_topics"]
+        with self._lock:
+            self._evict()
+            self._jobs[job_id] = job
+        try:
+            asyncio.run_coroutine_threadsafe(self._enqueue(job_id), self._loop).result()
+        except asyncio.QueueFull:
+            with self._lock:
+                del self._jobs[job_id]
+            registry.inc("sma_jobs_rejected_total", 1, "队列已满被拒绝的任务数")
+            raise QueueFullError(f"任务队列已满（{self.queue_size}），请稍后重试")
+        return self.get(job_id)
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务记录的副本，不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+    
+    def stats(self) -> Dict[str, Any]:
+        """队列与 worker 状态"""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": counts,
+        }
+
+
+def _job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """任务状态（不含结果正文）"""
+    return {k: v for k, v in job.items() if k != "result"}
+
+
+def make_handler(service: JobService) -> type:
+    """
+    构建绑定到 service 的请求处理类
+    
+    路由：
+        POST /jobs               提交任务 {"type": ..., "input": ..., "topics": [...]}（topics 可选，仅 brief），
+                                 返回 202 与任务 ID；队列满时返回 429
+        GET  /jobs/<id>          任务状态
+        GET  /jobs/<id>/result   任务结果；未完成时返回 202，失败时返回 500
+        GET  /healthz            队列与 worker 状态
+        GET  /metrics            Prometheus 指标
+    """
+    
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def _route(self) -> Tuple[str, ...]:
+            return tuple(part for part in self.path.split("?", 1)[0].split("/") if part)
+        
+        def do_POST(self):
+            if self._route() != ("jobs",):
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("请求体必须是 JSON 对象")
+                topics = payload.get("topics") or []
+                if not isinstance(topics, list):
+                    raise ValueError("topics 必须是字符串数组")
+                job = service.submit(
+                    str(payload.get("type", "")),
+                    str(payload.get("input", "")),
+                    [str(topic) for topic in topics]
+                )
+            except QueueFullError as e:
+                self._send_json(429, {"error": str(e)}, {"Retry-After": str(SERVE_RETRY_AFTER)})
+                return
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_json(202, _job_status(job), {"Location": f"/jobs/{job['id']}"})
+        
+        def do_GET(self):
+            route = self._route()
+            if route == ("healthz",):
+                self._send_json(200, service.stats())
+                return
+            if route == ("metrics",):
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if len(route) not in (2, 3) or route[0] != "jobs" or (len(route) == 3 and route[2] != "result"):
+                self._send_json(404, {"error": "not found"})
+                return
+            job = service.get(route[1])
+            if job is None:
+                self._send_json(404, {"error": f"任务不存在或已过期: {route[1]}"})
+                return
+            if len(route) == 2:
+                self._send_json(200, _job_status(job))
+            elif job["status"] == "ok":
+                self._send_json(200, job["result"])
+            elif job["status"] == "error":
+                self._send_json(500, {"error": job["error"]})
+            else:
+                self._send_json(202, _job_status(job), {"Retry-After": "1"})
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return Handler
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    workers: int = SERVE_WORKERS,
+    queue_size: int = SERVE_QUEUE_SIZE,
+    allow_pdf_sources: bool = False
+) -> None:
+    """
+    启动 HTTP 服务并阻塞运行，Ctrl+C 退出
+    
+    服务没有鉴权，默认只监听本机；监听其他地址时应置于带鉴权的反向代理之后。
+    
+    Args:
+        host: 监听地址
+        port: 监听端口
+        workers: worker 数量
+        queue_size: 等待队列长度
+        allow_pdf_sources: 是否允许 paper 任务使用本地 PDF 路径与非 arXiv 链接
+    """
+    # 启动时编译图，首个任务无需承担编译耗时
+    get_graph()
+    service = JobService(workers=workers, queue_size=queue_size, allow_pdf_sources=allow_pdf_sources)
+    service.start()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"🌐 服务已启动: http://{host}:{port}（worker: {service.workers}，队列: {service.queue_size}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
@@ -1,4 +1,4 @@
-from typing import TypedDict, List, Annotated
+from typing import TypedDict, List, Dict, Any, Annotated, Optional
 from operator import add
 
 
@@ -6,8 +6,64 @@ class AgentState(TypedDict):
     """Agent 状态定义 - 使用 langgraph 的 TypedDict"""
     task_type: str  # 任务类型: brief/cv/paper
     input_query: str  # 输入查询字符串
+    sub_topics: List[str]  # brief 多话题模式的子话题，为空时按 input_query 单次搜索
     content: str  # 生成的文案
     image_url: str  # 生成的图片链接
     critique: str  # 存储 Reviewer 的修改意见
+    sources: List[str]  # 搜索结果中的链接，供本地预审核对内容引用的来源
+    changed_sections: List[str]  # 章节级优化修改过的章节标题，Reviewer 只复查这些章节；为空时审查全文
     iteration: Annotated[int, add]  # 迭代次数，使用 operator.add 记录
     steps: Annotated[List[str], add]  # 记录每一步的日志，使用 operator.add 记录
+    metrics: Annotated[List[Dict[str, Any]], add]  # 每个节点的耗时、token 用量和外部调用记录
+
+
+class PaperState(TypedDict):
+    """Paper Agent 子图状态定义"""
+    input_query: str  # 输入查询字符串（一个或多个 Arxiv ID 或 PDF 路径/链接）
+    arxiv_ids: List[str]  # 解析出的 Arxiv ID 列表
+    papers: List[Dict[str, Any]]  # 论文元数据（标题、作者、摘要、PDF 链接等）
+    raw_data: str  # 供 LLM 阅读的论文原始信息
+    fulltext_notes: str  # PDF 全文的 map-reduce 要点，未解析全文时为空
+    content: str  # 生成的金字塔原理总结
+    critique: str  # 审稿意见，通过时为 'PASS'
+    iteration: Annotated[int, add]  # 迭代次数
+    steps: Annotated[List[str], add]  # 步骤日志
+    metrics: Annotated[List[Dict[str, Any]], add]  # 子图各节点的指标
+
+
+def initialize_state(
+    task_type: str,
+    input_query: str,
+    sub_topics: Optional[List[str]] = None
+) -> AgentState:
+    """
+    初始化 AgentState
+    
+    Args:
+        task_type: 任务类型 (brief/cv/paper)
+        input_query: 输入查询字符串
+        sub_topics: brief 多话题模式的子话题列表
+    
+    Returns:
+        初始化后的 AgentState
+    """
+    if task_type not in ["brief", "cv", "paper"]:
+        raise ValueError(f"无效的任务类型: {task_type}。必须是 brief、cv 或 paper")
+    
+    sub_topics = [topic.strip() for topic in sub_topics or [] if topic.strip()]
+    if sub_topics and task_type != "brief":
+        raise ValueError("子话题仅适用于 brief 任务")
+    
+    return AgentState(
+        task_type=task_type,
+        input_query=input_query,
+        sub_topics=sub_topics,
+        content="",
+        image_url="",
+        critique="",
+        sources=[],
+        changed_sections=[],
+        iteration=0,
+        steps=[],
+        metrics=[]
+    )
@@ -0,0 +1,406 @@
+"""
+本地 arXiv 元数据索引
+基于 SQLite（FTS5 全文检索），可从 arXiv 元数据快照批量导入，支持按 ID 查找和关键词搜索。
+Paper Agent 抓取论文前先查询本索引，命中时无需访问 arXiv API。
+
+导入示例:
+    python -m data.arxiv_index load arxiv-metadata-oai-snapshot.json
+    python -m data.arxiv_index get 2301.12345
+    python -m data.arxiv_index search "object detection transformer"
+"""
+import os
+import re
+import gzip
+import json
+import sqlite3
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 索引文件默认路径
+ARXIV_INDEX_PATH = os.getenv(
+    "ARXIV_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "arxiv_index.sqlite")
+)
+
+# 批量导入时每次提交的条目数
+LOAD_BATCH_SIZE = 5000
+
+# 新式 ID（2301.12345v2）与旧式 ID（hep-th/9901001v1、math.GT/0309136）
+_ID_PATTERN = re.compile(
+    r"(?P<base>\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?:v(?P<version>\d+))?"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    published TEXT NOT NULL,
+    updated TEXT NOT NULL
+)
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+    title, summary, content='papers', content_rowid='rowid'
+)
+"""
+
+_index: Optional["ArxivIndex"] = None
+_index_lock = threading.Lock()
+
+
+def parse_arxiv_id(text: str) -> Tuple[str, Optional[int]]:
+    """
+    解析 arXiv ID，兼容 "arXiv:" 前缀和 abs/pdf 链接
+
+    Args:
+        text: 原始 ID 文本，如 "arXiv:2301.12345v2" 或 "https://arxiv.org/abs/2301.12345"
+
+    Returns:
+        (不带版本号的 ID, 版本号或 None)
+
+    Raises:
+        ValueError: 无法识别为 arXiv ID
+    """
+    match = _ID_PATTERN.search(text.strip())
+    if match is None:
+        raise ValueError(f"无法识别的 Arxiv ID: {text}")
+    version = match.group("version")
+    return match.group("base"), int(version) if version else None
+
+
+def _clean(text: str) -> str:
+    """合并快照中因换行产生的多余空白"""
+    return " ".join((text or "").split())
+
+
+def _open(path: str):
+    """按扩展名打开（可能经过 gzip 压缩的）快照文件"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_json_snapshot(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐行解析 arXiv JSON 元数据快照（Kaggle arxiv-metadata-oai-snapshot 格式，每行一个 JSON）
+
+    Args:
+        path: 快照文件路径（支持 .gz）
+
+    Yields:
+        规范化后的论文记录
+    """
+    with _open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            versions = record.get("versions") or []
+            if record.get("authors_parsed"):
+                authors = [
+                    " ".join(part for part in (author[1], author[0]) if part).strip()
+                    for author in record["authors_parsed"]
+                ]
+            else:
+                authors = [a.strip() for a in re.split(r",| and ", record.get("authors", "")) if a.strip()]
+            yield {
+                "id": record["id"],
+                "version": len(versions) or 1,
+                "title": _clean(record.get("title", "")),
+                "authors": authors,
+                "summary": _clean(record.get("abstract", "")),
+                "categories": (record.get("categories") or "").split(),
+                "published": versions[0].get("created", "") if versions else "",
+                "updated": record.get("update_date", ""),
+            }
+
+
+def iter_oai_snapshot(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    流式解析 OAI-PMH 导出的 XML（metadataPrefix=arXiv），逐条释放已解析的元素以控制内存
+
+    Args:
+        path: XML 文件路径（支持 .gz）
+
+    Yields:
+        规范化后的论文记录（OAI 格式不含版本信息，版本号记为 1）
+    """
+    def local(tag: str) -> str:
+        return tag.rsplit("}", 1)[-1]
+
+    with _open(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if local(elem.tag) != "arXiv":
+                continue
+            fields = {local(child.tag): (child.text or "") for child in elem}
+            authors = []
+            for author in elem.iter():
+                if local(author.tag) != "author":
+                    continue
+                parts = {local(p.tag): (p.text or "").strip() for p in author}
+                authors.append(" ".join(p for p in (parts.get("forenames"), parts.get("keyname")) if p))
+            text = fields.get
+            yield {
+                "id": text("id", "").strip(),
+                "version": 1,
+                "title": _clean(text("title", "")),
+                "authors": authors,
+                "summary": _clean(text("abstract", "")),
+                "categories": text("categories", "").split(),
+                "published": text("created", "").strip(),
+                "updated": text("updated", "").strip() or text("created", "").strip(),
+            }
+            elem.clear()
+
+
+class ArxivIndex:
+    """
+    arXiv 元数据的本地 SQLite 索引
+
+    每篇论文保存最新版本的元数据；按 ID 查找走主键，关键词搜索走 FTS5（不可用时退化为 LIKE）。
+    连接在线程间共享，读写通过锁串行化。
+    """
+
+    def __init__(self, path: str = ARXIV_INDEX_PATH):
+        """
+        Args:
+            path: 索引文件路径，不存在时自动创建
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(_SCHEMA)
+        try:
+            self._db.execute(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # 部分 Python 发行版的 SQLite 未编译 FTS5
+            self.has_fts = False
+        self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
+
+    def load(self, records: Iterable[Dict[str, Any]], batch_size: int = LOAD_BATCH_SIZE) -> int:
+        """
+        批量导入论文记录；已存在的 ID 仅在版本不低于现有版本时覆盖
+
+        Args:
+            records: iter_json_snapshot / iter_oai_snapshot 产出的记录
+            batch_size: 每次提交的条目数
+
+        Returns:
+            导入的条目数
+        """
+        count = 0
+        batch: List[Tuple[Any, ...]] = []
+        for record in records:
+            batch.append((
+                record["id"],
+                record["version"],
+                record["title"],
+                json.dumps(record["authors"], ensure_ascii=False),
+                record["summary"],
+                " ".join(record["categories"]),
+                record["published"],
+                record["updated"],
+            ))
+            if len(batch) >= batch_size:
+                count += self._write(batch)
+                batch = []
+        if batch:
+            count += self._write(batch)
+        if self.has_fts:
+            with self._lock:
+                self._db.execute("INSERT INTO papers_fts(papers_fts) VALUES ('rebuild')")
+                self._db.commit()
+        return count
+
+    def _write(self, rows: List[Tuple[Any, ...]]) -> int:
+        """写入一批记录"""
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO papers (id, version, title, authors, summary, categories, published, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET "
+                "version = excluded.version, title = excluded.title, authors = excluded.authors, "
+                "summary = excluded.summary, categories = excluded.categories, "
+                "published = excluded.published, updated = excluded.updated "
+                "WHERE excluded.version >= papers.version",
+                rows
+            )
+            self._db.commit()
+        return len(rows)
+
+    @staticmethod
+    def _row_to_paper(row: Tuple[Any, ...]) -> Dict[str, Any]:
+        """将数据库行转换为与 tools.arxiv_fetch 相同格式的论文元数据"""
+        base, version, title, authors, summary, categories, published, updated = row
+        categories = categories.split()
+        return {
+            "id": f"{base}v{version}",
+            "title": title,
+            "authors": json.loads(authors),
+            "summary": summary,
+            "pdf_url": f"https://arxiv.org/pdf/{base}v{version}",
+            "published": published,
+            "updated": updated,
+            "primary_category": categories[0] if categories else "",
+            "categories": categories,
+        }
+
+    def get_many(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        按 ID 批量查找
+
+        不带版本号的 ID 返回索引中的最新版本；带版本号的 ID 仅在与索引版本一致时命中，
+        旧版本或索引尚未收录的新版本视为未命中，由调用方回退到 arXiv API。
+
+        Args:
+            ids: arXiv ID 列表（可带版本号）
+
+        Returns:
+            请求 ID -> 论文元数据；未命中的 ID 不出现在结果中
+        """
+        wanted = {arxiv_id: parse_arxiv_id(arxiv_id) for arxiv_id in ids}
+        bases = sorted({base for base, _ in wanted.values()})
+        if not bases:
+            return {}
+        placeholders = ",".join("?" * len(bases))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, version, title, authors, summary, categories, published, updated "
+                f"FROM papers WHERE id IN ({placeholders})",
+                bases
+            ).fetchall()
+        by_base = {row[0]: row for row in rows}
+
+        found = {}
+        for arxiv_id, (base, version) in wanted.items():
+            row = by_base.get(base)
+            if row is None or (version is not None and version != row[1]):
+                continue
+            found[arxiv_id] = self._row_to_paper(row)
+        return found
+
+    def get(self, arxiv_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按 ID 查找单篇论文
+
+        Args:
+            arxiv_id: arXiv ID（可带版本号）
+
+        Returns:
+            论文元数据，未命中时返回 None
+        """
+        return self.get_many([arxiv_id]).get(arxiv_id)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        按关键词搜索标题和摘要
+
+        Args:
+            query: 关键词（空白分隔，全部命中才返回）
+            limit: 最大返回数量
+
+        Returns:
+            论文元数据列表，FTS5 可用时按 BM25 相关度排序
+        """
+        terms = [t for t in re.findall(r"\w+", query) if t]
+        if not terms:
+            return []
+        columns = "p.id, p.version, p.title, p.authors, p.summary, p.categories, p.published, p.updated"
+        with self._lock:
+            if self.has_fts:
+                match = " AND ".join(f'"{t}"' for t in terms)
+                rows = self._db.execute(
+                    f"SELECT {columns} FROM papers_fts JOIN papers p ON p.rowid = papers_fts.rowid "
+                    "WHERE papers_fts MATCH ? ORDER BY bm25(papers_fts) LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+            else:
+                where = " AND ".join("(p.title LIKE ? OR p.summary LIKE ?)" for _ in terms)
+                params: List[Any] = []
+                for t in terms:
+                    params += [f"%{t}%", f"%{t}%"]
+                rows = self._db.execute(
+                    f"SELECT {columns} FROM papers p WHERE {where} LIMIT ?",
+                    params + [limit]
+                ).fetchall()
+        return [self._row_to_paper(row) for row in rows]
+
+
+def get_arxiv_index(path: Optional[str] = None) -> Optional[ArxivIndex]:
+    """
+    获取进程内共享的本地索引（惰性打开）
+
+    Args:
+        path: 索引文件路径，默认使用 ARXIV_INDEX_PATH
+
+    Returns:
+        ArxivIndex 实例；索引文件不存在时返回 None（不会自动创建空索引）
+    """
+    global _index
+    path = path or ARXIV_INDEX_PATH
+    with _index_lock:
+        if _index is not None and _index.path == path:
+            return _index
+        if not os.path.exists(path):
+            return None
+        _index = ArxivIndex(path)
+        return _index
+
+
+def main():
+    """命令行入口：导入快照、按 ID 查找或关键词搜索"""
+    parser = argparse.ArgumentParser(description="本地 arXiv 元数据索引")
+    parser.add_argument("--index", type=str, default=ARXIV_INDEX_PATH, help="索引文件路径")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    load_parser = subparsers.add_parser("load", help="从元数据快照导入（JSON Lines 或 OAI-PMH XML，支持 .gz）")
+    load_parser.add_argument("snapshot", type=str, help="快照文件路径")
+
+    get_parser = subparsers.add_parser("get", help="按 ID 查找")
+    get_parser.add_argument("ids", nargs="+", help="arXiv ID")
+
+    search_parser = subparsers.add_parser("search", help="关键词搜索")
+    search_parser.add_argument("query", type=str, help="关键词")
+    search_parser.add_argument("--limit", type=int, default=10, help="最大返回数量")
+
+    args = parser.parse_args()
+    index = ArxivIndex(args.index)
+
+    if args.command == "load":
+        snapshot = args.snapshot
+        is_xml = snapshot.endswith(".xml") or snapshot.endswith(".xml.gz")
+        records = iter_oai_snapshot(snapshot) if is_xml else iter_json_snapshot(snapshot)
+        count = index.load(records)
+        print(f"✅ 已导入 {count} 条记录，索引共 {len(index)} 篇论文: {args.index}")
+    elif args.command == "get":
+        for arxiv_id, paper in index.get_many(args.ids).items():
+            print(json.dumps(paper, ensure_ascii=False, indent=2))
+    else:
+        for paper in index.search(args.query, limit=args.limit):
+            print(f"{paper['id']}\t{paper['title']}")
+
+
+if __name__ == "__main__":
+    main()
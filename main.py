@@ -3,73 +3,491 @@
 Social Media Assistant 主入口脚本
 支持通过命令行参数启动不同类型的任务
 """
+import sys
+import time
+
+# --profile-startup 需在导入其他模块之前开启，才能统计 main.py 自身的顶层导入；
+# tools.startup 所在的 tools 包（含 .env 加载）在开启前导入，其耗时单独补记
+_import_start = time.perf_counter()
+from tools import startup
+if "--profile-startup" in sys.argv[1:]:
+    startup.enable(since=_import_start)
+    startup.record_import("tools", time.perf_counter() - _import_start)
+
+import os
+import re
+import json
+import asyncio
 import argparse
-from core.graph import graph
-from core.state import AgentState
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from core.state import AgentState, initialize_state
+from tools.metrics import summarize_metrics, write_metrics, start_metrics_server
 
+# langgraph 与各 SDK 较重，工作流相关模块在用到时才导入（--help、参数错误等无需加载）
+if TYPE_CHECKING:
+    from langgraph.graph.state import CompiledStateGraph
 
-def initialize_state(
-    task_type: str,
-    input_query: str
+
+def stream_run(
+    initial_state: Optional[AgentState],
+    app: Optional["CompiledStateGraph"] = None,
+    config: Optional[Dict[str, Any]] = None
 ) -> AgentState:
     """
-    初始化 AgentState
+    以流式方式运行工作流，增量打印 token 和步骤事件
+    
+    ChatOpenAI 的 token 来自 "messages" 流，MockLLM 与缓存命中来自 "custom" 流，
+    仅打印 STREAMING_NODES（generate/refine 及 paper 子图的 summarize）输出的文案；
+    步骤日志来自 "updates" 流。以 subgraphs=True 运行，子图节点的 token 与步骤随执行实时输出。
+    
+    Args:
+        initial_state: 初始状态；从检查点恢复时为 None
+        app: 编译后的工作流图，默认为 core.graph.get_graph()
+        config: LangGraph 运行配置（带检查点时包含运行 ID）
+    
+    Returns:
+        最终状态
+    """
+    from core.graph import get_graph, STREAMING_NODES
+    from tools.llm_engine import is_nostream
+    
+    app = app or get_graph()
+    final_state = initial_state or {}
+    current_node = None
+    # 已实时打印过步骤的子图所在节点；该节点在主图中的更新汇总了子图步骤，不再重复打印
+    subgraph_nodes = set()
+    
+    for namespace, mode, chunk in app.stream(
+        initial_state,
+        config,
+        stream_mode=["messages", "custom", "updates", "values"],
+        subgraphs=True
+    ):
+        if mode == "messages":
+            message, metadata = chunk
+            # 带 nostream 标签的调用（如多话题简报的子话题草稿）只是中间结果，不打印
+            if is_nostream(metadata.get("tags")):
+                continue
+            node = metadata.get("langgraph_node", "")
+            text = message.content if isinstance(message.content, str) else ""
+        elif mode == "custom":
+            if not isinstance(chunk, dict) or chunk.get("type") != "token":
+                continue
+            node = chunk.get("node", "")
+            text = chunk.get("content", "")
+        elif mode == "updates":
+            if namespace:
+                # 命名空间形如 ("paper:<task_id>",)
+                subgraph_nodes.add(namespace[0].split(":", 1)[0])
+            for node, update in chunk.items():
+                if not namespace and node in subgraph_nodes:
+                    continue
+                for step in (update or {}).get("steps", []):
+                    print(f"\n  ▶ {step}", flush=True)
+            current_node = None
+            continue
+        else:
+            if not namespace:
+                final_state = chunk
+            continue
+        
+        if node not in STREAMING_NODES or not text:
+            continue
+        if node != current_node:
+            print(f"\n✍️  [{node}]", flush=True)
+            current_node = node
+        print(text, end="", flush=True)
+    
+    return final_state
+
+
+def parse_topics(value: str) -> List[str]:
+    """解析 --topics 参数：按中英文逗号或分号分隔，忽略空项"""
+    return [topic.strip() for topic in re.split(r"[,，;；]", value) if topic.strip()]
+
+
+def load_batch(path: str) -> List[Dict[str, Any]]:
+    """
+    读取批量任务文件（JSONL，每行一个 {"type": ..., "input": ...}，brief 任务可附加 "topics": [...]）
+    
+    Args:
+        path: 批量任务文件路径
+    
+    Returns:
+        任务记录列表；无法解析的行以 {"error": ...} 形式保留，便于在结果中报告
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("每行必须是 JSON 对象")
+            except ValueError as e:
+                record = {"error": f"第 {line_no} 行解析失败: {str(e)}"}
+            records.append(record)
+    return records
+
+
+async def run_batch_item(
+    index: int,
+    record: Dict[str, Any],
+    semaphore: asyncio.Semaphore
+) -> Dict[str, Any]:
+    """
+    运行单个批量任务，失败时返回错误信息而不抛出异常
+    
+    Args:
+        index: 任务序号
+        record: 任务记录
+        semaphore: 并发限制信号量
+    
+    Returns:
+        结果记录（包含状态、耗时和生成内容）
+    """
+    from core.graph import arun_pipeline
+    
+    result = {
+        "index": index,
+        "type": record.get("type"),
+        "input": record.get("input"),
+    }
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            if "error" in record:
+                raise ValueError(record["error"])
+            topics = record.get("topics") or []
+            if isinstance(topics, str):
+                topics = parse_topics(topics)
+            # 同一批次中并发的相同任务只运行一次
+            final_state = await arun_pipeline(
+                task_type=str(record.get("type", "")),
+                input_query=str(record.get("input", "")),
+                sub_topics=[str(topic) for topic in topics]
+            )
+            result.update({
+                "status": "ok",
+                "content": final_state.get("content", ""),
+                "image_url": final_state.get("image_url", ""),
+                "iteration": final_state.get("iteration", 0),
+                "steps": final_state.get("steps", []),
+                "metrics": summarize_metrics(final_state.get("metrics", [])),
+            })
+        except Exception as e:
+            result.update({"status": "error", "error": str(e)})
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+async def run_batch(
+    records: List[Dict[str, Any]],
+    output_path: str,
+    concurrency: int = 4
+) -> List[Dict[str, Any]]:
+    """
+    以有限并发运行批量任务，每完成一个就写入一行 JSONL 结果
     
     Args:
-        task_type: 任务类型 (brief/cv/paper)
-        input_query: 输入查询字符串
+        records: 任务记录列表
+        output_path: 结果输出路径（JSONL）
+        concurrency: 最大并发数
     
     Returns:
-        初始化后的 AgentState
+        按完成顺序排列的结果记录列表
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    tasks = [
+        asyncio.create_task(run_batch_item(i, record, semaphore))
+        for i, record in enumerate(records)
+    ]
+    results = []
+    with open(output_path, "w", encoding="utf-8") as out:
+        for finished in asyncio.as_completed(tasks):
+            result = await finished
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            results.append(result)
+            status = "✅" if result["status"] == "ok" else "❌"
+            print(f"{status} [{result['index']}] {result['type']} | {result['input']} | {result['latency_ms']} ms")
+    return results
+
+
+def print_batch_summary(results: List[Dict[str, Any]], elapsed: float) -> None:
+    """
+    打印批量运行汇总（成功/失败数、延迟分位数、吞吐）
+    
+    Args:
+        results: 结果记录列表
+        elapsed: 总耗时（秒）
     """
-    if task_type not in ["brief", "cv", "paper"]:
-        raise ValueError(f"无效的任务类型: {task_type}。必须是 brief、cv 或 paper")
+    failures = [r for r in results if r["status"] != "ok"]
+    latencies = sorted(r["latency_ms"] for r in results)
     
-    return AgentState(
-        task_type=task_type,
-        input_query=input_query,
-        content="",
-        image_url="",
-        critique="",
-        iteration=0,
-        steps=[]
+    def percentile(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))]
+    
+    print("-" * 50)
+    print(f"📊 批量任务完成: {len(results) - len(failures)}/{len(results)} 成功，总耗时 {elapsed:.1f}s")
+    if results:
+        print(f"⏱️  延迟: p50={percentile(0.5)} ms, p95={percentile(0.95)} ms, max={latencies[-1]} ms")
+        if elapsed > 0:
+            print(f"🚀 吞吐: {len(results) / elapsed:.2f} 任务/秒")
+    for r in failures:
+        print(f"  ❌ [{r['index']}] {r.get('type')} | {r.get('input')}: {r.get('error')}")
+
+
+def print_metrics(metrics: List[Dict[str, Any]]) -> None:
+    """
+    打印各节点的耗时、token 用量与估算成本
+    
+    Args:
+        metrics: AgentState.metrics 列表
+    """
+    summary = summarize_metrics(metrics)
+    if not summary:
+        return
+    print("\n⏱️  节点耗时:")
+    for node, stats in summary.items():
+        runs = f" x{stats['runs']}" if stats["runs"] > 1 else ""
+        tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+        cache_hit = f"，缓存命中 {stats['cache_hit_tokens']}" if stats["cache_hit_tokens"] else ""
+        print(
+            f"  - {node}{runs}: {stats['seconds'] * 1000:.0f} ms, "
+            f"{tokens} tokens (输入 {stats['prompt_tokens']}{cache_hit} / 输出 {stats['completion_tokens']}), "
+            f"${stats['cost_usd']:.4f}"
+        )
+
+
+def serve_main(argv: List[str]) -> None:
+    """
+    服务模式入口：python main.py serve [--host HOST] [--port PORT] [--workers N] [--queue-size N] [--allow-pdf-sources]
+    
+    Args:
+        argv: serve 之后的命令行参数
+    """
+    from core.server import serve, SERVE_WORKERS, SERVE_QUEUE_SIZE
+    
+    parser = argparse.ArgumentParser(
+        prog="main.py serve",
+        description="以常驻 HTTP 服务运行：图只编译一次，任务进入有界队列由 worker 池执行"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="监听地址，默认 127.0.0.1（服务没有鉴权，对外开放时请置于带鉴权的反向代理之后）"
+    )
+    parser.add_argument("--port", type=int, default=8000, help="监听端口，默认 8000")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SERVE_WORKERS,
+        help=f"同时运行的流水线数，默认 {SERVE_WORKERS}"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=SERVE_QUEUE_SIZE,
+        help=f"等待队列长度，队列满时新任务返回 429，默认 {SERVE_QUEUE_SIZE}"
+    )
+    parser.add_argument(
+        "--allow-pdf-sources",
+        action="store_true",
+        help="允许 paper 任务使用服务器上的本地 PDF 路径与非 arXiv 链接（默认只接受 Arxiv ID）"
+    )
+    args = parser.parse_args(argv)
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        allow_pdf_sources=args.allow_pdf_sources
     )
 
 
 def main():
     """主函数"""
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve_main(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
         description="Social Media Assistant - 社交媒体内容生成助手"
     )
     parser.add_argument(
         "--type",
         type=str,
-        required=True,
         choices=["brief", "paper", "cv"],
         help="任务类型: brief (简报), paper (论文), cv (简历)"
     )
     parser.add_argument(
         "--input",
         type=str,
-        required=True,
-        help="输入查询字符串（例如: AI 工具名称、CV 项目关键词等）"
+        help="输入查询字符串（例如: AI 工具名称、CV 项目关键词、Arxiv ID 等）"
+    )
+    parser.add_argument(
+        "--topics",
+        type=str,
+        help="brief 多话题模式：逗号分隔的子话题（例如: \"Agent,多模态,开源模型\"），各子话题并行搜索后合并为一份简报"
+    )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="关闭流式输出，等待整个工作流结束后再打印结果"
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        metavar="FILE",
+        help="批量模式：JSONL 文件，每行一个 {\"type\": ..., \"input\": ...}"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="批量模式的结果输出文件（JSONL），默认为 <FILE>.results.jsonl"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="批量模式的最大并发数，默认 4"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="单任务模式下每个节点完成后保存检查点（自动生成运行 ID），失败后可用 --resume 继续"
+    )
+    parser.add_argument(
+        "--run-id",
+        type=str,
+        help="单任务模式的运行 ID，指定时保存检查点（隐含 --checkpoint）"
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        metavar="RUN_ID",
+        help="从检查点恢复之前中断的运行，从最后一个成功的节点继续"
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="打印各模块的导入耗时，以及图编译、首个节点开始等启动阶段的时间点"
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        help="运行结束后将指标以 Prometheus 文本格式写入该文件"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="运行期间在该端口提供 /metrics HTTP 端点"
+    )
+    parser.add_argument(
+        "--metrics-host",
+        type=str,
+        default="127.0.0.1",
+        help="/metrics 端点的监听地址，默认 127.0.0.1（供其他主机抓取时设为 0.0.0.0）"
     )
     
     args = parser.parse_args()
     
-    # 初始化状态
-    initial_state = initialize_state(
-        task_type=args.type,
-        input_query=args.input
-    )
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port, host=args.metrics_host)
+        print(f"📈 指标端点: http://{args.metrics_host}:{args.metrics_port}/metrics")
+    
+    if args.batch:
+        records = load_batch(args.batch)
+        output_path = args.output or f"{os.path.splitext(args.batch)[0]}.results.jsonl"
+        print(f"🚀 启动批量任务: {len(records)} 条（并发: {args.concurrency}）")
+        print(f"📝 结果输出: {output_path}")
+        print("-" * 50)
+        start = time.perf_counter()
+        results = asyncio.run(run_batch(records, output_path, args.concurrency))
+        print_batch_summary(results, time.perf_counter() - start)
+        if args.profile_startup:
+            print(startup.report())
+        if args.metrics_file:
+            write_metrics(args.metrics_file)
+        if any(r["status"] != "ok" for r in results):
+            sys.exit(1)
+        return
+    
+    from core.graph import get_graph, create_graph
+    from core.checkpoint import checkpoint_enabled, get_checkpointer, new_run_id, run_config
+    
+    topics = parse_topics(args.topics) if args.topics else []
+    if args.resume:
+        if args.type or args.input is not None or args.run_id or args.topics or args.checkpoint:
+            parser.error("--resume 不能与 --type、--input、--topics、--checkpoint 或 --run-id 同时使用")
+        if not checkpoint_enabled():
+            parser.error("--resume 需要启用检查点（CHECKPOINT_PATH 不能为空）")
+    elif (args.checkpoint or args.run_id) and not checkpoint_enabled():
+        parser.error("--checkpoint / --run-id 需要启用检查点（CHECKPOINT_PATH 不能为空）")
+    elif args.topics is not None and args.type != "brief":
+        parser.error("--topics 只能与 --type brief 一起使用")
+    elif args.topics is not None and not topics:
+        parser.error("--topics 至少需要一个子话题")
+    elif not args.type or (args.input is None and not topics):
+        parser.error("单任务模式需要同时提供 --type 和 --input（或使用 --batch FILE）")
+    
+    if topics and args.input is None:
+        # 未指定 --input 时以子话题列表作为整体查询
+        args.input = ", ".join(topics)
+    
+    # 检查点按需开启（--checkpoint / --run-id / --resume）：每个节点完成后保存状态，失败后可按运行 ID 恢复；
+    # 普通运行不写检查点，避免检查点文件无限增长
+    config, run_id = None, None
+    if args.resume or args.run_id or args.checkpoint:
+        run_id = args.resume or args.run_id or new_run_id()
+        app = create_graph(checkpointer=get_checkpointer())
+        config = run_config(run_id)
+    else:
+        app = get_graph()
+    
+    snapshot = app.get_state(config) if config else None
+    if args.resume:
+        if not snapshot.values:
+            parser.error(f"未找到运行 {run_id} 的检查点")
+        # 输入为 None 时 LangGraph 从最后一个检查点继续
+        initial_state = None
+        task_type = snapshot.values.get("task_type", "")
+        input_query = snapshot.values.get("input_query", "")
+    else:
+        if snapshot is not None and snapshot.values:
+            parser.error(f"运行 {run_id} 已存在，请使用 --resume {run_id} 继续或更换 --run-id")
+        # 初始化状态
+        initial_state = initialize_state(
+            task_type=args.type,
+            input_query=args.input,
+            sub_topics=topics
+        )
+        task_type, input_query = args.type, args.input
     
-    print(f"🚀 启动任务: {args.type}")
-    print(f"📝 输入查询: {args.input}")
+    print(f"{'♻️  恢复' if args.resume else '🚀 启动'}任务: {task_type}")
+    print(f"📝 输入查询: {input_query}")
+    if topics:
+        print(f"🧩 子话题: {'、'.join(topics)}")
+    if run_id:
+        print(f"🔖 运行 ID: {run_id}")
+    if args.resume:
+        print(f"⏭️  待执行节点: {', '.join(snapshot.next) or '无（已完成）'}")
     print("-" * 50)
     
     # 运行工作流
     try:
-        final_state = graph.invoke(initial_state)
+        if args.resume and not snapshot.next:
+            final_state = snapshot.values
+        elif args.no_stream:
+            final_state = app.invoke(initial_state, config)
+        else:
+            final_state = stream_run(initial_state, app, config)
         
         print("\n✅ 任务完成！")
         print("-" * 50)
@@ -79,9 +497,16 @@ def main():
         print(f"\n📋 执行步骤:")
         for step in final_state.get('steps', []):
             print(f"  - {step}")
+        print_metrics(final_state.get('metrics', []))
+        if args.profile_startup:
+            print(f"\n{startup.report()}")
+        if args.metrics_file:
+            write_metrics(args.metrics_file)
         
     except Exception as e:
         print(f"\n❌ 错误: {str(e)}")
+        if run_id:
+            print(f"💾 已完成的节点已保存，可使用 --resume {run_id} 从失败处继续")
         raise
 
 
@@ -0,0 +1,8 @@
+"""
+测试公共配置
+将项目根目录加入 sys.path，使测试可以像 main.py 一样导入 tools / agents / core
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,33 @@
+"""
+benchmarks/pipeline.py：分位数与基线对比
+"""
+import pytest
+
+pytest.importorskip("langgraph")
+
+from benchmarks.pipeline import compare_with_baseline, percentile  # noqa: E402
+
+
+def _report(*levels):
+    return {"levels": [{"concurrency": c, "p95_ms": p95, "throughput_rps": rps} for c, p95, rps in levels]}
+
+
+def test_percentile_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert percentile([], 0.95) == 0.0
+    assert percentile(values, 0) == 1
+    assert percentile(values, 0.5) == 3
+    assert percentile(values, 0.95) == 5
+
+
+def test_compare_with_baseline_within_tolerance():
+    baseline = _report((1, 100, 10.0), (4, 200, 20.0))
+    assert compare_with_baseline(_report((1, 115, 9.0), (4, 200, 20.0)), baseline, 0.2) == []
+
+
+def test_compare_with_baseline_flags_regressions():
+    baseline = _report((1, 100, 10.0), (4, 200, 20.0))
+    regressions = compare_with_baseline(_report((1, 130, 10.0), (4, 200, 15.0), (8, 999, 1.0)), baseline, 0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("并发 1: p95")
+    assert regressions[1].startswith("并发 4: 吞吐")
@@ -0,0 +1,68 @@
+"""
+tools/cache.py：LRU + TTL 缓存与 SQLite 磁盘层
+"""
+import time
+
+from tools.cache import TTLCache, hash_key
+
+
+def test_hash_key_is_order_independent():
+    assert hash_key({"a": 1, "b": [1, 2]}) == hash_key({"b": [1, 2], "a": 1})
+    assert hash_key({"a": 1}) != hash_key({"a": 2})
+
+
+def test_get_and_miss():
+    cache = TTLCache()
+    cache.set("k", {"v": 1})
+    assert cache.get("k") == {"v": 1}
+    assert cache.get("missing", "default") == "default"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire():
+    cache = TTLCache(ttl=0.05)
+    cache.set("short", 1)
+    cache.set("forever", 2, ttl=60)
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.get("forever") == 2
+    assert len(cache) == 1
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_layer_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    TTLCache(db_path=path, namespace="llm").set("k", ["值"])
+
+    reopened = TTLCache(db_path=path, namespace="llm")
+    assert reopened.get("k") == ["值"]
+    assert reopened.stats()["disk_hits"] == 1
+    assert TTLCache(db_path=path, namespace="search").get("k") is None
+
+
+def test_expired_disk_entries_are_dropped(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    TTLCache(db_path=path).set("k", 1, ttl=0.01)
+    time.sleep(0.05)
+    assert TTLCache(db_path=path).get("k") is None
+
+
+def test_clear_removes_namespace(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = TTLCache(db_path=path)
+    cache.set("k", 1)
+    cache.clear()
+    assert len(cache) == 0
+    assert TTLCache(db_path=path).get("k") is None
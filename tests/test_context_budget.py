@@ -0,0 +1,79 @@
+"""
+tools/context_budget.py：token 估算、去重排序与上下文裁剪
+"""
+from tools import context_budget
+from tools.context_budget import count_tokens, dedupe, fit_search_results, fit_text, rank
+
+
+def test_count_tokens_by_model():
+    assert count_tokens("") == 0
+    assert count_tokens("中文" * 50) == 61
+    assert count_tokens("a" * 100) == 31
+    assert count_tokens("a" * 100, model="gpt-4o") == 26
+    assert count_tokens("a" * 100, model="mock-deepseek-chat") == count_tokens("a" * 100)
+
+
+def test_dedupe_drops_near_duplicates():
+    passages = [
+        "OpenAI releases a new reasoning model",
+        "OpenAI releases a new reasoning model!",
+        "",
+        "Meta open sources a vision model",
+    ]
+    assert dedupe(passages) == [0, 3]
+
+
+def test_rank_prefers_query_terms_and_keeps_ties_in_order():
+    passages = ["天气不错", "多模态模型发布", "新的多模态大模型开源"]
+    assert rank(passages, "多模态大模型") == [2, 1, 0]
+
+
+def test_fit_text_keeps_short_text():
+    text = "第一段。\n\n第二段。"
+    assert fit_text(text, "查询", "test", budget=1000) == (text, count_tokens(text), count_tokens(text))
+
+
+def test_fit_text_keeps_relevant_paragraphs_in_order():
+    paragraphs = ["diffusion model training tricks " * 5, "cooking recipes " * 5, "diffusion model sampling " * 5]
+    text = "\n\n".join(paragraphs)
+    budget = count_tokens(paragraphs[0]) + count_tokens(paragraphs[2])
+    fitted, before, after = fit_text(text, "diffusion model", "test", budget=budget)
+    assert fitted == "\n\n".join([paragraphs[0], paragraphs[2]])
+    assert after < before
+
+
+def test_fit_text_truncates_single_oversized_paragraph():
+    text = "x" * 1000
+    fitted, _, after = fit_text(text, "query", "test", budget=50)
+    assert text.startswith(fitted)
+    assert after <= 60
+
+
+def test_fit_text_disabled(monkeypatch):
+    monkeypatch.setattr(context_budget, "CONTEXT_BUDGET_ENABLED", False)
+    text = "段落。\n\n段落。"
+    assert fit_text(text, "query", "test", budget=1)[0] == text
+
+
+def test_fit_search_results_drops_repeated_sentences():
+    results = [
+        {"title": "A", "url": "https://a.example", "content": "GPT-5 was released today. It tops benchmarks."},
+        {"title": "B", "url": "https://b.example", "content": "GPT-5 was released today. Pricing is lower."},
+    ]
+    fitted, before, after = fit_search_results(results, "GPT-5 release", "test", budget=1000)
+    assert [r["content"] for r in fitted] == ["GPT-5 was released today. It tops benchmarks.", "Pricing is lower."]
+    assert fitted[1]["url"] == "https://b.example"
+    assert after < before
+    assert results[1]["content"].startswith("GPT-5")
+
+
+def test_fit_search_results_respects_budget():
+    results = [
+        {"title": str(i), "url": f"https://{i}.example", "content": f"Unrelated filler sentence number {i}. " * 3}
+        for i in range(10)
+    ]
+    results[7]["content"] = "Vision transformer benchmark results improved."
+    fitted, before, after = fit_search_results(results, "vision transformer", "test", budget=60)
+    assert "7" in [r["title"] for r in fitted]
+    assert len(fitted) < len(results)
+    assert after <= 60 < before
@@ -0,0 +1,86 @@
+"""
+tools/md_sections.py：章节切分、审查意见定位与增量替换
+"""
+from tools.md_sections import (
+    join_sections,
+    locate_items,
+    normalize_title,
+    parse_items,
+    splice_sections,
+    split_sections,
+    strip_fence,
+)
+
+DOC = """导语
+
+## 背景
+旧的背景。
+
+## 方法
+旧的方法。
+
+## 结论
+旧的结论。
+"""
+
+
+def test_split_sections_roundtrip():
+    sections = split_sections(DOC)
+    assert [title for title, _ in sections] == ["", "背景", "方法", "结论"]
+    assert sections[1][1] == "## 背景\n旧的背景。\n\n"
+    assert join_sections(sections) == DOC
+
+
+def test_split_sections_without_preamble():
+    sections = split_sections("# 标题\n正文\n")
+    assert sections == [("标题", "# 标题\n正文\n")]
+
+
+def test_normalize_title_ignores_punctuation_and_case():
+    assert normalize_title("【Key Points】：") == normalize_title("key points")
+
+
+def test_parse_items_merges_continuation_lines():
+    critique = "总体不错。\n1. 「背景」太长\n   需要压缩\n2）方法 缺少数据\n"
+    assert parse_items(critique) == ["「背景」太长\n需要压缩", "方法 缺少数据"]
+    assert parse_items("PASS") == []
+
+
+def test_locate_items_maps_to_sections():
+    sections = split_sections(DOC)
+    items = ["「背景」太长", "方法和结论不一致"]
+    assert locate_items(items, sections) == {
+        1: ["「背景」太长"],
+        2: ["方法和结论不一致"],
+        3: ["方法和结论不一致"],
+    }
+
+
+def test_locate_items_requires_every_item():
+    sections = split_sections(DOC)
+    assert locate_items(["背景太长", "整体语气太生硬"], sections) is None
+
+
+def test_strip_fence():
+    assert strip_fence("```markdown\n## 背景\n新\n```") == "## 背景\n新"
+    assert strip_fence("## 背景\n新") == "## 背景\n新"
+
+
+def test_splice_sections_by_title():
+    sections = split_sections(DOC)
+    rewritten = "```markdown\n## 结论\n新的结论。\n\n## 背景\n新的背景。\n```"
+    result = splice_sections(sections, [1, 3], rewritten)
+    assert join_sections(result) == DOC.replace("旧的背景", "新的背景").replace("旧的结论", "新的结论")
+
+
+def test_splice_sections_by_order_when_titles_change():
+    sections = split_sections(DOC)
+    result = splice_sections(sections, [2], "## 研究方法\n新的方法。")
+    assert result[2] == ("研究方法", "## 研究方法\n新的方法。\n\n")
+    assert result[1] == sections[1]
+    assert result[3] == sections[3]
+
+
+def test_splice_sections_rejects_mismatched_output():
+    sections = split_sections(DOC)
+    assert splice_sections(sections, [1, 2], "## 其他\n内容") is None
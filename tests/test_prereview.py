@@ -0,0 +1,71 @@
+"""
+agents/prereview.py：PASS 判定与本地预审
+"""
+import pytest
+
+from agents import prereview as prereview_module
+from agents.prereview import check_draft, format_critique, is_pass, prereview
+
+BRIEF = """## 🔥 AI 热点简报
+
+### ToolA
+**用途**: 自动生成代码评审意见，覆盖主流语言。
+**亮点**: 开源，支持本地部署。
+**评价**: 适合中小团队试用。
+来源: https://example.com/tool-a
+
+**总结**: 开发者工具继续向本地化与开源方向发展，值得持续关注。
+"""
+
+
+@pytest.mark.parametrize("critique", [
+    "PASS", "pass", "PASS.", "**PASS**", "审查结果：PASS", "结论: PASS", "Verdict: PASS", "  PASS  \n",
+])
+def test_is_pass_accepts_variants(critique):
+    assert is_pass(critique)
+
+
+@pytest.mark.parametrize("critique", [
+    None, "", "修改意见：\n1. 缺少总结", "PASS，但建议补充来源", "PASSED", "NOT PASS",
+])
+def test_is_pass_rejects_critiques(critique):
+    assert not is_pass(critique)
+
+
+def test_clean_brief_has_no_problems():
+    assert check_draft(BRIEF, "brief", ["https://example.com/tool-a/"]) == []
+
+
+def test_brief_missing_fields_and_summary():
+    draft = BRIEF.replace("**亮点**", "亮点").replace("**总结**", "总结")
+    problems = check_draft(draft, "brief")
+    assert any("ToolA" in p and "亮点" in p for p in problems)
+    assert any("总结" in p for p in problems)
+
+
+def test_ungrounded_links_are_flagged():
+    draft = BRIEF + "\n更多: https://made-up.example.org/post。\n"
+    problems = check_draft(draft, "brief", ["https://example.com/tool-a"])
+    assert len(problems) == 1
+    assert "https://made-up.example.org/post" in problems[0]
+
+
+def test_length_limits():
+    assert "过短" in check_draft("太短", "other")[0]
+
+
+def test_format_critique_numbers_items():
+    assert format_critique(["甲", "乙"]) == "修改意见：\n1. 甲\n2. 乙"
+
+
+def test_prereview_defers_clean_drafts_to_llm(monkeypatch):
+    monkeypatch.setattr(prereview_module, "PREREVIEW_PASS_ON_CLEAN", False)
+    assert prereview(BRIEF, "brief") is None
+    monkeypatch.setattr(prereview_module, "PREREVIEW_PASS_ON_CLEAN", True)
+    assert prereview(BRIEF, "brief") == "PASS"
+    assert prereview("太短", "brief").startswith("修改意见：\n1. ")
+
+
+def test_prereview_disabled(monkeypatch):
+    monkeypatch.setattr(prereview_module, "PREREVIEW_ENABLED", False)
+    assert prereview("太短", "brief") is None
@@ -0,0 +1,187 @@
+"""
+tools/ratelimit.py：令牌桶、AIMD 并发上限与限流重试
+"""
+import time
+import asyncio
+import threading
+
+import pytest
+
+from tools import ratelimit
+from tools.metrics import CallTimer
+from tools.ratelimit import AdaptiveConcurrency, ProviderLimiter, TokenBucket, is_throttle_error
+
+
+class _Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = _Response(status_code, headers)
+
+
+class RateLimitError(Exception):
+    """与 openai.RateLimitError 同名，无状态码"""
+
+
+@pytest.fixture(autouse=True)
+def _fast_backoff(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_BACKOFF", 0.0)
+    monkeypatch.setattr(ratelimit, "_DECREASE_COOLDOWN", 0.0)
+
+
+def test_bucket_unlimited_never_waits():
+    bucket = TokenBucket(0, 0)
+    assert bucket.reserve(1000) == 0.0
+
+
+def test_bucket_waits_for_overdraft_and_refund_restores():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.02)
+    bucket.refund(1)
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.02)
+
+
+def test_concurrency_halves_on_throttle_and_grows_back():
+    limiter = AdaptiveConcurrency(max_limit=8)
+    limiter.on_throttle()
+    assert int(limiter.limit) == 4
+    limiter.on_throttle()
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == 1.0
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.limit == 8.0
+
+
+def test_concurrency_decrease_once_per_cooldown(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_DECREASE_COOLDOWN", 60.0)
+    limiter = AdaptiveConcurrency(max_limit=8)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert int(limiter.limit) == 4
+
+
+def test_try_acquire_respects_limit():
+    limiter = AdaptiveConcurrency(max_limit=2)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+@pytest.mark.parametrize("error, expected", [
+    (_HTTPError(429), True),
+    (_HTTPError(503), True),
+    (_HTTPError(400), False),
+    (RateLimitError("slow down"), True),
+    (ValueError("bad"), False),
+])
+def test_is_throttle_error(error, expected):
+    assert is_throttle_error(error) is expected
+
+
+def test_call_retries_throttled_requests():
+    limiter = ProviderLimiter("test", max_concurrency=4)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _HTTPError(429, {"retry-after": "0"})
+        return "ok"
+
+    with CallTimer("llm", "test") as timer:
+        assert limiter.call(fn, timer=timer) == "ok"
+    assert len(attempts) == 3
+    assert timer.retries == 2
+    # 两次限流 4 -> 2 -> 1，成功一次后加性增长到 2
+    assert int(limiter.concurrency.limit) == 2
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_call_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_MAX_RETRIES", 2)
+    limiter = ProviderLimiter("test")
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise _HTTPError(500)
+
+    with pytest.raises(_HTTPError):
+        limiter.call(fn)
+    assert len(attempts) == 3
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_call_does_not_retry_other_errors():
+    limiter = ProviderLimiter("test")
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.call(fn)
+    assert len(attempts) == 1
+    assert limiter.concurrency.limit == 8.0
+
+
+def test_call_caps_concurrent_requests():
+    limiter = ProviderLimiter("test", max_concurrency=2)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def fn():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return True
+
+    threads = [threading.Thread(target=limiter.call, args=(fn,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] <= 2
+
+
+def test_usage_corrects_token_reservation():
+    limiter = ProviderLimiter("test", tpm=600)
+    limiter.call(lambda: 100, estimated_tokens=500, usage=lambda result: result)
+    # 预留 500、实际 100：余下 600 - 100 = 500 个 token，再预留 500 无需等待
+    assert limiter.tokens.reserve(500) == 0.0
+
+
+def test_acall_retries_throttled_requests():
+    limiter = ProviderLimiter("test", max_concurrency=4)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise _HTTPError(429)
+        return "ok"
+
+    assert asyncio.run(limiter.acall(fn)) == "ok"
+    assert len(attempts) == 2
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_limited_call_bypasses_unknown_provider():
+    assert ratelimit.get_limiter("mock") is None
+    assert ratelimit.limited_call("mock", lambda: 42) == 42
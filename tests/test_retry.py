@@ -0,0 +1,180 @@
+"""
+tools/retry.py：重试退避、截止时间与对冲请求
+"""
+import time
+import asyncio
+
+import pytest
+
+from tools.metrics import CallTimer, registry
+from tools.retry import CallPolicy, DeadlineExceeded, backoff_delay, is_transient_error
+
+
+class APIConnectionError(Exception):
+    """与 openai.APIConnectionError 同名"""
+
+
+def _warm(policy: CallPolicy, seconds: float = 0.01) -> None:
+    """填充延迟样本，使对冲阈值可用"""
+    for _ in range(policy.hedge_min_samples):
+        policy._record(seconds)
+
+
+def _hedges(kind: str, winner: str) -> float:
+    return registry.counter_value("sma_hedges_total", kind=kind, provider="test", winner=winner)
+
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, 0.5, 4.0) <= min(4.0, 0.5 * 2 ** attempt)
+
+
+@pytest.mark.parametrize("error, expected", [
+    (TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (APIConnectionError(), True),
+    (DeadlineExceeded(), False),
+    (ValueError(), False),
+])
+def test_is_transient_error(error, expected):
+    assert is_transient_error(error) is expected
+
+
+def test_call_retries_transient_errors():
+    policy = CallPolicy("llm", "test", max_retries=2, backoff=0)
+    attempts = []
+
+    def fn(hedged):
+        attempts.append(hedged)
+        if len(attempts) < 3:
+            raise APIConnectionError("reset")
+        return "ok"
+
+    with CallTimer("llm", "test") as timer:
+        assert policy.call(fn, timer=timer) == "ok"
+    assert attempts == [False, False, False]
+    assert timer.retries == 2
+
+
+def test_call_stops_after_max_retries():
+    policy = CallPolicy("llm", "test", max_retries=1, backoff=0)
+    attempts = []
+
+    def fn(hedged):
+        attempts.append(hedged)
+        raise TimeoutError("slow")
+
+    with pytest.raises(TimeoutError):
+        policy.call(fn)
+    assert len(attempts) == 2
+
+
+def test_call_does_not_retry_permanent_errors():
+    policy = CallPolicy("llm", "test", max_retries=3, backoff=0)
+    attempts = []
+
+    def fn(hedged):
+        attempts.append(hedged)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        policy.call(fn)
+    assert len(attempts) == 1
+
+
+def test_call_skips_retry_past_deadline():
+    policy = CallPolicy("llm", "test", max_retries=5, backoff=0, deadline=0.05)
+    attempts = []
+
+    def fn(hedged):
+        attempts.append(hedged)
+        time.sleep(0.1)
+        raise TimeoutError("slow")
+
+    with pytest.raises(TimeoutError):
+        policy.call(fn)
+    assert len(attempts) == 1
+
+
+def test_hedge_delay_needs_samples():
+    policy = CallPolicy("llm", "test", hedge=True, hedge_min_samples=5)
+    assert policy.hedge_delay() is None
+    for seconds in (0.1, 0.2, 0.3, 0.4, 0.5):
+        policy._record(seconds)
+    assert policy.hedge_delay() == 0.5
+    assert CallPolicy("llm", "test", hedge=False).hedge_delay() is None
+
+
+def test_call_hedge_wins_over_slow_primary():
+    policy = CallPolicy("llm-sync", "test", hedge=True, hedge_min_samples=3)
+    _warm(policy)
+    before = _hedges("llm-sync", "hedge")
+    winners = []
+
+    def fn(hedged):
+        if not hedged:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    assert policy.call(fn, on_hedge_win=winners.append) == "hedge"
+    assert winners == ["hedge"]
+    assert _hedges("llm-sync", "hedge") == before + 1
+
+
+def test_call_without_hedge_runs_inline():
+    policy = CallPolicy("llm", "test", hedge=True, hedge_min_samples=3)
+    _warm(policy)
+    calls = []
+
+    def fn(hedged):
+        calls.append(hedged)
+        time.sleep(0.05)
+        return "primary"
+
+    assert policy.call(fn, hedge=False) == "primary"
+    assert calls == [False]
+
+
+def test_call_hedged_deadline():
+    policy = CallPolicy("llm", "test", max_retries=0, deadline=0.1, hedge=True, hedge_min_samples=3)
+    _warm(policy)
+
+    with pytest.raises(DeadlineExceeded):
+        policy.call(lambda hedged: time.sleep(0.5))
+
+
+def test_acall_hedge_cancels_primary():
+    policy = CallPolicy("llm-async", "test", hedge=True, hedge_min_samples=3)
+    _warm(policy)
+    cancelled = []
+
+    async def fn(hedged):
+        if hedged:
+            return "hedge"
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "primary"
+
+    async def run():
+        result = await policy.acall(fn)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "hedge"
+    assert cancelled == [True]
+
+
+def test_acall_deadline():
+    policy = CallPolicy("llm", "test", max_retries=2, deadline=0.05)
+
+    async def fn(hedged):
+        await asyncio.sleep(1)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(policy.acall(fn))
+    assert time.monotonic() - start < 0.5
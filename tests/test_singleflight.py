@@ -0,0 +1,107 @@
+"""
+tools/singleflight.py：请求合并
+"""
+import time
+import asyncio
+import threading
+
+import pytest
+
+from tools.singleflight import SingleFlight
+
+
+def _run_threads(target, count):
+    results = [None] * count
+
+    def worker(i):
+        results[i] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    results = _run_threads(lambda: flight.do_shared("k", fn), 4)
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(value == "result" for value, _ in results)
+    assert flight.shared == 3
+    assert not flight.in_flight("k")
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    def fn():
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("k", fn)
+        except ValueError as e:
+            return str(e)
+
+    assert _run_threads(call, 3) == ["boom"] * 3
+
+
+def test_disabled_runs_every_call():
+    flight = SingleFlight(enabled=False)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.05)
+        return len(calls)
+
+    results = _run_threads(lambda: flight.do_shared("k", fn), 3)
+    assert len(calls) == 3
+    assert all(not shared for _, shared in results)
+
+
+def test_async_calls_share_one_task():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return value
+
+    async def run():
+        return await asyncio.gather(*(flight.ado_shared("k", fn, i) for i in range(3)))
+
+    results = asyncio.run(run())
+    assert calls == [0]
+    assert results == [(0, False), (0, True), (0, True)]
+
+
+def test_async_joins_running_sync_call():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fn():
+        started.set()
+        time.sleep(0.1)
+        return "sync"
+
+    async def afn():
+        pytest.fail("async caller should join the sync call")
+
+    thread = threading.Thread(target=flight.do, args=("k", fn))
+    thread.start()
+    started.wait()
+    assert asyncio.run(flight.ado_shared("k", afn)) == ("sync", True)
+    thread.join()
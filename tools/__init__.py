@@ -0,0 +1,7 @@
+"""
+工具包
+在任何工具模块读取环境变量配置之前加载一次 .env
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
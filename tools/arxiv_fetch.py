@@ -0,0 +1,238 @@
+"""
+arXiv 论文元数据抓取工具
+优先查询本地索引；其余 ID 合并为一次 arxiv.Search(id_list=...) 请求，元数据按 ID + 版本缓存到磁盘
+"""
+import os
+import re
+import time
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from data.arxiv_index import get_arxiv_index, parse_arxiv_id
+from tools.cache import TTLCache, default_cache_path
+from tools.metrics import CallTimer
+
+if TYPE_CHECKING:
+    import arxiv
+
+# 元数据缓存配置：带版本号的条目内容不会再变化，可长期缓存；
+# 不带版本号的 ID 指向“最新版本”，别名条目使用较短的有效期以便发现新版本
+ARXIV_CACHE_ENABLED = os.getenv("ARXIV_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+ARXIV_CACHE_MAX_ENTRIES = int(os.getenv("ARXIV_CACHE_MAX_ENTRIES", "2048"))
+ARXIV_CACHE_PATH = os.getenv("ARXIV_CACHE_PATH", default_cache_path("arxiv_cache.sqlite"))
+ARXIV_CACHE_TTL = float(os.getenv("ARXIV_CACHE_TTL", str(30 * 86400)))
+ARXIV_LATEST_TTL = float(os.getenv("ARXIV_LATEST_TTL", "86400"))
+
+# 单次请求最多携带的 ID 数（arXiv API 的分页上限内）
+ARXIV_BATCH_SIZE = int(os.getenv("ARXIV_BATCH_SIZE", "100"))
+ARXIV_NUM_RETRIES = int(os.getenv("ARXIV_NUM_RETRIES", "3"))
+
+# 离线模式：不访问网络，直接返回模拟元数据（用于测试和基准测试）
+ARXIV_OFFLINE = os.getenv("ARXIV_OFFLINE", "").lower() in ("1", "true", "yes")
+MOCK_ARXIV_LATENCY = float(os.getenv("MOCK_ARXIV_LATENCY", "0"))
+
+_lock = threading.Lock()
+_client: Optional["arxiv.Client"] = None
+_arxiv_cache: Optional[TTLCache] = None
+
+
+def parse_id_list(text: str) -> List[str]:
+    """
+    从输入中解析多个 arXiv ID（逗号、分号或空白分隔），去重并保持顺序
+
+    Args:
+        text: 输入字符串
+
+    Returns:
+        规范化后的 ID 列表（保留用户指定的版本号）
+    """
+    ids = []
+    for token in re.split(r"[\s,;]+", text.strip()):
+        if not token:
+            continue
+        base, version = parse_arxiv_id(token)
+        arxiv_id = f"{base}v{version}" if version else base
+        if arxiv_id not in ids:
+            ids.append(arxiv_id)
+    return ids
+
+
+def _get_client() -> "arxiv.Client":
+    """获取进程内复用的 arxiv.Client（首次访问 arXiv API 时才导入 arxiv）"""
+    import arxiv
+    global _client
+    with _lock:
+        if _client is None:
+            _client = arxiv.Client(page_size=ARXIV_BATCH_SIZE, num_retries=ARXIV_NUM_RETRIES)
+        return _client
+
+
+def get_arxiv_cache() -> TTLCache:
+    """
+    获取进程内共享的论文元数据缓存（惰性创建）
+
+    Returns:
+        TTLCache 实例
+    """
+    global _arxiv_cache
+    with _lock:
+        if _arxiv_cache is None:
+            _arxiv_cache = TTLCache(
+                max_entries=ARXIV_CACHE_MAX_ENTRIES,
+                ttl=ARXIV_CACHE_TTL,
+                db_path=ARXIV_CACHE_PATH or None,
+                namespace="arxiv",
+            )
+        return _arxiv_cache
+
+
+def _paper_to_dict(paper: Any) -> Dict[str, Any]:
+    """将 arxiv.Result 转换为可缓存的字典"""
+    return {
+        "id": paper.get_short_id(),
+        "title": paper.title,
+        "authors": [author.name for author in paper.authors],
+        "summary": paper.summary,
+        "pdf_url": paper.pdf_url,
+        "published": paper.published.isoformat() if paper.published else "",
+        "updated": paper.updated.isoformat() if paper.updated else "",
+        "primary_category": paper.primary_category,
+        "categories": list(paper.categories),
+    }
+
+
+def _mock_paper(arxiv_id: str) -> Dict[str, Any]:
+    """返回模拟论文元数据（仅用于测试）"""
+    base, version = parse_arxiv_id(arxiv_id)
+    return {
+        "id": f"{base}v{version or 1}",
+        "title": f"Mock Paper {base}",
+        "authors": ["Mock Author"],
+        "summary": "This is a mock abstract for offline testing. The proposed method improves accuracy by 3.2% while reducing latency by 40%.",
+        "pdf_url": f"https://arxiv.org/pdf/{base}",
+        "published": "",
+        "updated": "",
+        "primary_category": "cs.CV",
+        "categories": ["cs.CV"],
+    }
+
+
+def _lookup_cache(arxiv_id: str) -> Optional[Dict[str, Any]]:
+    """查询缓存：不带版本号的 ID 先经别名解析到最新的带版本 ID"""
+    cache = get_arxiv_cache()
+    if parse_arxiv_id(arxiv_id)[1] is None:
+        latest = cache.get(f"latest:{arxiv_id}")
+        if latest is None:
+            return None
+        arxiv_id = latest
+    return cache.get(arxiv_id)
+
+
+def _store_cache(requested_id: str, paper: Dict[str, Any]) -> None:
+    """写入缓存：带版本号的条目长期有效，未指定版本的请求额外记录别名"""
+    cache = get_arxiv_cache()
+    cache.set(paper["id"], paper)
+    base, version = parse_arxiv_id(requested_id)
+    if version is None:
+        cache.set(f"latest:{base}", paper["id"], ttl=ARXIV_LATEST_TTL)
+
+
+def _fetch_batch(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    以一次 arxiv.Search(id_list=...) 请求抓取一批论文
+
+    带版本号的请求只匹配完全相同的版本；不带版本号的请求匹配该论文返回结果中的最新版本，
+    同一批次请求同一论文的多个版本时不会互相覆盖。
+
+    Returns:
+        请求 ID -> 论文元数据；未找到的 ID 不出现在结果中
+    """
+    import arxiv
+    search = arxiv.Search(id_list=ids, max_results=len(ids))
+    by_id: Dict[str, Dict[str, Any]] = {}
+    by_base: Dict[str, Dict[str, Any]] = {}
+    for result in _get_client().results(search):
+        paper = _paper_to_dict(result)
+        by_id[paper["id"]] = paper
+        base, version = parse_arxiv_id(paper["id"])
+        latest = by_base.get(base)
+        if latest is None or (version or 0) > (parse_arxiv_id(latest["id"])[1] or 0):
+            by_base[base] = paper
+
+    found = {}
+    for arxiv_id in ids:
+        base, version = parse_arxiv_id(arxiv_id)
+        paper = by_id.get(arxiv_id) if version is not None else by_base.get(base)
+        if paper is not None:
+            found[arxiv_id] = paper
+    return found
+
+
+def fetch_papers(ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    批量获取论文元数据
+
+    依次查询本地索引和元数据缓存，仍未命中的 ID 按 ARXIV_BATCH_SIZE 分批，
+    每批只发起一次 arXiv API 请求。
+
+    Args:
+        ids: arXiv ID 列表（可带版本号）
+
+    Returns:
+        论文元数据列表，按输入顺序排列；未找到的 ID 被跳过
+
+    Raises:
+        RuntimeError: arXiv API 请求失败（离线测试请使用 ARXIV_OFFLINE）
+    """
+    if ARXIV_OFFLINE:
+        with CallTimer("arxiv", "mock"):
+            if MOCK_ARXIV_LATENCY > 0:
+                time.sleep(MOCK_ARXIV_LATENCY)
+            return [_mock_paper(arxiv_id) for arxiv_id in ids]
+
+    # 优先查询本地索引（data/arxiv_index.py），命中的论文无需访问网络
+    index = get_arxiv_index()
+    papers: Dict[str, Dict[str, Any]] = index.get_many(ids) if index is not None else {}
+    missing = []
+    for arxiv_id in ids:
+        if arxiv_id in papers:
+            continue
+        cached = _lookup_cache(arxiv_id) if ARXIV_CACHE_ENABLED else None
+        if cached is not None:
+            papers[arxiv_id] = cached
+        else:
+            missing.append(arxiv_id)
+
+    for start in range(0, len(missing), ARXIV_BATCH_SIZE):
+        batch = missing[start:start + ARXIV_BATCH_SIZE]
+        try:
+            with CallTimer("arxiv", "arxiv"):
+                found = _fetch_batch(batch)
+        except Exception as e:
+            raise RuntimeError(f"Arxiv API 错误: {str(e)}") from e
+        for arxiv_id, paper in found.items():
+            papers[arxiv_id] = paper
+            if ARXIV_CACHE_ENABLED:
+                _store_cache(arxiv_id, paper)
+
+    return [papers[arxiv_id] for arxiv_id in ids if arxiv_id in papers]
+
+
+def format_paper(paper: Dict[str, Any]) -> str:
+    """
+    将论文元数据格式化为供 LLM 阅读的文本
+
+    Args:
+        paper: 论文元数据
+
+    Returns:
+        包含标题、作者、摘要和 PDF 链接的文本
+    """
+    return f"""标题: {paper['title']}
+
+作者: {", ".join(paper['authors'])}
+
+摘要:
+{paper['summary']}
+
+PDF 链接: {paper['pdf_url']}
+"""
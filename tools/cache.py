@@ -0,0 +1,218 @@
+"""
+通用缓存工具
+内存 LRU + TTL 淘汰，可选 SQLite 磁盘层，供 LLM、搜索等工具复用
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# 磁盘缓存默认目录
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+
+def default_cache_path(filename: str) -> str:
+    """
+    获取缓存文件的默认路径
+
+    Args:
+        filename: 缓存文件名
+
+    Returns:
+        位于 CACHE_DIR 下的完整路径
+    """
+    return os.path.join(CACHE_DIR, filename)
+
+
+def hash_key(payload: Any) -> str:
+    """
+    计算内容寻址的缓存键
+
+    Args:
+        payload: 可 JSON 序列化的对象
+
+    Returns:
+        sha256 十六进制摘要
+    """
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    线程安全的 LRU + TTL 缓存
+
+    内存层按最近使用顺序淘汰；若提供 db_path，则同时写入 SQLite 磁盘层，
+    内存未命中时回查磁盘（值需可 JSON 序列化）。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        db_path: Optional[str] = None,
+        namespace: str = "default"
+    ):
+        """
+        Args:
+            max_entries: 内存层最大条目数
+            ttl: 默认过期时间（秒），None 表示永不过期
+            db_path: SQLite 文件路径，None 表示仅使用内存
+            namespace: 磁盘层命名空间，多个缓存可共用一个文件
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self._lock = threading.RLock()
+        # key -> (value, stored_at, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, float, Optional[float]]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str) -> None:
+        """打开（必要时创建）SQLite 磁盘层"""
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, expires_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at < ?",
+            (self.namespace, time.time())
+        )
+        self._db.commit()
+
+    def _remember(self, key: str, entry: Tuple[Any, float, Optional[float]]) -> None:
+        """写入内存层并执行 LRU 淘汰"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _load(self, key: str) -> Optional[Tuple[Any, float, Optional[float]]]:
+        """从内存层或磁盘层读取条目（不检查过期）"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT value, stored_at, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = (json.loads(row[0]), row[1], row[2])
+        self._remember(key, entry)
+        self._stats["disk_hits"] += 1
+        return entry
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """
+        读取缓存条目及其写入时间
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            (value, stored_at)，未命中或已过期时返回 None
+        """
+        with self._lock:
+            entry = self._load(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, stored_at, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                self._delete(key)
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            return value, stored_at
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        读取缓存值
+
+        Args:
+            key: 缓存键
+            default: 未命中时的返回值
+
+        Returns:
+            缓存值或 default
+        """
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值（启用磁盘层时需可 JSON 序列化）
+            ttl: 过期时间（秒），默认使用构造时的 ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._remember(key, (value, now, expires_at))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, stored_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value, ensure_ascii=False), now, expires_at)
+                )
+                self._db.commit()
+
+    def _delete(self, key: str) -> None:
+        """删除条目（调用方需持有锁）"""
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            )
+            self._db.commit()
+
+    def delete(self, key: str) -> None:
+        """删除指定缓存条目"""
+        with self._lock:
+            self._delete(key)
+
+    def clear(self) -> None:
+        """清空缓存（包括磁盘层中本命名空间的数据）"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取命中统计
+
+        Returns:
+            包含 hits/misses/disk_hits/evictions/size 的字典
+        """
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,246 @@
+"""
+上下文预算
+按模型估算 token 数；在拼接提示词之前对搜索结果、论文原文等上下文去重、按与查询的相关性排序裁剪，
+使每个节点的上下文不超过预算，并记录节省的 token 数
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from tools.metrics import registry
+from tools.search import format_results
+
+# 是否启用上下文预算（关闭时原样拼接）
+CONTEXT_BUDGET_ENABLED = os.getenv("CONTEXT_BUDGET_ENABLED", "1").lower() in ("1", "true", "yes")
+
+# 各节点上下文的 token 预算（不含提示词模板本身）
+CONTEXT_BUDGETS: Dict[str, int] = {
+    "brief_generate": int(os.getenv("CONTEXT_BUDGET_BRIEF", "1500")),
+    # 多话题简报中单个子话题的搜索结果
+    "brief_topic": int(os.getenv("CONTEXT_BUDGET_BRIEF_TOPIC", "800")),
+    "cv_generate": int(os.getenv("CONTEXT_BUDGET_CV", "1500")),
+    "pyramid_summarize": int(os.getenv("CONTEXT_BUDGET_SUMMARIZE", "12000")),
+    "reflection_critic": int(os.getenv("CONTEXT_BUDGET_CRITIC", "8000")),
+}
+CONTEXT_DEFAULT_BUDGET = int(os.getenv("CONTEXT_DEFAULT_BUDGET", "4000"))
+
+# 两段文本的词项 Jaccard 相似度达到该值时视为重复，只保留先出现的一段
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+# 每个字符对应的 token 数（中日韩字符, 其他字符），按模型名前缀匹配；
+# DeepSeek 官方换算约为 1 个中文字符 0.6 token、1 个英文字符 0.3 token
+TOKEN_RATIOS: Dict[str, Tuple[float, float]] = {
+    "deepseek": (0.6, 0.3),
+    "gpt": (1.0, 0.25),
+}
+DEFAULT_MODEL = "deepseek-chat"
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+_WORD = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;])\s*|(?<=\.)\s+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on",
+    "or", "that", "the", "this", "to", "with", "latest", "hours",
+}
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """
+    估算文本在指定模型下的 token 数
+
+    Args:
+        text: 文本
+        model: 模型名称（按前缀匹配 TOKEN_RATIOS，未知模型按 DeepSeek 估算）
+
+    Returns:
+        估算的 token 数
+    """
+    if not text:
+        return 0
+    name = model.lower().replace("mock-", "")
+    cjk_ratio, other_ratio = next(
+        (ratio for prefix, ratio in TOKEN_RATIOS.items() if name.startswith(prefix)),
+        TOKEN_RATIOS["deepseek"],
+    )
+    cjk = len(_CJK.findall(text))
+    return int(cjk * cjk_ratio + (len(text) - cjk) * other_ratio) + 1
+
+
+def _terms(text: str) -> Set[str]:
+    """词项：英文单词（去停用词）与中文相邻二字组"""
+    lowered = text.lower()
+    terms = {word for word in _WORD.findall(lowered) if word not in _STOPWORDS}
+    for run in re.findall(r"[\u4e00-\u9fff]+", lowered):
+        terms.update(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return terms
+
+
+def _similar(a: Set[str], b: Set[str], threshold: float) -> bool:
+    if not a or not b:
+        return a == b
+    return len(a & b) / len(a | b) >= threshold
+
+
+def dedupe(passages: Sequence[str], threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[int]:
+    """
+    近似去重
+
+    Args:
+        passages: 文本段落
+        threshold: Jaccard 相似度阈值
+
+    Returns:
+        保留的段落下标（保持原顺序）
+    """
+    kept: List[int] = []
+    kept_terms: List[Set[str]] = []
+    for i, passage in enumerate(passages):
+        terms = _terms(passage)
+        if not passage.strip() or any(_similar(terms, other, threshold) for other in kept_terms):
+            continue
+        kept.append(i)
+        kept_terms.append(terms)
+    return kept
+
+
+def rank(passages: Sequence[str], query: str) -> List[int]:
+    """
+    按与查询的相关性排序：命中的查询词项越多越靠前，得分相同时保持原顺序
+
+    Returns:
+        段落下标，按相关性从高到低
+    """
+    query_terms = _terms(query)
+    scores = [len(query_terms & _terms(passage)) for passage in passages]
+    return sorted(range(len(passages)), key=lambda i: -scores[i])
+
+
+def _split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(" ".join(text.split())) if sentence.strip()]
+
+
+def budget_for(node: str) -> int:
+    """节点的上下文预算"""
+    return CONTEXT_BUDGETS.get(node, CONTEXT_DEFAULT_BUDGET)
+
+
+def record_savings(node: str, before: int, after: int) -> None:
+    """记录压缩前后的上下文 token 数"""
+    registry.inc("sma_context_tokens_total", before, "上下文 token 数（stage=before 为压缩前）", node=node, stage="before")
+    registry.inc("sma_context_tokens_total", after, "上下文 token 数（stage=before 为压缩前）", node=node, stage="after")
+    if before > after:
+        registry.inc("sma_context_tokens_saved_total", before - after, "上下文预算节省的 token 数", node=node)
+
+
+def describe_savings(before: int, after: int) -> str:
+    """步骤日志中的压缩说明，未压缩时为空"""
+    return f"，上下文 {before} → {after} tokens" if after < before else ""
+
+
+def fit_search_results(
+    results: List[Dict[str, str]],
+    query: str,
+    node: str,
+    budget: Optional[int] = None,
+    model: str = DEFAULT_MODEL
+) -> Tuple[List[Dict[str, str]], int, int]:
+    """
+    压缩搜索结果：按句去掉与前文重复的内容，预算不足时优先保留与查询相关的句子
+
+    Args:
+        results: search_results() 返回的结果列表
+        query: 搜索查询，用于相关性排序
+        node: 节点名，用于选择预算与记录指标
+        budget: token 预算，缺省时按节点读取 CONTEXT_BUDGETS
+        model: 用于估算 token 的模型
+
+    Returns:
+        (压缩后的结果列表, 压缩前 token 数, 压缩后 token 数)；结果中的句子保持原顺序
+    """
+    before = count_tokens(format_results(results, query), model)
+    if not CONTEXT_BUDGET_ENABLED or not results:
+        return results, before, before
+    if budget is None:
+        budget = budget_for(node)
+
+    # (结果下标, 句子)
+    sentences = [(r, s) for r, result in enumerate(results) for s in _split_sentences(result.get("content", ""))]
+    kept = [sentences[i] for i in dedupe([s for _, s in sentences])]
+
+    # 每条结果的标题、来源等固定部分（与 format_results 的格式一致）
+    overhead = {
+        r: count_tokens(f"[{r + 1}] {result.get('title', '')}\n来源: {result.get('url', '')}\n摘要: ...\n\n", model)
+        for r, result in enumerate(results)
+    }
+    selected: Set[int] = set()
+    used_results: Set[int] = set()
+    used = 0
+    for i in rank([s for _, s in kept], query):
+        r, sentence = kept[i]
+        cost = count_tokens(sentence, model) + (0 if r in used_results else overhead[r])
+        if used + cost > budget:
+            continue
+        used += cost
+        selected.add(i)
+        used_results.add(r)
+
+    fitted = []
+    for r, result in enumerate(results):
+        content = " ".join(s for i, (owner, s) in enumerate(kept) if owner == r and i in selected)
+        if content:
+            fitted.append(dict(result, content=content))
+    after = count_tokens(format_results(fitted, query), model)
+    if not fitted or after >= before:
+        return results, before, before
+    record_savings(node, before, after)
+    return fitted, before, after
+
+
+def fit_text(
+    text: str,
+    query: str,
+    node: str,
+    budget: Optional[int] = None,
+    model: str = DEFAULT_MODEL
+) -> Tuple[str, int, int]:
+    """
+    压缩按空行分段的长文本（如论文原始信息、全文要点）：去掉重复段落，
+    超出预算时保留与查询相关的段落，保持原顺序
+
+    Args:
+        text: 文本
+        query: 用于相关性排序的查询
+        node: 节点名，用于选择预算与记录指标
+        budget: token 预算，缺省时按节点读取 CONTEXT_BUDGETS
+        model: 用于估算 token 的模型
+
+    Returns:
+        (压缩后的文本, 压缩前 token 数, 压缩后 token 数)
+    """
+    before = count_tokens(text, model)
+    if budget is None:
+        budget = budget_for(node)
+    if not CONTEXT_BUDGET_ENABLED or not text:
+        return text, before, before
+
+    paragraphs = re.split(r"\n\s*\n", text)
+    kept = dedupe(paragraphs)
+    if len(kept) == len(paragraphs) and before <= budget:
+        return text, before, before
+
+    selected: Set[int] = set()
+    used = 0
+    for i in rank([paragraphs[k] for k in kept], query):
+        cost = count_tokens(paragraphs[kept[i]], model)
+        if used + cost > budget:
+            continue
+        used += cost
+        selected.add(kept[i])
+
+    if selected:
+        fitted = "\n\n".join(paragraphs[k] for k in kept if k in selected)
+    else:
+        # 单个段落就超出预算：按比例截断
+        fitted = text[:len(text) * budget // max(1, before)]
+    after = count_tokens(fitted, model)
+    record_savings(node, before, after)
+    return fitted, before, after
@@ -3,75 +3,407 @@ fal.ai 图片生成工具
 使用 flux/schnell 模型生成科技感配图
 """
 import os
-from typing import Optional
-from fal_client import run
-from dotenv import load_dotenv
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from tools.cache import TTLCache, default_cache_path, hash_key
+from tools.metrics import CallTimer
+from tools.singleflight import SingleFlight
+from tools.ratelimit import limited_call, alimited_call
 
-# 加载环境变量
-load_dotenv()
+if TYPE_CHECKING:
+    import fal_client
 
+# 图片 URL 缓存配置：相同 (model, prompt, aspect_ratio) 在有效期内直接返回已生成的 URL
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "86400"))
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "256"))
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", default_cache_path("image_cache.sqlite"))
 
-def generate_image(
+# 队列轮询配置（秒）
+IMAGE_POLL_INTERVAL = float(os.getenv("IMAGE_POLL_INTERVAL", "0.25"))
+IMAGE_POLL_MAX_INTERVAL = float(os.getenv("IMAGE_POLL_MAX_INTERVAL", "2.0"))
+IMAGE_TIMEOUT = float(os.getenv("IMAGE_TIMEOUT", "120"))
+IMAGE_PREFETCH_WORKERS = int(os.getenv("IMAGE_PREFETCH_WORKERS", "4"))
+
+# 模拟图片生成（缺少 FAL_KEY 且 use_mock=True 时使用）
+MOCK_IMAGE_URL = "https://example.com/mock-image.png"
+MOCK_IMAGE_LATENCY = float(os.getenv("MOCK_IMAGE_LATENCY", "0"))
+
+_lock = threading.Lock()
+_sync_client: Optional["fal_client.SyncClient"] = None
+_async_client: Optional["fal_client.AsyncClient"] = None
+_image_cache: Optional[TTLCache] = None
+# 模拟结果仅保存在内存中，避免写入持久化缓存
+_mock_image_cache = TTLCache(max_entries=IMAGE_CACHE_MAX_ENTRIES, ttl=IMAGE_CACHE_TTL, namespace="image-mock")
+_prefetch_executor: Optional[ThreadPoolExecutor] = None
+# 已提交、尚未完成的预取（按缓存键），在提交前登记，避免连续的相同预取占用多个 worker
+_prefetching: set = set()
+_in_flight = SingleFlight()
+
+
+def _get_api_key() -> str:
+    """读取 FAL_KEY"""
+    api_key = os.getenv("FAL_KEY")
+
+    if not api_key:
+        raise ValueError(
+            "FAL_KEY 未设置。请在 .env 文件中设置 FAL_KEY"
+        )
+    return api_key
+
+
+def _get_sync_client() -> "fal_client.SyncClient":
+    """获取进程内复用的 fal.ai 同步客户端（显式传入 key，不再改写环境变量；首次使用时才导入 fal_client）"""
+    import fal_client
+    global _sync_client
+    api_key = _get_api_key()
+    with _lock:
+        if _sync_client is None or _sync_client.key != api_key:
+            _sync_client = fal_client.SyncClient(key=api_key)
+        return _sync_client
+
+
+def _get_async_client() -> "fal_client.AsyncClient":
+    """获取进程内复用的 fal.ai 异步客户端"""
+    import fal_client
+    global _async_client
+    api_key = _get_api_key()
+    with _lock:
+        if _async_client is None or _async_client.key != api_key:
+            _async_client = fal_client.AsyncClient(key=api_key)
+        return _async_client
+
+
+def get_image_cache() -> TTLCache:
+    """
+    获取图片 URL 缓存（惰性创建）
+
+    Returns:
+        TTLCache 实例
+    """
+    global _image_cache
+    with _lock:
+        if _image_cache is None:
+            _image_cache = TTLCache(
+                max_entries=IMAGE_CACHE_MAX_ENTRIES,
+                ttl=IMAGE_CACHE_TTL,
+                db_path=IMAGE_CACHE_PATH or None,
+                namespace="image",
+            )
+        return _image_cache
+
+
+def _cache_key(prompt: str, model: str, aspect_ratio: str, mock: bool = False) -> str:
+    """按 (model, prompt, aspect_ratio) 计算内容寻址的键"""
+    return hash_key({"model": model, "prompt": prompt, "aspect_ratio": aspect_ratio, "mock": mock})
+
+
+def _use_mock(use_mock: bool) -> bool:
+    """缺少 FAL_KEY 时，use_mock=True 则使用模拟图片，否则报错"""
+    if os.getenv("FAL_KEY"):
+        return False
+    if use_mock:
+        return True
+    _get_api_key()
+    return False
+
+
+def _cache_for(mock: bool) -> TTLCache:
+    """选择真实或模拟结果对应的缓存"""
+    return _mock_image_cache if mock else get_image_cache()
+
+
+def _build_arguments(prompt: str, aspect_ratio: str) -> Dict[str, Any]:
+    """构建 fal.ai 模型调用参数"""
+    return {
+        "prompt": prompt,
+        "aspect_ratio": aspect_ratio,
+        "num_images": 1,
+    }
+
+
+def _extract_image_url(result: Any) -> str:
+    """
+    从 fal.ai 返回结果中提取图片 URL
+
+    Args:
+        result: fal.ai 返回结果
+
+    Returns:
+        图片 URL
+    """
+    # fal.ai 返回格式可能是 {"images": [{"url": "..."}]} 或直接返回 URL
+    if isinstance(result, dict):
+        images = result.get("images", [])
+        if images and len(images) > 0:
+            image_data = images[0]
+            if isinstance(image_data, dict):
+                image_url = image_data.get("url", "")
+            else:
+                image_url = str(image_data)
+            if image_url:
+                return image_url
+        # 如果直接返回 URL
+        if "url" in result:
+            return result["url"]
+
+    # 如果 result 是字符串，直接返回
+    if isinstance(result, str):
+        return result
+
+    raise ValueError("生成图片失败：未返回有效的图片 URL")
+
+
+def submit_image(
     prompt: str,
     model: str = "fal-ai/flux/schnell",
     aspect_ratio: str = "4:3"
 ) -> str:
     """
-    使用 fal.ai 生成图片
-    
+    向 fal.ai 队列提交图片生成请求，立即返回
+
     Args:
         prompt: 图片生成提示词
         model: 模型名称，默认为 flux/schnell
         aspect_ratio: 图片比例，默认为 4:3
-    
+
+    Returns:
+        fal.ai 队列请求 ID
+    """
+    handle = _get_sync_client().submit(model, arguments=_build_arguments(prompt, aspect_ratio))
+    return handle.request_id
+
+
+async def asubmit_image(
+    prompt: str,
+    model: str = "fal-ai/flux/schnell",
+    aspect_ratio: str = "4:3"
+) -> str:
+    """
+    submit_image() 的异步版本
+
+    Returns:
+        fal.ai 队列请求 ID
+    """
+    handle = await _get_async_client().submit(model, arguments=_build_arguments(prompt, aspect_ratio))
+    return handle.request_id
+
+
+def poll_image(model: str, request_id: str, timeout: float = IMAGE_TIMEOUT) -> str:
+    """
+    轮询 fal.ai 队列直到请求完成，轮询间隔逐步拉长
+
+    Args:
+        model: 模型名称
+        request_id: submit_image() 返回的请求 ID
+        timeout: 最长等待时间（秒）
+
     Returns:
         生成的图片 URL
     """
-    api_key = os.getenv("FAL_KEY")
-    
-    if not api_key:
-        raise ValueError(
-            "FAL_KEY 未设置。请在 .env 文件中设置 FAL_KEY"
+    import fal_client
+    handle = _get_sync_client().get_handle(model, request_id)
+    deadline = time.monotonic() + timeout
+    interval = IMAGE_POLL_INTERVAL
+    while not isinstance(handle.status(), fal_client.Completed):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"fal.ai 请求 {request_id} 在 {timeout:.0f}s 内未完成")
+        time.sleep(interval)
+        interval = min(interval * 1.5, IMAGE_POLL_MAX_INTERVAL)
+    return _extract_image_url(handle.get())
+
+
+async def apoll_image(model: str, request_id: str, timeout: float = IMAGE_TIMEOUT) -> str:
+    """
+    poll_image() 的异步版本，等待期间不阻塞事件循环
+
+    Returns:
+        生成的图片 URL
+    """
+    import fal_client
+    handle = _get_async_client().get_handle(model, request_id)
+    deadline = time.monotonic() + timeout
+    interval = IMAGE_POLL_INTERVAL
+    while not isinstance(await handle.status(), fal_client.Completed):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"fal.ai 请求 {request_id} 在 {timeout:.0f}s 内未完成")
+        await asyncio.sleep(interval)
+        interval = min(interval * 1.5, IMAGE_POLL_MAX_INTERVAL)
+    return _extract_image_url(await handle.get())
+
+
+def _generate(
+    prompt: str,
+    model: str,
+    aspect_ratio: str,
+    key: str,
+    mock: bool,
+    timer: Optional[CallTimer] = None
+) -> str:
+    """在 fal.ai 限流下提交并等待生成（被限流时退避重试），成功后写入 URL 缓存"""
+    if mock:
+        time.sleep(MOCK_IMAGE_LATENCY)
+        image_url = MOCK_IMAGE_URL
+    else:
+        image_url = limited_call(
+            "fal",
+            lambda: poll_image(model, submit_image(prompt, model, aspect_ratio)),
+            timer=timer
         )
-    
-    try:
-        # fal_client 会自动从环境变量 FAL_KEY 读取 API key
-        # 确保环境变量已设置
-        os.environ["FAL_KEY"] = api_key
-        
-        # 调用模型生成图片
-        # 使用 run() 同步调用
-        result = run(
-            model,
-            arguments={
-                "prompt": prompt,
-                "aspect_ratio": aspect_ratio,
-                "num_images": 1,
-            }
+    if IMAGE_CACHE_ENABLED:
+        _cache_for(mock).set(key, image_url)
+    return image_url
+
+
+async def _asubmit_and_poll(prompt: str, model: str, aspect_ratio: str) -> str:
+    """异步提交并轮询至完成"""
+    return await apoll_image(model, await asubmit_image(prompt, model, aspect_ratio))
+
+
+async def _agenerate(
+    prompt: str,
+    model: str,
+    aspect_ratio: str,
+    key: str,
+    mock: bool,
+    timer: Optional[CallTimer] = None
+) -> str:
+    """_generate() 的异步版本"""
+    if mock:
+        await asyncio.sleep(MOCK_IMAGE_LATENCY)
+        image_url = MOCK_IMAGE_URL
+    else:
+        image_url = await alimited_call(
+            "fal",
+            lambda: _asubmit_and_poll(prompt, model, aspect_ratio),
+            timer=timer
         )
-        
-        # 提取图片 URL
-        # fal.ai 返回格式可能是 {"images": [{"url": "..."}]} 或直接返回 URL
-        if isinstance(result, dict):
-            images = result.get("images", [])
-            if images and len(images) > 0:
-                image_data = images[0]
-                if isinstance(image_data, dict):
-                    image_url = image_data.get("url", "")
-                else:
-                    image_url = str(image_data)
-                if image_url:
-                    return image_url
-            # 如果直接返回 URL
-            if "url" in result:
-                return result["url"]
-        
-        # 如果 result 是字符串，直接返回
-        if isinstance(result, str):
-            return result
-        
-        raise ValueError("生成图片失败：未返回有效的图片 URL")
-        
-    except Exception as e:
-        error_msg = f"fal.ai 图片生成失败: {str(e)}"
-        raise RuntimeError(error_msg) from e
+    if IMAGE_CACHE_ENABLED:
+        _cache_for(mock).set(key, image_url)
+    return image_url
+
+
+def prefetch_image(
+    prompt: str,
+    model: str = "fal-ai/flux/schnell",
+    aspect_ratio: str = "4:3",
+    use_mock: bool = False
+) -> None:
+    """
+    在后台线程中提前生成图片，立即返回
+
+    之后参数相同的 generate_image / agenerate_image 调用会合并到这次进行中的请求，
+    或在其完成后直接命中 URL 缓存，使图片生成与文案的生成、审查并行进行。
+
+    Args:
+        prompt: 图片生成提示词
+        model: 模型名称，默认为 flux/schnell
+        aspect_ratio: 图片比例，默认为 4:3
+        use_mock: 如果为 True，在缺少 FAL_KEY 时使用模拟图片
+    """
+    global _prefetch_executor
+    mock = _use_mock(use_mock)
+    key = _cache_key(prompt, model, aspect_ratio, mock)
+    if IMAGE_CACHE_ENABLED and _cache_for(mock).get(key) is not None:
+        return
+    with _lock:
+        if key in _prefetching or _in_flight.in_flight(key):
+            return
+        _prefetching.add(key)
+        if _prefetch_executor is None:
+            _prefetch_executor = ThreadPoolExecutor(
+                max_workers=IMAGE_PREFETCH_WORKERS,
+                thread_name_prefix="image-prefetch"
+            )
+    _prefetch_executor.submit(_run_prefetch, key, prompt, model, aspect_ratio, use_mock)
+
+
+def _run_prefetch(key: str, prompt: str, model: str, aspect_ratio: str, use_mock: bool) -> None:
+    """在预取线程中生成图片，完成后注销预取登记"""
+    try:
+        generate_image(prompt, model, aspect_ratio, use_mock)
+    finally:
+        with _lock:
+            _prefetching.discard(key)
+
+
+def generate_image(
+    prompt: str,
+    model: str = "fal-ai/flux/schnell",
+    aspect_ratio: str = "4:3",
+    use_mock: bool = False
+) -> str:
+    """
+    使用 fal.ai 生成图片
+
+    通过 fal.ai 队列接口提交并轮询结果。相同 (model, prompt, aspect_ratio) 的结果会缓存，
+    有效期内直接返回；同时进行中的相同请求只会提交一次。
+
+    Args:
+        prompt: 图片生成提示词
+        model: 模型名称，默认为 flux/schnell
+        aspect_ratio: 图片比例，默认为 4:3
+        use_mock: 如果为 True，在缺少 FAL_KEY 时返回模拟图片 URL（仅用于测试）
+
+    Returns:
+        生成的图片 URL
+    """
+    mock = _use_mock(use_mock)
+    key = _cache_key(prompt, model, aspect_ratio, mock)
+    with CallTimer("image", "mock" if mock else "fal", model=model) as timer:
+        if IMAGE_CACHE_ENABLED:
+            cached = _cache_for(mock).get(key)
+            if cached is not None:
+                timer.cached = True
+                return cached
+
+        try:
+            image_url, timer.coalesced = _in_flight.do_shared(
+                key, _generate, prompt, model, aspect_ratio, key, mock, timer
+            )
+            return image_url
+
+        except Exception as e:
+            error_msg = f"fal.ai 图片生成失败: {str(e)}"
+            raise RuntimeError(error_msg) from e
+
+
+async def agenerate_image(
+    prompt: str,
+    model: str = "fal-ai/flux/schnell",
+    aspect_ratio: str = "4:3",
+    use_mock: bool = False
+) -> str:
+    """
+    generate_image() 的异步版本：异步提交、轮询，缓存与请求合并语义相同
+
+    Args:
+        prompt: 图片生成提示词
+        model: 模型名称，默认为 flux/schnell
+        aspect_ratio: 图片比例，默认为 4:3
+        use_mock: 如果为 True，在缺少 FAL_KEY 时返回模拟图片 URL（仅用于测试）
+
+    Returns:
+        生成的图片 URL
+    """
+    mock = _use_mock(use_mock)
+    key = _cache_key(prompt, model, aspect_ratio, mock)
+    with CallTimer("image", "mock" if mock else "fal", model=model) as timer:
+        if IMAGE_CACHE_ENABLED:
+            cached = _cache_for(mock).get(key)
+            if cached is not None:
+                timer.cached = True
+                return cached
+
+        try:
+            image_url, timer.coalesced = await _in_flight.ado_shared(
+                key, _agenerate, prompt, model, aspect_ratio, key, mock, timer
+            )
+            return image_url
+
+        except Exception as e:
+            error_msg = f"fal.ai 图片生成失败: {str(e)}"
+            raise RuntimeError(error_msg) from e
@@ -0,0 +1,179 @@
+"""
+结构化调试事件记录
+事件先进入内存队列，由后台线程批量写入 JSON Lines 文件，不阻塞搜索和 LLM 调用
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import threading
+from typing import Any, Dict, List, Optional
+
+# 事件输出路径，为空时完全禁用（log_event 直接返回）
+DEBUG_LOG_PATH = os.getenv("DEBUG_LOG_PATH", "")
+# 采样率：0~1，1 表示记录全部事件
+DEBUG_LOG_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "1.0"))
+DEBUG_LOG_SESSION = os.getenv("DEBUG_LOG_SESSION", "debug-session")
+DEBUG_LOG_BATCH_SIZE = int(os.getenv("DEBUG_LOG_BATCH_SIZE", "256"))
+DEBUG_LOG_FLUSH_INTERVAL = float(os.getenv("DEBUG_LOG_FLUSH_INTERVAL", "1.0"))
+DEBUG_LOG_QUEUE_SIZE = int(os.getenv("DEBUG_LOG_QUEUE_SIZE", "10000"))
+
+
+class EventSink:
+    """队列 + 后台写线程的事件落盘器"""
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = DEBUG_LOG_BATCH_SIZE,
+        flush_interval: float = DEBUG_LOG_FLUSH_INTERVAL,
+        queue_size: int = DEBUG_LOG_QUEUE_SIZE
+    ):
+        """
+        Args:
+            path: JSON Lines 输出文件路径
+            batch_size: 单次写入的最大事件数
+            flush_interval: 最长刷新间隔（秒）
+            queue_size: 队列容量，写满后丢弃新事件
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+        self._thread.start()
+
+    def put(self, event: Dict[str, Any]) -> None:
+        """非阻塞入队，队列已满时丢弃并计数"""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """将一批事件一次性追加到文件"""
+        if not batch:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in batch))
+        except OSError:
+            self.dropped += len(batch)
+
+    def _run(self) -> None:
+        """后台写线程：攒批后写入，收到 None 时退出"""
+        while True:
+            try:
+                event = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if event is None:
+                return
+            batch = [event]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event)
+            self._write(batch)
+            if stop:
+                return
+
+    def close(self, timeout: float = 5.0) -> None:
+        """写出剩余事件并停止后台线程"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+_sink: Optional[EventSink] = None
+_sample_rate: float = DEBUG_LOG_SAMPLE_RATE
+_lock = threading.Lock()
+
+
+def configure(path: Optional[str] = None, sample_rate: Optional[float] = None) -> None:
+    """
+    配置事件输出
+
+    Args:
+        path: 输出文件路径，传入空字符串则禁用记录
+        sample_rate: 采样率（0~1）
+    """
+    global _sink, _sample_rate
+    with _lock:
+        if sample_rate is not None:
+            _sample_rate = sample_rate
+        if path is not None:
+            if _sink is not None:
+                _sink.close()
+            _sink = EventSink(path) if path else None
+
+
+def enabled() -> bool:
+    """是否启用了事件记录"""
+    return _sink is not None
+
+
+def log_event(
+    location: str,
+    message: str,
+    data: Optional[Dict[str, Any]] = None,
+    hypothesis_id: str = "",
+    run_id: str = ""
+) -> None:
+    """
+    记录一条结构化调试事件
+
+    禁用时直接返回；启用时只做采样判断和入队，文件 I/O 在后台线程完成。
+
+    Args:
+        location: 事件位置，如 "tools/search.py:search_results"
+        message: 事件描述
+        data: 附加数据
+        hypothesis_id: 调试假设编号
+        run_id: 运行编号
+    """
+    sink = _sink
+    if sink is None:
+        return
+    if _sample_rate < 1.0 and random.random() >= _sample_rate:
+        return
+    sink.put({
+        "sessionId": DEBUG_LOG_SESSION,
+        "runId": run_id,
+        "hypothesisId": hypothesis_id,
+        "location": location,
+        "message": message,
+        "data": data or {},
+        "timestamp": int(time.time() * 1000),
+    })
+
+
+def shutdown() -> None:
+    """写出所有排队中的事件并停止记录（进程退出时自动调用）"""
+    global _sink
+    with _lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+
+if DEBUG_LOG_PATH:
+    configure(DEBUG_LOG_PATH)
+
+atexit.register(shutdown)
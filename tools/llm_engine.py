@@ -1,11 +1,124 @@
 import os
-import json
-from typing import Optional, Any, List, Dict
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Optional, Any, Awaitable, Iterator, List, Dict, Tuple
+from tools.instrumentation import log_event
+from tools.cache import TTLCache, hash_key
+from tools.metrics import CallTimer, cache_hit_tokens, token_usage
+from tools.singleflight import SingleFlight
+from tools.ratelimit import RATE_LIMIT_ENABLED, is_throttle_error, limited_call, alimited_call
+from tools.retry import CallPolicy, is_transient_error
+from tools.context_budget import count_tokens
 
-# 加载环境变量
-load_dotenv()
+if TYPE_CHECKING:
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+# DeepSeek 接入点（兼容 OpenAI 协议）
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+# 共享 HTTP 连接池配置，可通过环境变量调整
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+# 进程级客户端注册表：所有节点共享同一个连接池，避免每次调用都重新握手
+_registry_lock = threading.RLock()
+_http_client: Optional["httpx.Client"] = None
+_http_async_client: Optional["httpx.AsyncClient"] = None
+_llm_registry: Dict[Tuple[str, float, str, str], "ChatOpenAI"] = {}
+
+# 响应缓存配置（默认关闭）；LLM_CACHE_PATH 为空时仅使用内存层
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+
+_llm_cache: Optional[TTLCache] = None
+
+# 合并相同的进行中请求：并发的相同 (model, temperature, 消息) 只调用一次 LLM
+LLM_SINGLEFLIGHT = os.getenv("LLM_SINGLEFLIGHT", "1").lower() in ("1", "true", "yes")
+_in_flight = SingleFlight()
+
+# 调用策略：瞬时故障的重试次数与退避（秒）、整次调用的截止时间（秒，0 为不限制）；
+# 单次请求的 HTTP 超时取 LLM_TIMEOUT 与 LLM_DEADLINE 中较小者，同步调用不对冲时由它限制单次请求的耗时
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+LLM_RETRY_MAX_BACKOFF = float(os.getenv("LLM_RETRY_MAX_BACKOFF", "8"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "300"))
+# 对冲请求（默认关闭）：超过近期延迟的 LLM_HEDGE_QUANTILE 分位仍未返回时再发一个相同请求
+LLM_HEDGE = os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+_policies: Dict[Tuple[str, str], CallPolicy] = {}
+
+# MockLLM 的模拟延迟（秒），用于离线基准测试
+MOCK_LLM_LATENCY = float(os.getenv("MOCK_LLM_LATENCY", "0"))
+
+# 带该标签的调用不输出到流（如多话题简报的 map 阶段）：LangGraph 的 messages 流跳过带此标签的模型调用，
+# custom 流由 emit_stream_text 跳过
+NOSTREAM_TAG = "nostream"
+_stream_muted: contextvars.ContextVar[bool] = contextvars.ContextVar("stream_muted", default=False)
+
+
+def nostream_config(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    为调用配置加上 NOSTREAM_TAG，使该次调用的输出不进入 messages / custom 流
+    
+    Args:
+        config: 原调用配置
+    
+    Returns:
+        新的调用配置
+    """
+    config = dict(config or {})
+    config["tags"] = list(config.get("tags") or []) + [NOSTREAM_TAG]
+    return config
+
+
+def is_nostream(tags: Optional[List[str]]) -> bool:
+    """标签中是否包含 NOSTREAM_TAG"""
+    return NOSTREAM_TAG in (tags or [])
+
+
+@contextmanager
+def _stream_scope(kwargs: Dict[str, Any]) -> Iterator[None]:
+    """调用配置带 NOSTREAM_TAG 时，在调用期间关闭 custom 流输出"""
+    if not is_nostream((kwargs.get("config") or {}).get("tags")):
+        yield
+        return
+    token = _stream_muted.set(True)
+    try:
+        yield
+    finally:
+        _stream_muted.reset(token)
+
+
+def emit_stream_text(text: str) -> None:
+    """
+    将一段文本写入 LangGraph 的 custom 流
+    
+    MockLLM 和缓存命中不会经过 ChatOpenAI 的流式回调，因此通过 custom 流输出，
+    使 graph.stream(stream_mode=["messages", "custom"]) 的调用方同样能增量拿到文本。
+    不在图内运行或当前调用带 NOSTREAM_TAG 时直接忽略。
+    
+    Args:
+        text: 要输出的文本片段
+    """
+    if _stream_muted.get():
+        return
+    try:
+        from langgraph.config import get_config, get_stream_writer
+        writer = get_stream_writer()
+        node = get_config().get("metadata", {}).get("langgraph_node", "")
+    except Exception:
+        return
+    writer({"type": "token", "node": node, "content": text})
 
 
 class MockLLM:
@@ -15,8 +128,20 @@ class MockLLM:
         self.model = model
         self.temperature = temperature
     
-    def invoke(self, messages: List[Dict[str, str]]) -> Any:
-        """返回模拟响应"""
+    def invoke(self, messages: List[Dict[str, str]], **kwargs) -> Any:
+        """返回模拟响应（按 MOCK_LLM_LATENCY 模拟网络延迟）"""
+        if MOCK_LLM_LATENCY > 0:
+            time.sleep(MOCK_LLM_LATENCY)
+        return self._respond(messages)
+    
+    async def ainvoke(self, messages: List[Dict[str, str]], **kwargs) -> Any:
+        """异步返回模拟响应，模拟延迟期间不阻塞事件循环"""
+        if MOCK_LLM_LATENCY > 0:
+            await asyncio.sleep(MOCK_LLM_LATENCY)
+        return self._respond(messages)
+    
+    def _respond(self, messages: List[Dict[str, str]]) -> Any:
+        """根据消息内容构建模拟响应"""
         # 从消息中提取内容，生成模拟响应
         user_message = ""
         for msg in messages:
@@ -76,14 +201,327 @@ class MockLLM:
             def __init__(self, content: str):
                 self.content = content
         
+        # 按行输出到 custom 流，模拟逐步生成
+        for line in mock_content.splitlines(keepends=True):
+            emit_stream_text(line)
+        
         return MockResponse(mock_content)
 
 
+class CachedResponse:
+    """缓存命中时返回的响应对象，与 ChatOpenAI 响应一样提供 content 属性"""
+    
+    def __init__(self, content: str):
+        self.content = content
+
+
+def _normalize_messages(messages: List[Any]) -> List[Dict[str, str]]:
+    """
+    规范化消息列表，用于计算缓存键
+    
+    同时支持 dict 消息和 LangChain 消息对象，去除首尾空白，
+    使仅有空白差异的请求命中同一缓存条目。
+    """
+    normalized = []
+    for msg in messages:
+        if isinstance(msg, dict):
+            role = msg.get("role", "")
+            content = msg.get("content", "")
+        else:
+            role = getattr(msg, "type", "")
+            content = getattr(msg, "content", "")
+        if isinstance(content, str):
+            content = "\n".join(line.rstrip() for line in content.strip().splitlines())
+        normalized.append({"role": role, "content": content})
+    return normalized
+
+
+def _request_kwargs(kwargs: Dict[str, Any], hedged: bool) -> Dict[str, Any]:
+    """对冲请求不挂载回调，避免与主请求重复输出到 messages 流"""
+    if not hedged:
+        return kwargs
+    config = dict(kwargs.get("config") or {})
+    config["callbacks"] = []
+    return dict(kwargs, config=config)
+
+
+def _emit_response(response: Any) -> None:
+    """对冲请求胜出时，将完整文本输出到 custom 流"""
+    emit_stream_text(response.content if hasattr(response, 'content') else str(response))
+
+
+def _is_retryable(error: BaseException) -> bool:
+    """瞬时故障可重试；429 / 5xx 已由限流器退避重试，仅在关闭限流时由调用策略重试"""
+    return is_transient_error(error) or (not RATE_LIMIT_ENABLED and is_throttle_error(error))
+
+
+def get_call_policy(provider: str, model: str) -> CallPolicy:
+    """
+    获取 (provider, model) 的调用策略（进程内共享，延迟样本按模型分别统计）
+    
+    Returns:
+        CallPolicy 实例
+    """
+    with _registry_lock:
+        policy = _policies.get((provider, model))
+        if policy is None:
+            policy = CallPolicy(
+                "llm",
+                provider,
+                max_retries=LLM_MAX_RETRIES,
+                backoff=LLM_RETRY_BACKOFF,
+                max_backoff=LLM_RETRY_MAX_BACKOFF,
+                deadline=LLM_DEADLINE,
+                hedge=LLM_HEDGE,
+                hedge_quantile=LLM_HEDGE_QUANTILE,
+                hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+                retryable=_is_retryable,
+            )
+            _policies[(provider, model)] = policy
+        return policy
+
+
+def _estimate_tokens(messages: List[Any], model: str) -> int:
+    """按模型估算输入 token 数，用于预留每分钟 token 配额"""
+    return sum(count_tokens(str(msg["content"]), model) for msg in _normalize_messages(messages))
+
+
+def get_llm_cache() -> TTLCache:
+    """
+    获取进程内共享的 LLM 响应缓存（惰性创建）
+    
+    Returns:
+        TTLCache 实例
+    """
+    global _llm_cache
+    with _registry_lock:
+        if _llm_cache is None:
+            _llm_cache = TTLCache(
+                max_entries=LLM_CACHE_MAX_ENTRIES,
+                ttl=LLM_CACHE_TTL,
+                db_path=LLM_CACHE_PATH or None,
+                namespace="llm",
+            )
+        return _llm_cache
+
+
+def llm_cache_stats() -> Dict[str, int]:
+    """
+    获取 LLM 响应缓存的命中统计
+    
+    Returns:
+        包含 hits/misses/disk_hits/evictions/size 的字典
+    """
+    return get_llm_cache().stats()
+
+
+class ManagedLLM:
+    """
+    LLM 包装器
+    
+    在底层 LLM 之上提供内容寻址的响应缓存：以 (model, temperature, 规范化消息) 的哈希为键，
+    相同请求直接返回缓存结果，并发的相同请求合并为一次调用；实际请求经过服务商限流，
+    并按调用策略重试瞬时故障、遵守截止时间，可选对冲慢请求；
+    每次调用的耗时与 token 用量写入运行指标。其余属性透传给底层 LLM。
+    """
+    
+    def __init__(
+        self,
+        llm: Any,
+        model: str,
+        temperature: float,
+        cache: Optional[TTLCache] = None,
+        provider: str = "deepseek"
+    ):
+        self.llm = llm
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache
+        self.provider = provider
+    
+    def cache_key(self, messages: List[Any]) -> str:
+        """计算请求的缓存键"""
+        return hash_key({
+            "model": self.model,
+            "temperature": self.temperature,
+            "messages": _normalize_messages(messages),
+        })
+    
+    def invoke(self, messages: List[Any], **kwargs) -> Any:
+        """调用 LLM，命中缓存时跳过网络请求"""
+        with _stream_scope(kwargs), CallTimer("llm", self.provider, model=self.model) as timer:
+            key = self.cache_key(messages) if self.cache is not None or LLM_SINGLEFLIGHT else None
+            if self.cache is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    timer.cached = True
+                    emit_stream_text(cached)
+                    return CachedResponse(cached)
+            
+            if LLM_SINGLEFLIGHT:
+                response, shared = _in_flight.do_shared(key, self._invoke, messages, timer, **kwargs)
+            else:
+                response, shared = self._invoke(messages, timer, **kwargs), False
+            return self._finish(key, response, shared, timer)
+    
+    async def ainvoke(self, messages: List[Any], **kwargs) -> Any:
+        """异步调用 LLM，命中缓存时跳过网络请求"""
+        with _stream_scope(kwargs), CallTimer("llm", self.provider, model=self.model) as timer:
+            key = self.cache_key(messages) if self.cache is not None or LLM_SINGLEFLIGHT else None
+            if self.cache is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    timer.cached = True
+                    emit_stream_text(cached)
+                    return CachedResponse(cached)
+            
+            if LLM_SINGLEFLIGHT:
+                response, shared = await _in_flight.ado_shared(key, self._ainvoke, messages, timer, **kwargs)
+            else:
+                response, shared = await self._ainvoke(messages, timer, **kwargs), False
+            return self._finish(key, response, shared, timer)
+    
+    def _invoke(self, messages: List[Any], timer: CallTimer, **kwargs) -> Any:
+        """按调用策略（重试、截止时间、对冲）调用底层 LLM，每次请求都经过服务商限流"""
+        def attempt(hedged: bool) -> Any:
+            return limited_call(
+                self.provider,
+                lambda: self.llm.invoke(messages, **_request_kwargs(kwargs, hedged)),
+                estimated_tokens=_estimate_tokens(messages, self.model),
+                usage=lambda response: sum(token_usage(response)),
+                timer=timer
+            )
+        
+        return get_call_policy(self.provider, self.model).call(
+            attempt, timer=timer, hedge=self.provider != "mock", on_hedge_win=_emit_response
+        )
+    
+    async def _ainvoke(self, messages: List[Any], timer: CallTimer, **kwargs) -> Any:
+        """_invoke() 的异步版本"""
+        def attempt(hedged: bool) -> Awaitable[Any]:
+            return alimited_call(
+                self.provider,
+                lambda: self.llm.ainvoke(messages, **_request_kwargs(kwargs, hedged)),
+                estimated_tokens=_estimate_tokens(messages, self.model),
+                usage=lambda response: sum(token_usage(response)),
+                timer=timer
+            )
+        
+        return await get_call_policy(self.provider, self.model).acall(
+            attempt, timer=timer, hedge=self.provider != "mock", on_hedge_win=_emit_response
+        )
+    
+    def _finish(self, key: Optional[str], response: Any, shared: bool, timer: CallTimer) -> Any:
+        """
+        记录用量并写入缓存
+        
+        合并到其他调用方的请求不产生新的 token 消耗，其 token 流也只推送给发起方，
+        因此这里把完整文本输出到 custom 流，由发起方负责写缓存。
+        """
+        content = response.content if hasattr(response, 'content') else str(response)
+        if shared:
+            timer.coalesced = True
+            emit_stream_text(content)
+            return response
+        timer.prompt_tokens, timer.completion_tokens = token_usage(response)
+        timer.cache_hit_tokens = cache_hit_tokens(response)
+        if self.cache is not None:
+            self.cache.set(key, content)
+        return response
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+
+def _request_timeout() -> float:
+    """单次 HTTP 请求的超时（秒）：不超过整次调用的截止时间"""
+    return min(LLM_TIMEOUT, LLM_DEADLINE) if LLM_DEADLINE > 0 else LLM_TIMEOUT
+
+
+def _pool_limits() -> "httpx.Limits":
+    """按当前配置构建连接池限制"""
+    import httpx
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+def _get_http_client() -> "httpx.Client":
+    """
+    获取进程内共享的 HTTP 客户端（惰性创建）
+    
+    Returns:
+        带连接池和 keep-alive 的 httpx.Client 实例
+    """
+    import httpx
+    global _http_client
+    with _registry_lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(limits=_pool_limits(), timeout=httpx.Timeout(_request_timeout()))
+        return _http_client
+
+
+def _get_http_async_client() -> "httpx.AsyncClient":
+    """
+    获取进程内共享的异步 HTTP 客户端（惰性创建），供 ainvoke 使用
+    
+    Returns:
+        带连接池和 keep-alive 的 httpx.AsyncClient 实例
+    """
+    import httpx
+    global _http_async_client
+    with _registry_lock:
+        if _http_async_client is None or _http_async_client.is_closed:
+            _http_async_client = httpx.AsyncClient(limits=_pool_limits(), timeout=httpx.Timeout(_request_timeout()))
+        return _http_async_client
+
+
+def configure_http_pool(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None
+) -> None:
+    """
+    调整共享连接池参数
+    
+    会关闭现有连接池并清空客户端注册表，之后的 get_llm() 调用按新参数重建。
+    
+    Args:
+        max_connections: 最大连接数
+        max_keepalive_connections: 最大保活连接数
+        keepalive_expiry: 空闲连接保活时长（秒）
+    """
+    global LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY
+    with _registry_lock:
+        if max_connections is not None:
+            LLM_MAX_CONNECTIONS = max_connections
+        if max_keepalive_connections is not None:
+            LLM_MAX_KEEPALIVE_CONNECTIONS = max_keepalive_connections
+        if keepalive_expiry is not None:
+            LLM_KEEPALIVE_EXPIRY = keepalive_expiry
+        close_llm_clients()
+
+
+def close_llm_clients() -> None:
+    """关闭共享连接池并清空客户端注册表"""
+    global _http_client, _http_async_client
+    with _registry_lock:
+        _llm_registry.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        # 异步客户端需要在事件循环中关闭，这里仅释放引用，由垃圾回收关闭连接
+        _http_async_client = None
+
+
 def get_llm(
     model: str = "deepseek-chat",
     temperature: float = 0.7,
     api_key: Optional[str] = None,
-    use_mock: bool = False
+    use_mock: bool = False,
+    use_cache: Optional[bool] = None
 ) -> Any:
     """
     获取 DeepSeek-V3 LLM 实例或模拟 LLM
@@ -93,34 +531,38 @@ def get_llm(
         temperature: 温度参数，控制输出的随机性
         api_key: API Key，如果不提供则从环境变量读取
         use_mock: 如果为 True，返回模拟 LLM（用于测试）
+        use_cache: 是否启用响应缓存，默认读取 LLM_CACHE_ENABLED 环境变量
     
     Returns:
-        ChatOpenAI 实例或 MockLLM 实例
+        ManagedLLM 实例（包装 ChatOpenAI，或在 use_mock=True 时包装 MockLLM）
+    
+    Note:
+        ChatOpenAI 实例按 (model, temperature, base_url) 在进程内复用，
+        并共享同一个 HTTP 连接池，重复调用不会重新建立 TLS 连接。
     """
-    # #region agent log
-    try:
-        with open('/workspaces/social-media-assistant/.cursor/debug.log', 'a') as f:
-            f.write(json.dumps({"sessionId":"debug-session","runId":"llm-check","hypothesisId":"B","location":"tools/llm_engine.py:45","message":"Checking DEEPSEEK_API_KEY","data":{"use_mock":use_mock},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-    except: pass
-    # #endregion
+    log_event(
+        "tools/llm_engine.py:get_llm", "Checking DEEPSEEK_API_KEY", {"use_mock": use_mock},
+        hypothesis_id="B", run_id="llm-check"
+    )
     
     if use_mock:
-        # #region agent log
-        try:
-            with open('/workspaces/social-media-assistant/.cursor/debug.log', 'a') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"llm-check","hypothesisId":"B","location":"tools/llm_engine.py:50","message":"Using mock LLM","data":{"model":model},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
-        # #endregion
-        return MockLLM(model=model, temperature=temperature)
+        log_event(
+            "tools/llm_engine.py:get_llm", "Using mock LLM", {"model": model},
+            hypothesis_id="B", run_id="llm-check"
+        )
+        return ManagedLLM(
+            MockLLM(model=model, temperature=temperature),
+            model=model,
+            temperature=temperature,
+            provider="mock",
+        )
     
     api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
     
-    # #region agent log
-    try:
-        with open('/workspaces/social-media-assistant/.cursor/debug.log', 'a') as f:
-            f.write(json.dumps({"sessionId":"debug-session","runId":"llm-check","hypothesisId":"B","location":"tools/llm_engine.py:60","message":"API key check result","data":{"has_key":bool(api_key)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-    except: pass
-    # #endregion
+    log_event(
+        "tools/llm_engine.py:get_llm", "API key check result", {"has_key": bool(api_key)},
+        hypothesis_id="B", run_id="llm-check"
+    )
     
     if not api_key:
         raise ValueError(
@@ -128,9 +570,31 @@ def get_llm(
             "或通过参数传入 api_key，或使用 use_mock=True 进行测试"
         )
     
-    return ChatOpenAI(
+    # 仅在真正需要 DeepSeek 时导入 langchain_openai（模拟模式不加载）
+    from langchain_openai import ChatOpenAI
+    key = (model, float(temperature), DEEPSEEK_BASE_URL, api_key)
+    with _registry_lock:
+        llm = _llm_registry.get(key)
+        if llm is None:
+            llm = ChatOpenAI(
+                model=model,
+                api_key=api_key,
+                base_url=DEEPSEEK_BASE_URL,
+                temperature=temperature,
+                http_client=_get_http_client(),
+                http_async_client=_get_http_async_client(),
+                # 流式输出时同样返回 token 用量，供运行指标统计
+                stream_usage=True,
+                # 429 / 5xx 交给 tools.ratelimit 退避重试并调整并发上限
+                max_retries=0 if RATE_LIMIT_ENABLED else 2,
+            )
+            _llm_registry[key] = llm
+    
+    if use_cache is None:
+        use_cache = LLM_CACHE_ENABLED
+    return ManagedLLM(
+        llm,
         model=model,
-        api_key=api_key,
-        base_url="https://api.deepseek.com",
         temperature=temperature,
+        cache=get_llm_cache() if use_cache else None,
     )
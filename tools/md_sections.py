@@ -0,0 +1,141 @@
+"""
+Markdown 章节工具
+按标题切分文案、解析编号的审查意见并定位到章节，用于增量优化（只重写被指出问题的章节）
+"""
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_HEADING = re.compile(r"^#{1,6}\s+(.*)$")
+_ITEM = re.compile(r"^\s*(\d+)\s*[.、)）]\s*(.*)$")
+# 比对标题时忽略的符号：括号、引号、emoji 以外的常见标点
+_TITLE_STRIP = re.compile(r"[\s\[\]【】「」『』\"'“”`*：:]+")
+
+# 标题过短时容易误匹配（如 "AI"），不参与定位
+MIN_TITLE_CHARS = 2
+
+# (标题文本, 章节全文)；第一个标题之前的内容标题为空
+Section = Tuple[str, str]
+
+
+def normalize_title(title: str) -> str:
+    """去掉标点、空白与大小写差异，便于比对章节标题"""
+    return _TITLE_STRIP.sub("", title).lower()
+
+
+def split_sections(content: str) -> List[Section]:
+    """
+    按 Markdown 标题切分文案，章节全文包含标题行；拼接所有章节全文即为原文
+
+    Args:
+        content: Markdown 文案
+
+    Returns:
+        章节列表
+    """
+    sections: List[Section] = []
+    title, lines = "", []
+    for line in content.splitlines(keepends=True):
+        match = _HEADING.match(line.rstrip("\r\n"))
+        if match and (lines or sections):
+            sections.append((title, "".join(lines)))
+            lines = []
+        if match:
+            title = match.group(1).strip()
+        lines.append(line)
+    if lines:
+        sections.append((title, "".join(lines)))
+    return sections
+
+
+def join_sections(sections: Sequence[Section]) -> str:
+    """split_sections() 的逆操作"""
+    return "".join(text for _, text in sections)
+
+
+def parse_items(critique: str) -> List[str]:
+    """
+    将审查意见解析为编号条目，续行并入上一条
+
+    Args:
+        critique: Reviewer 输出的修改意见
+
+    Returns:
+        条目列表；没有编号条目时为空
+    """
+    items: List[str] = []
+    for line in critique.splitlines():
+        match = _ITEM.match(line)
+        if match:
+            items.append(match.group(2).strip())
+        elif items and line.strip():
+            items[-1] += "\n" + line.strip()
+    return items
+
+
+def locate_items(items: Sequence[str], sections: Sequence[Section]) -> Optional[Dict[int, List[str]]]:
+    """
+    将每条审查意见定位到其提及的章节
+
+    Args:
+        items: parse_items() 的结果
+        sections: split_sections() 的结果
+
+    Returns:
+        章节下标 -> 相关意见；有意见无法定位到章节时返回 None（需要整篇重写）
+    """
+    titles = [normalize_title(title) for title, _ in sections]
+    located: Dict[int, List[str]] = {}
+    for item in items:
+        text = normalize_title(item)
+        hits = [i for i, title in enumerate(titles) if len(title) >= MIN_TITLE_CHARS and title in text]
+        if not hits:
+            return None
+        for i in hits:
+            located.setdefault(i, []).append(item)
+    return located
+
+
+def strip_fence(text: str) -> str:
+    """去掉 LLM 输出外层的 ``` 代码块"""
+    stripped = text.strip()
+    if stripped.startswith("```") and stripped.endswith("```"):
+        stripped = stripped.split("\n", 1)[1] if "\n" in stripped else ""
+        stripped = stripped.rsplit("```", 1)[0]
+    return stripped.strip()
+
+
+def splice_sections(
+    sections: Sequence[Section],
+    targets: Sequence[int],
+    rewritten: str
+) -> Optional[List[Section]]:
+    """
+    将重写后的章节按标题替换回原文
+
+    标题与目标章节一一对应时按标题替换；标题被改写但数量一致时按顺序替换；
+    否则返回 None。
+
+    Args:
+        sections: 原文章节
+        targets: 被重写的章节下标
+        rewritten: LLM 输出的重写结果
+
+    Returns:
+        替换后的章节列表，无法对应时为 None
+    """
+    parts = [part for part in split_sections(strip_fence(rewritten)) if part[0] or part[1].strip()]
+    by_title = {normalize_title(title): (title, text) for title, text in parts}
+    replacements = [by_title.get(normalize_title(sections[i][0])) for i in targets]
+    if any(part is None for part in replacements):
+        if len(parts) != len(targets):
+            return None
+        replacements = parts
+
+    result = list(sections)
+    for i, (title, text) in zip(targets, replacements):
+        # 保持章节之间的空行
+        trailing = result[i][1][len(result[i][1].rstrip()):]
+        if not trailing and i < len(result) - 1:
+            trailing = "\n\n"
+        result[i] = (title, text.rstrip() + trailing)
+    return result
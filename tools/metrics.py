@@ -0,0 +1,497 @@
+"""
+运行指标采集
+记录每个图节点以及每次 LLM / 搜索 / 图片调用的耗时、token 用量、重试次数和成本，
+写入 AgentState.metrics，并汇总为 Prometheus 文本格式，可通过本地文件或 HTTP 端点导出
+"""
+import os
+import time
+import inspect
+import threading
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from tools import startup
+
+# 每百万 token 的价格（美元），默认按 deepseek-chat 计价，可通过环境变量调整
+LLM_PRICE_INPUT_PER_M = float(os.getenv("LLM_PRICE_INPUT_PER_M", "0.27"))
+LLM_PRICE_OUTPUT_PER_M = float(os.getenv("LLM_PRICE_OUTPUT_PER_M", "1.10"))
+# 命中服务商上下文缓存（前缀缓存）的输入 token 单价
+LLM_PRICE_CACHE_HIT_PER_M = float(os.getenv("LLM_PRICE_CACHE_HIT_PER_M", "0.07"))
+
+# 直方图分桶（秒）
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# 当前节点内的调用记录；节点包装器在执行前设置，工具在调用结束时追加
+_current_calls: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar(
+    "current_calls", default=None
+)
+
+
+def _labels(labels: Dict[str, Any]) -> LabelKey:
+    """将标签字典转换为可哈希的有序元组"""
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """线程安全的计数器、仪表盘与直方图注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+
+    def inc(self, name: str, value: float = 1.0, help_text: str = "", **labels: Any) -> None:
+        """
+        增加计数器
+
+        Args:
+            name: 指标名
+            value: 增量
+            help_text: 指标说明
+            **labels: 标签
+        """
+        with self._lock:
+            self._help.setdefault(name, ("counter", help_text))
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, help_text: str = "", **labels: Any) -> None:
+        """
+        设置仪表盘（gauge）当前值
+
+        Args:
+            name: 指标名
+            value: 当前值
+            help_text: 指标说明
+            **labels: 标签
+        """
+        with self._lock:
+            self._help.setdefault(name, ("gauge", help_text))
+            self._counters.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, help_text: str = "", **labels: Any) -> None:
+        """
+        记录一次直方图观测值
+
+        Args:
+            name: 指标名
+            value: 观测值（秒）
+            help_text: 指标说明
+            **labels: 标签
+        """
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help_text))
+            series = self._histograms.setdefault(name, {})
+            key = _labels(labels)
+            # 前 len(DURATION_BUCKETS) 项为各桶计数，最后两项为 count 与 sum
+            data = series.setdefault(key, [0.0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += 1
+            data[-1] += value
+
+    def counter_value(self, name: str, **labels: Any) -> float:
+        """读取计数器当前值（不存在时为 0）"""
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0.0)
+
+    def reset(self) -> None:
+        """清空所有指标"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._help.clear()
+
+    def render_prometheus(self) -> str:
+        """
+        渲染为 Prometheus 文本格式
+
+        Returns:
+            Prometheus exposition 格式文本
+        """
+        def fmt(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                kind, help_text = self._help.get(name, ("counter", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{fmt(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                kind, help_text = self._help.get(name, ("histogram", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, data in sorted(series.items()):
+                    for bound, count in zip(DURATION_BUCKETS, data):
+                        lines.append(f"{name}_bucket{fmt(key, (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{fmt(key, (('le', '+Inf'),))} {data[-2]}")
+                    lines.append(f"{name}_count{fmt(key)} {data[-2]}")
+                    lines.append(f"{name}_sum{fmt(key)} {data[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def llm_cost(prompt_tokens: int, completion_tokens: int, cache_hit_tokens: int = 0) -> float:
+    """
+    按配置的单价估算一次 LLM 调用的成本，命中上下文缓存的输入 token 按缓存单价计
+
+    Returns:
+        成本（美元）
+    """
+    cache_hit_tokens = min(cache_hit_tokens, prompt_tokens)
+    return (
+        (prompt_tokens - cache_hit_tokens) * LLM_PRICE_INPUT_PER_M
+        + cache_hit_tokens * LLM_PRICE_CACHE_HIT_PER_M
+        + completion_tokens * LLM_PRICE_OUTPUT_PER_M
+    ) / 1_000_000
+
+
+def token_usage(response: Any) -> Tuple[int, int]:
+    """
+    从 LLM 响应中提取 token 用量
+
+    Args:
+        response: ChatOpenAI 响应（AIMessage）或其他响应对象
+
+    Returns:
+        (prompt_tokens, completion_tokens)，无法获取时为 (0, 0)
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    token_usage_data = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return int(token_usage_data.get("prompt_tokens", 0)), int(token_usage_data.get("completion_tokens", 0))
+
+
+def cache_hit_tokens(response: Any) -> int:
+    """
+    从 LLM 响应中提取命中服务商上下文缓存的输入 token 数
+
+    DeepSeek 在 usage 中返回 prompt_cache_hit_tokens；OpenAI 兼容接口返回
+    prompt_tokens_details.cached_tokens，langchain 归一化为 input_token_details.cache_read。
+
+    Returns:
+        命中缓存的 token 数，无法获取时为 0
+    """
+    token_usage_data = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    if token_usage_data.get("prompt_cache_hit_tokens") is not None:
+        return int(token_usage_data["prompt_cache_hit_tokens"])
+    details = token_usage_data.get("prompt_tokens_details") or {}
+    if details.get("cached_tokens") is not None:
+        return int(details["cached_tokens"])
+    usage = getattr(response, "usage_metadata", None) or {}
+    return int((usage.get("input_token_details") or {}).get("cache_read", 0) or 0)
+
+
+def record_call(
+    kind: str,
+    provider: str,
+    seconds: float,
+    model: str = "",
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    cache_hit_tokens: int = 0,
+    retries: int = 0,
+    cached: bool = False,
+    coalesced: bool = False,
+    error: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    记录一次外部调用
+
+    同时更新全局指标；若当前处于某个图节点内，还会追加到该节点的调用列表，
+    最终写入 AgentState.metrics。
+
+    Args:
+        kind: 调用类型（llm/search/image）
+        provider: 服务提供方（deepseek/tavily/fal/mock）
+        seconds: 耗时（秒）
+        model: 模型名称
+        prompt_tokens: 输入 token 数
+        completion_tokens: 输出 token 数
+        cache_hit_tokens: 输入中命中服务商上下文缓存的 token 数
+        retries: 重试次数
+        cached: 是否命中缓存
+        coalesced: 是否与其他相同的进行中请求合并（未单独发起请求）
+        error: 失败时的错误信息
+
+    Returns:
+        调用记录
+    """
+    cost = llm_cost(prompt_tokens, completion_tokens, cache_hit_tokens) if kind == "llm" and provider != "mock" and not coalesced else 0.0
+    entry = {
+        "kind": kind,
+        "provider": provider,
+        "model": model,
+        "seconds": round(seconds, 4),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cache_hit_tokens": cache_hit_tokens,
+        "retries": retries,
+        "cached": cached,
+        "coalesced": coalesced,
+        "cost_usd": round(cost, 6),
+    }
+    if error:
+        entry["error"] = error
+
+    registry.observe(
+        "sma_call_duration_seconds", seconds, "外部调用耗时",
+        kind=kind, provider=provider, cached=str(cached).lower()
+    )
+    registry.inc(
+        "sma_calls_total", 1, "外部调用次数",
+        kind=kind, provider=provider, status="error" if error else "ok"
+    )
+    if coalesced:
+        registry.inc("sma_calls_coalesced_total", 1, "与进行中的相同请求合并的调用次数", kind=kind, provider=provider)
+    if retries:
+        registry.inc("sma_call_retries_total", retries, "外部调用重试次数", kind=kind, provider=provider)
+    if prompt_tokens:
+        registry.inc("sma_llm_tokens_total", prompt_tokens, "LLM token 用量", model=model, type="prompt")
+    if completion_tokens:
+        registry.inc("sma_llm_tokens_total", completion_tokens, "LLM token 用量", model=model, type="completion")
+    if cache_hit_tokens:
+        registry.inc("sma_llm_tokens_total", cache_hit_tokens, "LLM token 用量", model=model, type="prompt_cache_hit")
+    if cost:
+        registry.inc("sma_llm_cost_usd_total", cost, "LLM 估算成本（美元）", model=model)
+
+    calls = _current_calls.get()
+    if calls is not None:
+        calls.append(entry)
+    return entry
+
+
+class CallTimer:
+    """
+    外部调用计时上下文
+
+    用法:
+        with CallTimer("search", "tavily") as timer:
+            ...
+            timer.cached = True
+    退出时自动调用 record_call，异常时记录错误信息。
+    """
+
+    def __init__(self, kind: str, provider: str, model: str = ""):
+        self.kind = kind
+        self.provider = provider
+        self.model = model
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hit_tokens = 0
+        self.retries = 0
+        self.cached = False
+        self.coalesced = False
+        self._start = 0.0
+
+    def __enter__(self) -> "CallTimer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        record_call(
+            self.kind,
+            self.provider,
+            time.perf_counter() - self._start,
+            model=self.model,
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            cache_hit_tokens=self.cache_hit_tokens,
+            retries=self.retries,
+            cached=self.cached,
+            coalesced=self.coalesced,
+            error=f"{exc_type.__name__}: {exc}" if exc_type else None,
+        )
+
+
+def _finish_node(
+    name: str,
+    start: float,
+    calls: List[Dict[str, Any]],
+    error: Optional[BaseException],
+    total: bool = False
+) -> Dict[str, Any]:
+    """
+    汇总节点指标并更新全局注册表
+
+    total 为 True 表示节点内运行了子图（如 paper），其耗时已包含子图各节点的记录，
+    汇总时跳过以免重复计算
+    """
+    seconds = time.perf_counter() - start
+    registry.observe("sma_node_duration_seconds", seconds, "图节点耗时", node=name)
+    if error is not None:
+        registry.inc("sma_node_errors_total", 1, "图节点失败次数", node=name)
+    entry = {
+        "node": name,
+        "seconds": round(seconds, 4),
+        "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+        "completion_tokens": sum(c["completion_tokens"] for c in calls),
+        "cache_hit_tokens": sum(c.get("cache_hit_tokens", 0) for c in calls),
+        "cost_usd": round(sum(c["cost_usd"] for c in calls), 6),
+        "calls": calls,
+    }
+    if total:
+        entry["total"] = True
+    return entry
+
+
+def _accepts_config(func: Callable) -> bool:
+    """判断节点函数是否接收 config 参数"""
+    return "config" in inspect.signature(func).parameters
+
+
+def instrument_node(name: str, func: Callable) -> Callable:
+    """
+    包装同步图节点：记录耗时及节点内的外部调用，追加到返回值的 metrics 字段
+
+    Args:
+        name: 节点名
+        func: 节点函数
+
+    Returns:
+        包装后的节点函数
+    """
+    pass_config = _accepts_config(func)
+
+    def wrapper(state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        startup.mark("首个节点开始")
+        calls: List[Dict[str, Any]] = []
+        token = _current_calls.set(calls)
+        start = time.perf_counter()
+        try:
+            result = func(state, config) if pass_config else func(state)
+        except BaseException as e:
+            _finish_node(name, start, calls, e)
+            raise
+        finally:
+            _current_calls.reset(token)
+        result = dict(result or {})
+        # 保留节点自身返回的指标（如子图内各节点的记录），此时本节点的记录标记为合计
+        nested = list(result.get("metrics", []))
+        result["metrics"] = nested + [_finish_node(name, start, calls, None, total=bool(nested))]
+        return result
+
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+def ainstrument_node(name: str, afunc: Callable) -> Callable:
+    """
+    instrument_node 的异步版本
+
+    Args:
+        name: 节点名
+        afunc: 异步节点函数
+
+    Returns:
+        包装后的异步节点函数
+    """
+    pass_config = _accepts_config(afunc)
+
+    async def wrapper(state: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        startup.mark("首个节点开始")
+        calls: List[Dict[str, Any]] = []
+        token = _current_calls.set(calls)
+        start = time.perf_counter()
+        try:
+            result = await (afunc(state, config) if pass_config else afunc(state))
+        except BaseException as e:
+            _finish_node(name, start, calls, e)
+            raise
+        finally:
+            _current_calls.reset(token)
+        result = dict(result or {})
+        # 保留节点自身返回的指标（如子图内各节点的记录），此时本节点的记录标记为合计
+        nested = list(result.get("metrics", []))
+        result["metrics"] = nested + [_finish_node(name, start, calls, None, total=bool(nested))]
+        return result
+
+    wrapper.__name__ = afunc.__name__
+    return wrapper
+
+
+def summarize_metrics(metrics: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """
+    按节点汇总 AgentState.metrics，跳过包含子图耗时的合计记录（total=True）
+
+    Args:
+        metrics: AgentState.metrics 列表
+
+    Returns:
+        {node: {"runs", "seconds", "prompt_tokens", "completion_tokens", "cache_hit_tokens", "cost_usd"}}
+    """
+    summary: Dict[str, Dict[str, float]] = {}
+    for entry in metrics:
+        if entry.get("total"):
+            continue
+        node = summary.setdefault(entry["node"], {
+            "runs": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cache_hit_tokens": 0, "cost_usd": 0.0
+        })
+        node["runs"] += 1
+        node["seconds"] += entry["seconds"]
+        node["prompt_tokens"] += entry["prompt_tokens"]
+        node["completion_tokens"] += entry["completion_tokens"]
+        node["cache_hit_tokens"] += entry.get("cache_hit_tokens", 0)
+        node["cost_usd"] += entry["cost_usd"]
+    return summary
+
+
+def write_metrics(path: str) -> None:
+    """
+    将当前指标以 Prometheus 文本格式写入文件（可配合 node_exporter textfile collector）
+
+    Args:
+        path: 输出文件路径
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    在后台线程启动 /metrics HTTP 端点
+
+    Args:
+        port: 监听端口
+        host: 监听地址，默认只监听本机
+
+    Returns:
+        HTTP 服务实例（调用 shutdown() 停止）
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,165 @@
+"""
+论文 PDF 流式解析工具
+从本地路径或 URL 分块读取 PDF（超过阈值的部分落盘而非常驻内存），逐页抽取文本并切分章节
+"""
+import os
+import re
+import tempfile
+from typing import Dict, Iterator, List, Optional, IO
+from tools.metrics import CallTimer
+
+# 单篇 PDF 的大小上限（字节），下载超过该大小时中止
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+# 下载内容在内存中保留的上限（字节），超过后写入临时文件
+PDF_SPOOL_BYTES = int(os.getenv("PDF_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# 单篇论文抽取文本的总字符上限，超出部分（通常是附录）被丢弃
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "200000"))
+# 单个章节块的最大字符数，过长的章节按段落切分为多块
+PDF_SECTION_MAX_CHARS = int(os.getenv("PDF_SECTION_MAX_CHARS", "12000"))
+PDF_DOWNLOAD_TIMEOUT = float(os.getenv("PDF_DOWNLOAD_TIMEOUT", "60"))
+
+_CHUNK_SIZE = 64 * 1024
+
+# 章节标题：编号标题（"3 Method"、"4.1. Results"、"IV. EXPERIMENTS"）或常见的无编号标题
+_HEADING_PATTERN = re.compile(
+    r"^(?:(?:\d{1,2}(?:\.\d{1,2})*\.?|[IVX]{1,5}\.)\s+[A-Z][A-Za-z][^\n]{0,80}"
+    r"|(?:Abstract|Introduction|Related Work|Background|Method|Methods|Methodology|Approach|"
+    r"Experiments?|Results|Evaluation|Discussion|Conclusions?|Limitations|Acknowledge?ments?)\s*)$"
+)
+# 参考文献之后的内容不参与总结
+_REFERENCES_PATTERN = re.compile(r"^(?:\d{1,2}\.?\s+)?(?:References|REFERENCES|Bibliography)\s*$")
+
+
+class PDFTooLargeError(ValueError):
+    """PDF 超过 PDF_MAX_BYTES 限制"""
+
+
+def open_pdf(source: str) -> IO[bytes]:
+    """
+    打开 PDF 数据流
+
+    本地文件直接以二进制方式打开；URL 分块下载到 SpooledTemporaryFile，
+    不超过 PDF_SPOOL_BYTES 时保留在内存，否则自动写入临时文件。
+
+    Args:
+        source: 本地路径或 http(s) URL
+
+    Returns:
+        可随机读取的二进制文件对象（调用方负责关闭）
+
+    Raises:
+        PDFTooLargeError: 文件超过 PDF_MAX_BYTES
+    """
+    if not source.startswith(("http://", "https://")):
+        if os.path.getsize(source) > PDF_MAX_BYTES:
+            raise PDFTooLargeError(f"PDF 超过 {PDF_MAX_BYTES} 字节限制: {source}")
+        return open(source, "rb")
+
+    import httpx
+    spool = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_BYTES)
+    try:
+        with CallTimer("pdf", "http"):
+            with httpx.stream("GET", source, follow_redirects=True, timeout=PDF_DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                declared = int(response.headers.get("content-length") or 0)
+                if declared > PDF_MAX_BYTES:
+                    raise PDFTooLargeError(f"PDF 超过 {PDF_MAX_BYTES} 字节限制: {source}")
+                size = 0
+                for chunk in response.iter_bytes(_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > PDF_MAX_BYTES:
+                        raise PDFTooLargeError(f"PDF 超过 {PDF_MAX_BYTES} 字节限制: {source}")
+                    spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def iter_page_text(stream: IO[bytes], max_chars: int = PDF_MAX_CHARS) -> Iterator[str]:
+    """
+    逐页抽取文本；pypdf 按需解析页面，已处理的页面不会保留
+
+    Args:
+        stream: PDF 二进制数据流
+        max_chars: 累计字符上限，达到后停止
+
+    Yields:
+        每页的文本
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(stream)
+    total = 0
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        total += len(text)
+        yield text
+        if total >= max_chars:
+            break
+
+
+def _split_long(title: str, body: str, max_chars: int) -> Iterator[Dict[str, str]]:
+    """按段落将过长的章节切分为多块"""
+    if len(body) <= max_chars:
+        yield {"title": title, "text": body}
+        return
+    part, chunk = 1, []
+    size = 0
+    for paragraph in body.split("\n\n"):
+        if chunk and size + len(paragraph) > max_chars:
+            yield {"title": f"{title} ({part})", "text": "\n\n".join(chunk)}
+            part, chunk, size = part + 1, [], 0
+        chunk.append(paragraph[:max_chars])
+        size += len(paragraph) + 2
+    if chunk:
+        yield {"title": f"{title} ({part})", "text": "\n\n".join(chunk)}
+
+
+def iter_sections(pages: Iterator[str], max_chars: int = PDF_SECTION_MAX_CHARS) -> Iterator[Dict[str, str]]:
+    """
+    将逐页文本增量切分为章节，遇到参考文献时停止
+
+    Args:
+        pages: 逐页文本
+        max_chars: 单个章节块的最大字符数
+
+    Yields:
+        {"title": 章节标题, "text": 章节正文}
+    """
+    title, lines = "Front Matter", []
+
+    def flush() -> Iterator[Dict[str, str]]:
+        body = "\n".join(lines).strip()
+        if body:
+            yield from _split_long(title, body, max_chars)
+
+    for page in pages:
+        for line in page.splitlines():
+            stripped = line.strip()
+            if _REFERENCES_PATTERN.match(stripped):
+                yield from flush()
+                return
+            if _HEADING_PATTERN.match(stripped):
+                yield from flush()
+                title, lines = stripped, []
+            else:
+                lines.append(line)
+        # 页与页之间视为段落边界
+        lines.append("")
+    yield from flush()
+
+
+def extract_sections(source: str, max_chars: Optional[int] = None) -> List[Dict[str, str]]:
+    """
+    下载（或打开）PDF 并抽取章节
+
+    Args:
+        source: 本地路径或 http(s) URL
+        max_chars: 单个章节块的最大字符数，默认 PDF_SECTION_MAX_CHARS
+
+    Returns:
+        章节列表，每项包含 title 与 text
+    """
+    with open_pdf(source) as stream:
+        return list(iter_sections(iter_page_text(stream), max_chars or PDF_SECTION_MAX_CHARS))
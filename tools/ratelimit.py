@@ -0,0 +1,368 @@
+"""
+客户端限流与自适应并发控制
+每个服务商（deepseek / tavily / fal）共享一个令牌桶（每秒请求数、每分钟 token 数），
+并按 AIMD 调整并发上限：遇到 429 / 5xx 时上限减半并退避重试，持续成功时逐步放开
+"""
+import os
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+from tools.metrics import CallTimer, registry
+from tools.retry import backoff_delay
+
+# 是否启用客户端限流
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() in ("1", "true", "yes")
+# 被限流（429）或服务端错误（5xx）时的最大重试次数
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "4"))
+# 退避时长（秒）：第 n 次重试在 [0, RATE_LIMIT_BACKOFF * 2^n] 中随机取值，不超过 RATE_LIMIT_MAX_BACKOFF
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", "1.0"))
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", "30"))
+
+# 各服务商的默认配额；可通过 <PROVIDER>_RPS / <PROVIDER>_TPM / <PROVIDER>_MAX_CONCURRENCY 覆盖，
+# 0 表示不限制该维度
+PROVIDER_DEFAULTS: Dict[str, Dict[str, float]] = {
+    "deepseek": {"rps": 10, "tpm": 0, "max_concurrency": 16},
+    "tavily": {"rps": 5, "tpm": 0, "max_concurrency": 8},
+    "fal": {"rps": 5, "tpm": 0, "max_concurrency": 8},
+}
+
+# 异步调用方等待并发名额时的轮询间隔（秒）
+_ASYNC_POLL_INTERVAL = 0.02
+# 同一波失败只减半一次：两次减半之间的最小间隔（秒）
+_DECREASE_COOLDOWN = 1.0
+
+_lock = threading.Lock()
+_limiters: Dict[str, "ProviderLimiter"] = {}
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    采用预留方式：调用方先扣除令牌（允许透支），再按透支量等待相应时长，
+    因此同步与异步调用方可以共享同一个桶。rate <= 0 表示不限制。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        预留令牌
+
+        Args:
+            amount: 令牌数
+
+        Returns:
+            使用前需要等待的秒数
+        """
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """归还预留多出的令牌（amount 为负时补扣不足的部分）"""
+        if self.rate <= 0 or amount == 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 并发上限
+
+    每次成功调用使上限增加 1 / limit（即每一轮满并发成功后加 1），
+    被限流时乘以 decrease（默认减半），上限介于 [min_limit, max_limit]。
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, decrease: float = 0.5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.decrease = decrease
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def try_acquire(self) -> bool:
+        """有空闲名额时占用一个并返回 True"""
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        """占用一个名额，没有空闲名额时阻塞等待"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def aacquire(self) -> None:
+        """acquire() 的异步版本，等待期间不阻塞事件循环"""
+        while not self.try_acquire():
+            await asyncio.sleep(_ASYNC_POLL_INTERVAL)
+
+    def release(self) -> None:
+        """释放名额"""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        """加性增长"""
+        with self._cond:
+            before = int(self.limit)
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            if int(self.limit) > before:
+                self._cond.notify_all()
+
+    def on_throttle(self) -> None:
+        """乘性减小"""
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < _DECREASE_COOLDOWN:
+                return
+            self._last_decrease = now
+            self.limit = max(float(self.min_limit), self.limit * self.decrease)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """从 openai / httpx / requests 异常中提取 HTTP 状态码"""
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_throttle_error(error: BaseException) -> bool:
+    """
+    是否为可退避重试的错误：429 限流或 5xx 服务端错误
+
+    Tavily 客户端对 429 抛出 UsageLimitExceededError，按类名识别。
+    """
+    code = _status_code(error)
+    if code is not None:
+        return code == 429 or 500 <= code < 600
+    return type(error).__name__ in ("RateLimitError", "UsageLimitExceededError")
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """读取响应头中的 Retry-After（秒数或 HTTP 日期）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderLimiter:
+    """
+    单个服务商的限流器
+
+    调用前按每秒请求数与每分钟 token 数预留配额并占用一个并发名额；
+    调用遇到 429 / 5xx 时减小并发上限，按 Retry-After 或带抖动的指数退避暂停该服务商的所有新请求后重试。
+    """
+
+    def __init__(self, provider: str, rps: float = 0, tpm: float = 0, max_concurrency: int = 8):
+        self.provider = provider
+        self.requests = TokenBucket(rps, max(rps, 1.0))
+        self.tokens = TokenBucket(tpm / 60.0, tpm)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _delay(self, estimated_tokens: int) -> float:
+        """预留配额，返回需要等待的秒数"""
+        with self._lock:
+            paused = self._paused_until - time.monotonic()
+        return max(paused, self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def _backoff(self, error: BaseException, attempt: int, timer: Optional[CallTimer]) -> float:
+        """记录一次限流并返回退避时长；退避期间该服务商的新请求同样等待"""
+        self.concurrency.on_throttle()
+        delay = _retry_after(error)
+        if delay is None:
+            delay = backoff_delay(attempt, RATE_LIMIT_BACKOFF, RATE_LIMIT_MAX_BACKOFF)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        if timer is not None:
+            timer.retries += 1
+        registry.inc(
+            "sma_throttled_total", 1, "被服务商限流或返回 5xx 的次数",
+            provider=self.provider, status=str(_status_code(error) or type(error).__name__)
+        )
+        self._report()
+        return delay
+
+    def _settle(self, estimated_tokens: int, result: Any, usage: Optional[Callable[[Any], int]]) -> None:
+        """调用成功：增长并发上限，并按实际 token 用量修正预留"""
+        self.concurrency.on_success()
+        if usage is not None:
+            self.tokens.refund(estimated_tokens - usage(result))
+        self._report()
+
+    def _report(self) -> None:
+        registry.set(
+            "sma_concurrency_limit", int(self.concurrency.limit), "自适应并发上限",
+            provider=self.provider
+        )
+
+    def call(
+        self,
+        fn: Callable[[], Any],
+        estimated_tokens: int = 0,
+        usage: Optional[Callable[[Any], int]] = None,
+        timer: Optional[CallTimer] = None
+    ) -> Any:
+        """
+        在限流下执行 fn，429 / 5xx 时退避重试
+
+        Args:
+            fn: 无参调用
+            estimated_tokens: 预估 token 数，用于每分钟 token 配额
+            usage: 从返回值中读取实际 token 数的函数，用于修正预留
+            timer: 当前调用的 CallTimer，用于记录重试次数
+
+        Returns:
+            fn 的返回值
+        """
+        attempt = 0
+        while True:
+            delay = self._delay(estimated_tokens)
+            if delay > 0:
+                time.sleep(delay)
+            self.concurrency.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_throttle_error(e):
+                    raise
+                delay = self._backoff(e, attempt, timer)
+                if attempt >= RATE_LIMIT_MAX_RETRIES:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            finally:
+                self.concurrency.release()
+            self._settle(estimated_tokens, result, usage)
+            return result
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        estimated_tokens: int = 0,
+        usage: Optional[Callable[[Any], int]] = None,
+        timer: Optional[CallTimer] = None
+    ) -> Any:
+        """
+        call() 的异步版本，等待配额与退避期间不阻塞事件循环
+
+        Returns:
+            fn 的返回值
+        """
+        attempt = 0
+        while True:
+            delay = self._delay(estimated_tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.concurrency.aacquire()
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_throttle_error(e):
+                    raise
+                delay = self._backoff(e, attempt, timer)
+                if attempt >= RATE_LIMIT_MAX_RETRIES:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                self.concurrency.release()
+            self._settle(estimated_tokens, result, usage)
+            return result
+
+
+def _setting(provider: str, name: str) -> float:
+    """读取服务商配额，环境变量优先"""
+    value = os.getenv(f"{provider.upper()}_{name.upper()}")
+    return float(value) if value else PROVIDER_DEFAULTS.get(provider, {}).get(name, 0)
+
+
+def get_limiter(provider: str) -> Optional[ProviderLimiter]:
+    """
+    获取服务商的进程内共享限流器
+
+    Args:
+        provider: 服务商名称（deepseek/tavily/fal）
+
+    Returns:
+        ProviderLimiter；限流关闭或未知服务商（如 mock）时返回 None
+    """
+    if not RATE_LIMIT_ENABLED or provider not in PROVIDER_DEFAULTS:
+        return None
+    with _lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = ProviderLimiter(
+                provider,
+                rps=_setting(provider, "rps"),
+                tpm=_setting(provider, "tpm"),
+                max_concurrency=int(_setting(provider, "max_concurrency")) or 1,
+            )
+            _limiters[provider] = limiter
+        return limiter
+
+
+def limited_call(
+    provider: str,
+    fn: Callable[[], Any],
+    estimated_tokens: int = 0,
+    usage: Optional[Callable[[Any], int]] = None,
+    timer: Optional[CallTimer] = None
+) -> Any:
+    """按服务商限流执行 fn；未启用限流时直接调用"""
+    limiter = get_limiter(provider)
+    if limiter is None:
+        return fn()
+    return limiter.call(fn, estimated_tokens, usage, timer)
+
+
+async def alimited_call(
+    provider: str,
+    fn: Callable[[], Awaitable[Any]],
+    estimated_tokens: int = 0,
+    usage: Optional[Callable[[Any], int]] = None,
+    timer: Optional[CallTimer] = None
+) -> Any:
+    """limited_call() 的异步版本"""
+    limiter = get_limiter(provider)
+    if limiter is None:
+        return await fn()
+    return await limiter.acall(fn, estimated_tokens, usage, timer)
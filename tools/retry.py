@@ -0,0 +1,304 @@
+"""
+调用策略：有限次重试（指数退避 + 随机抖动）、单次调用截止时间与对冲请求
+对冲：请求超过近期延迟的 p95 仍未返回时，再发起一个相同的请求，取先返回的结果
+"""
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent import futures
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+from tools.metrics import CallTimer, registry
+
+# 视为瞬时故障、可以重试的异常（按类名匹配，覆盖 openai 与 httpx 的异常层级）
+_TRANSIENT_ERROR_NAMES = ("APIConnectionError", "TimeoutException", "NetworkError", "RemoteProtocolError")
+
+# 近期延迟样本数，用于计算对冲阈值
+LATENCY_WINDOW = 200
+
+_executor_lock = threading.Lock()
+_executor: Optional[futures.ThreadPoolExecutor] = None
+
+
+class DeadlineExceeded(TimeoutError):
+    """调用超过截止时间"""
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    指数退避时长（full jitter）：在 [0, min(cap, base * 2^attempt)] 中均匀取值，
+    避免大量调用方在同一时刻重试
+
+    Args:
+        attempt: 已重试次数（从 0 开始）
+        base: 首次退避的上限（秒）
+        cap: 退避上限（秒）
+
+    Returns:
+        退避秒数
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """是否为连接失败、超时等瞬时故障（截止时间耗尽除外）"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _get_executor() -> futures.ThreadPoolExecutor:
+    """同步调用的对冲在共享线程池中执行"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(max_workers=64, thread_name_prefix="call-policy")
+        return _executor
+
+
+class CallPolicy:
+    """
+    单个 (服务商, 模型) 的调用策略
+
+    fn 接收一个布尔参数 hedged，表示本次是否为对冲请求，调用方可据此关闭流式回调等副作用。
+    截止时间覆盖包括重试在内的整次调用；对冲阈值取近期成功调用延迟的分位数，
+    样本不足 hedge_min_samples 时不对冲。
+    同步调用不对冲时直接在调用方线程中执行，单次请求的耗时由客户端超时限制，
+    截止时间只在发起请求与重试前检查；只有对冲时才使用共享线程池。
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        provider: str,
+        max_retries: int = 2,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        deadline: float = 0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        retryable: Callable[[BaseException], bool] = is_transient_error
+    ):
+        self.kind = kind
+        self.provider = provider
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.retryable = retryable
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> Optional[float]:
+        """当前对冲阈值（秒）；未启用或样本不足时为 None"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            samples = sorted(self._latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_quantile))]
+
+    def _record(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _count_hedge(self, winner: str) -> None:
+        registry.inc(
+            "sma_hedges_total", 1, "对冲请求次数（winner=hedge 表示对冲请求先返回）",
+            kind=self.kind, provider=self.provider, winner=winner
+        )
+
+    def _should_retry(self, error: BaseException, attempt: int, deadline: Optional[float]) -> Optional[float]:
+        """需要重试时返回退避时长，否则返回 None"""
+        if attempt >= self.max_retries or not self.retryable(error):
+            return None
+        delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _deadline(self) -> Optional[float]:
+        return time.monotonic() + self.deadline if self.deadline > 0 else None
+
+    def _timeout(self, start: float, deadline: Optional[float], hedge_at: Optional[float]) -> Optional[float]:
+        """下一次等待的时长：截止时间与对冲时刻中较早者"""
+        now = time.monotonic()
+        candidates = []
+        if deadline is not None:
+            candidates.append(deadline - now)
+        if hedge_at is not None:
+            candidates.append(start + hedge_at - now)
+        return max(0.0, min(candidates)) if candidates else None
+
+    def call(
+        self,
+        fn: Callable[[bool], Any],
+        timer: Optional[CallTimer] = None,
+        hedge: bool = True,
+        on_hedge_win: Optional[Callable[[Any], None]] = None
+    ) -> Any:
+        """
+        按策略执行同步调用
+
+        Args:
+            fn: fn(hedged) 执行一次请求
+            timer: 当前调用的 CallTimer，用于记录重试次数
+            hedge: 本次调用是否允许对冲
+            on_hedge_win: 对冲请求胜出时以其结果回调
+
+        Returns:
+            fn 的返回值
+        """
+        deadline = self._deadline()
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(fn, deadline, hedge, on_hedge_win)
+            except Exception as e:
+                delay = self._should_retry(e, attempt, deadline)
+                if delay is None:
+                    raise
+            attempt += 1
+            if timer is not None:
+                timer.retries += 1
+            time.sleep(delay)
+
+    def _attempt(
+        self,
+        fn: Callable[[bool], Any],
+        deadline: Optional[float],
+        hedge: bool,
+        on_hedge_win: Optional[Callable[[Any], None]]
+    ) -> Any:
+        hedge_at = self.hedge_delay() if hedge else None
+        start = time.monotonic()
+        if hedge_at is None:
+            # 不对冲时在调用方线程中执行：避免在共享线程池中排队消耗截止时间，
+            # 也不会在截止时间到达后留下仍在运行、占用限流额度的请求
+            if deadline is not None and start >= deadline:
+                raise DeadlineExceeded(f"{self.provider} 调用超过 {self.deadline:g}s 截止时间")
+            result = fn(False)
+            self._record(time.monotonic() - start)
+            return result
+
+        executor = _get_executor()
+        primary = executor.submit(contextvars.copy_context().run, fn, False)
+        pending = {primary}
+        started = {primary: start}
+        error: Optional[BaseException] = None
+        while pending:
+            timeout = self._timeout(start, deadline, hedge_at if len(started) == 1 else None)
+            done, pending = futures.wait(pending, timeout=timeout, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return self._win(future, future is not primary, started, pending, on_hedge_win)
+                error = future.exception()
+            if done:
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if len(started) > 1:
+                continue
+            # 到达对冲时刻仍未返回：发起对冲请求（已提交的请求无法中断，结果被丢弃）
+            hedged = executor.submit(contextvars.copy_context().run, fn, True)
+            started[hedged] = time.monotonic()
+            pending.add(hedged)
+        if len(started) > 1:
+            self._count_hedge("none")
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(f"{self.provider} 调用超过 {self.deadline:g}s 截止时间")
+
+    def _win(
+        self,
+        future: Any,
+        is_hedge: bool,
+        started: Dict[Any, float],
+        pending: Set[Any],
+        on_hedge_win: Optional[Callable[[Any], None]]
+    ) -> Any:
+        """记录胜出请求的延迟，取消其余请求"""
+        result = future.result()
+        self._record(time.monotonic() - started[future])
+        for other in pending:
+            other.cancel()
+        if len(started) > 1:
+            self._count_hedge("hedge" if is_hedge else "primary")
+        if is_hedge and on_hedge_win is not None:
+            on_hedge_win(result)
+        return result
+
+    async def acall(
+        self,
+        fn: Callable[[bool], Awaitable[Any]],
+        timer: Optional[CallTimer] = None,
+        hedge: bool = True,
+        on_hedge_win: Optional[Callable[[Any], None]] = None
+    ) -> Any:
+        """
+        call() 的异步版本：超过截止时间或对冲失败的请求会被取消
+
+        Returns:
+            fn 的返回值
+        """
+        deadline = self._deadline()
+        attempt = 0
+        while True:
+            try:
+                return await self._aattempt(fn, deadline, hedge, on_hedge_win)
+            except Exception as e:
+                delay = self._should_retry(e, attempt, deadline)
+                if delay is None:
+                    raise
+            attempt += 1
+            if timer is not None:
+                timer.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _aattempt(
+        self,
+        fn: Callable[[bool], Awaitable[Any]],
+        deadline: Optional[float],
+        hedge: bool,
+        on_hedge_win: Optional[Callable[[Any], None]]
+    ) -> Any:
+        hedge_at = self.hedge_delay() if hedge else None
+        start = time.monotonic()
+        primary = asyncio.ensure_future(fn(False))
+        pending = {primary}
+        started = {primary: start}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                timeout = self._timeout(start, deadline, hedge_at if len(started) == 1 else None)
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return self._win(task, task is not primary, started, pending, on_hedge_win)
+                    error = task.exception()
+                if done:
+                    continue
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                if len(started) > 1:
+                    continue
+                hedged = asyncio.ensure_future(fn(True))
+                started[hedged] = time.monotonic()
+                pending.add(hedged)
+        finally:
+            for task in pending:
+                task.cancel()
+        if len(started) > 1:
+            self._count_hedge("none")
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(f"{self.provider} 调用超过 {self.deadline:g}s 截止时间")
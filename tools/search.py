@@ -3,122 +3,446 @@ Tavily 搜索工具
 用于搜索和获取网页内容摘要
 """
 import os
-import json
-from typing import List, Dict, Any
-from tavily import TavilyClient
-from dotenv import load_dotenv
+import copy
+import time
+import asyncio
+import threading
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+from tools.instrumentation import log_event
+from tools.cache import TTLCache, default_cache_path, hash_key
+from tools.metrics import CallTimer
+from tools.singleflight import SingleFlight
+from tools.ratelimit import limited_call, alimited_call
 
-# 加载环境变量
-load_dotenv()
+if TYPE_CHECKING:
+    from tavily import TavilyClient, AsyncTavilyClient
 
+# 搜索缓存配置
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "256"))
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", default_cache_path("search_cache.sqlite"))
+# 过期后仍可先返回旧结果、同时在后台刷新的时间窗口（秒）
+SEARCH_STALE_WINDOW = float(os.getenv("SEARCH_STALE_WINDOW", "1800"))
 
-def search_content(query: str, max_results: int = 5, use_mock: bool = False) -> str:
+# 各任务类型的新鲜度窗口（秒）：简报追踪 24h 热点，需要更短的窗口
+SEARCH_FRESHNESS: Dict[str, float] = {
+    "brief": float(os.getenv("SEARCH_FRESHNESS_BRIEF", "3600")),
+    "cv": float(os.getenv("SEARCH_FRESHNESS_CV", "86400")),
+    "paper": float(os.getenv("SEARCH_FRESHNESS_PAPER", "86400")),
+}
+SEARCH_DEFAULT_FRESHNESS = float(os.getenv("SEARCH_DEFAULT_FRESHNESS", "3600"))
+
+# 模拟搜索的延迟（秒），用于离线基准测试
+MOCK_SEARCH_LATENCY = float(os.getenv("MOCK_SEARCH_LATENCY", "0"))
+
+_client_lock = threading.Lock()
+_client: Optional["TavilyClient"] = None
+_async_client: Optional["AsyncTavilyClient"] = None
+_search_cache: Optional[TTLCache] = None
+_refreshing: set = set()
+# 合并相同的进行中搜索（按缓存键）
+_in_flight = SingleFlight()
+
+
+def _get_client(api_key: str) -> "TavilyClient":
+    """获取进程内复用的 TavilyClient（首次使用时才导入 tavily）"""
+    from tavily import TavilyClient
+    global _client
+    with _client_lock:
+        if _client is None or getattr(_client, "api_key", api_key) != api_key:
+            _client = TavilyClient(api_key=api_key)
+        return _client
+
+
+def _get_async_client(api_key: str) -> "AsyncTavilyClient":
+    """获取进程内复用的 AsyncTavilyClient"""
+    from tavily import AsyncTavilyClient
+    global _async_client
+    with _client_lock:
+        if _async_client is None or getattr(_async_client, "api_key", api_key) != api_key:
+            _async_client = AsyncTavilyClient(api_key=api_key)
+        return _async_client
+
+
+def get_search_cache() -> TTLCache:
     """
-    使用 Tavily 搜索内容并返回清洗后的网页文本摘要
-    
+    获取进程内共享的搜索结果缓存（惰性创建）
+
+    Returns:
+        TTLCache 实例；条目的硬过期时间为最长新鲜度窗口加上 stale 窗口
+    """
+    global _search_cache
+    with _client_lock:
+        if _search_cache is None:
+            max_freshness = max([SEARCH_DEFAULT_FRESHNESS, *SEARCH_FRESHNESS.values()])
+            _search_cache = TTLCache(
+                max_entries=SEARCH_CACHE_MAX_ENTRIES,
+                ttl=max_freshness + SEARCH_STALE_WINDOW,
+                db_path=SEARCH_CACHE_PATH or None,
+                namespace="search",
+            )
+        return _search_cache
+
+
+def _mock_results(query: str) -> List[Dict[str, str]]:
+    """返回模拟搜索结果（仅用于测试）"""
+    return [
+        {
+            "title": f"AI Industry News - {query}",
+            "url": "https://example.com/ai-news",
+            "content": f"This is a mock search result for testing purposes. The query was: {query}. In a real scenario, this would contain actual search results from Tavily API.",
+        },
+        {
+            "title": f"Technology Trends - {query}",
+            "url": "https://example.com/tech-trends",
+            "content": "Mock data for demonstration. Please set TAVILY_API_KEY in your .env file to get real search results.",
+        },
+    ]
+
+
+def _clean_response(response: Dict[str, Any]) -> List[Dict[str, str]]:
+    """从 Tavily 响应中提取精简后的结果列表"""
+    return [
+        {
+            "title": result.get("title", "无标题"),
+            "url": result.get("url", ""),
+            "content": result.get("content", ""),
+        }
+        for result in response.get("results", [])
+    ]
+
+
+def _fetch_results(
+    api_key: str,
+    query: str,
+    max_results: int,
+    search_depth: str,
+    timer: Optional[CallTimer] = None
+) -> List[Dict[str, str]]:
+    """在 Tavily 限流下执行搜索（被限流时退避重试），返回精简后的结果列表"""
+    response = limited_call(
+        "tavily",
+        lambda: _get_client(api_key).search(
+            query=query,
+            max_results=max_results,
+            search_depth=search_depth
+        ),
+        timer=timer
+    )
+    return _clean_response(response)
+
+
+async def _afetch_results(
+    api_key: str,
+    query: str,
+    max_results: int,
+    search_depth: str,
+    timer: Optional[CallTimer] = None
+) -> List[Dict[str, str]]:
+    """_fetch_results() 的异步版本，使用 AsyncTavilyClient"""
+    response = await alimited_call(
+        "tavily",
+        lambda: _get_async_client(api_key).search(
+            query=query,
+            max_results=max_results,
+            search_depth=search_depth
+        ),
+        timer=timer
+    )
+    return _clean_response(response)
+
+
+def _refresh_in_background(
+    key: str,
+    api_key: str,
+    query: str,
+    max_results: int,
+    search_depth: str
+) -> None:
+    """后台刷新过期的缓存条目，同一个键同时只刷新一次"""
+    with _client_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            results = _fetch_results(api_key, query, max_results, search_depth)
+            if results:
+                get_search_cache().set(key, results)
+        except Exception:
+            # 刷新失败时保留旧结果，等待下次请求重试
+            pass
+        finally:
+            with _client_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def format_results(results: List[Dict[str, str]], query: str) -> str:
+    """
+    将搜索结果格式化为清洗后的文本摘要
+
     Args:
+        results: search_results() 返回的结果列表
         query: 搜索查询字符串
-        max_results: 最大返回结果数量，默认 5
-        use_mock: 如果为 True，在缺少 API key 时使用模拟数据
-    
+
     Returns:
         清洗后的网页文本摘要字符串
     """
-    # #region agent log
-    try:
-        with open('/workspaces/social-media-assistant/.cursor/debug.log', 'a') as f:
-            f.write(json.dumps({"sessionId":"debug-session","runId":"api-check","hypothesisId":"A","location":"tools/search.py:30","message":"Checking TAVILY_API_KEY","data":{"query":query,"use_mock":use_mock},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-    except: pass
-    # #endregion
-    
+    if not results:
+        return f"未找到与 '{query}' 相关的搜索结果。"
+
+    summaries = []
+    for i, result in enumerate(results, 1):
+        title = result.get("title", "无标题")
+        content = result.get("content", "")
+        url = result.get("url", "")
+
+        # 清洗内容：移除多余的空白字符
+        content_clean = " ".join(content.split())
+
+        summaries.append(
+            f"[{i}] {title}\n"
+            f"来源: {url}\n"
+            f"摘要: {content_clean[:500]}..."  # 限制长度
+        )
+
+    return "\n\n".join(summaries)
+
+
+def _resolve_api_key(query: str, use_mock: bool) -> Optional[str]:
+    """
+    读取 TAVILY_API_KEY
+
+    Returns:
+        API key；缺少 key 且允许模拟数据时返回 None
+    """
+    log_event(
+        "tools/search.py:search_results", "Checking TAVILY_API_KEY", {"query": query, "use_mock": use_mock},
+        hypothesis_id="A", run_id="api-check"
+    )
+
     api_key = os.getenv("TAVILY_API_KEY")
-    
-    # #region agent log
-    try:
-        with open('/workspaces/social-media-assistant/.cursor/debug.log', 'a') as f:
-            f.write(json.dumps({"sessionId":"debug-session","runId":"api-check","hypothesisId":"A","location":"tools/search.py:35","message":"API key check result","data":{"has_key":bool(api_key),"use_mock":use_mock},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-    except: pass
-    # #endregion
-    
+
+    log_event(
+        "tools/search.py:search_results", "API key check result", {"has_key": bool(api_key), "use_mock": use_mock},
+        hypothesis_id="A", run_id="api-check"
+    )
+
     if not api_key:
         if use_mock:
-            # #region agent log
-            try:
-                with open('/workspaces/social-media-assistant/.cursor/debug.log', 'a') as f:
-                    f.write(json.dumps({"sessionId":"debug-session","runId":"api-check","hypothesisId":"A","location":"tools/search.py:40","message":"Using mock data","data":{"query":query},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-            except: pass
-            # #endregion
-            # 返回模拟数据用于测试
-            return f"""[1] AI Industry News - {query}
-来源: https://example.com/ai-news
-摘要: This is a mock search result for testing purposes. The query was: {query}. In a real scenario, this would contain actual search results from Tavily API.
-
-[2] Technology Trends - {query}
-来源: https://example.com/tech-trends
-摘要: Mock data for demonstration. Please set TAVILY_API_KEY in your .env file to get real search results."""
+            log_event(
+                "tools/search.py:search_results", "Using mock data", {"query": query},
+                hypothesis_id="A", run_id="api-check"
+            )
+            return None
         raise ValueError(
             "TAVILY_API_KEY 未设置。请在 .env 文件中设置 TAVILY_API_KEY，"
             "或使用 use_mock=True 参数进行测试"
         )
-    
-    try:
-        client = TavilyClient(api_key=api_key)
-        
-        # 执行搜索
-        response = client.search(
-            query=query,
-            max_results=max_results,
-            search_depth="advanced"  # 使用高级搜索深度
+    return api_key
+
+
+def _lookup_cache(
+    key: str,
+    freshness: float,
+    api_key: str,
+    query: str,
+    max_results: int,
+    search_depth: str
+) -> Optional[List[Dict[str, str]]]:
+    """
+    按新鲜度窗口查询缓存
+
+    新鲜条目直接返回；过期但在 stale 窗口内的条目同样返回，并触发后台刷新。
+    """
+    entry = get_search_cache().get_entry(key)
+    if entry is None:
+        return None
+    results, stored_at = entry
+    age = time.time() - stored_at
+    if age <= freshness:
+        return results
+    if age <= freshness + SEARCH_STALE_WINDOW:
+        _refresh_in_background(key, api_key, query, max_results, search_depth)
+        return results
+    return None
+
+
+def _handle_search_error(e: Exception, query: str, use_mock: bool) -> List[Dict[str, str]]:
+    """搜索失败时回退到模拟数据，或抛出 RuntimeError"""
+    log_event(
+        "tools/search.py:search_results", "Tavily API call failed", {"error": str(e), "error_type": type(e).__name__, "use_mock": use_mock},
+        hypothesis_id="C", run_id="api-check"
+    )
+
+    # 如果 API key 无效或请求失败，且允许使用模拟数据，则回退到模拟数据
+    if use_mock or "invalid API key" in str(e).lower() or "unauthorized" in str(e).lower():
+        log_event(
+            "tools/search.py:search_results", "Falling back to mock data due to API error", {"query": query},
+            hypothesis_id="C", run_id="api-check"
         )
-        
-        # 提取和清洗结果
-        results = response.get("results", [])
-        
-        if not results:
-            return f"未找到与 '{query}' 相关的搜索结果。"
-        
-        # 构建清洗后的文本摘要
-        summaries = []
-        for i, result in enumerate(results, 1):
-            title = result.get("title", "无标题")
-            content = result.get("content", "")
-            url = result.get("url", "")
-            
-            # 清洗内容：移除多余的空白字符
-            content_clean = " ".join(content.split())
-            
-            summaries.append(
-                f"[{i}] {title}\n"
-                f"来源: {url}\n"
-                f"摘要: {content_clean[:500]}..."  # 限制长度
+        # 返回模拟数据用于测试
+        return _mock_results(query)
+
+    error_msg = f"Tavily 搜索失败: {str(e)}"
+    raise RuntimeError(error_msg) from e
+
+
+def search_results(
+    query: str,
+    max_results: int = 5,
+    use_mock: bool = False,
+    search_depth: str = "advanced",
+    task_type: Optional[str] = None,
+    freshness: Optional[float] = None
+) -> List[Dict[str, str]]:
+    """
+    使用 Tavily 搜索内容，返回结构化结果列表（带缓存）
+
+    缓存键为 (query, max_results, search_depth)。结果在新鲜度窗口内直接返回；
+    过期但仍在 stale 窗口内时先返回旧结果，并在后台刷新。缓存未命中时，
+    并发的相同搜索只会向 Tavily 发起一次请求。
+
+    Args:
+        query: 搜索查询字符串
+        max_results: 最大返回结果数量，默认 5
+        use_mock: 如果为 True，在缺少 API key 时使用模拟数据
+        search_depth: Tavily 搜索深度，默认 advanced
+        task_type: 任务类型，用于选择新鲜度窗口（brief/cv/paper）
+        freshness: 新鲜度窗口（秒），优先于 task_type
+
+    Returns:
+        包含 title/url/content 的结果列表
+    """
+    api_key = _resolve_api_key(query, use_mock)
+    if api_key is None:
+        # 返回模拟数据用于测试
+        with CallTimer("search", "mock"):
+            if MOCK_SEARCH_LATENCY > 0:
+                time.sleep(MOCK_SEARCH_LATENCY)
+            return _mock_results(query)
+
+    if freshness is None:
+        freshness = SEARCH_FRESHNESS.get((task_type or "").lower(), SEARCH_DEFAULT_FRESHNESS)
+
+    key = hash_key({"query": query, "max_results": max_results, "search_depth": search_depth})
+    with CallTimer("search", "tavily") as timer:
+        if SEARCH_CACHE_ENABLED:
+            cached = _lookup_cache(key, freshness, api_key, query, max_results, search_depth)
+            if cached is not None:
+                timer.cached = True
+                return copy.deepcopy(cached)
+
+        try:
+            results, timer.coalesced = _in_flight.do_shared(
+                key, _fetch_results, api_key, query, max_results, search_depth, timer
             )
-        
-        return "\n\n".join(summaries)
-        
-    except Exception as e:
-        # #region agent log
+        except Exception as e:
+            return _handle_search_error(e, query, use_mock)
+
+        if SEARCH_CACHE_ENABLED and results and not timer.coalesced:
+            get_search_cache().set(key, copy.deepcopy(results))
+        # 合并的调用方与缓存各持有独立副本，调用方修改结果不会影响其他调用方
+        return copy.deepcopy(results) if timer.coalesced else results
+
+
+async def asearch_results(
+    query: str,
+    max_results: int = 5,
+    use_mock: bool = False,
+    search_depth: str = "advanced",
+    task_type: Optional[str] = None,
+    freshness: Optional[float] = None
+) -> List[Dict[str, str]]:
+    """
+    search_results() 的异步版本，使用 AsyncTavilyClient，参数与缓存语义相同
+
+    Returns:
+        包含 title/url/content 的结果列表
+    """
+    api_key = _resolve_api_key(query, use_mock)
+    if api_key is None:
+        # 返回模拟数据用于测试
+        with CallTimer("search", "mock"):
+            if MOCK_SEARCH_LATENCY > 0:
+                await asyncio.sleep(MOCK_SEARCH_LATENCY)
+            return _mock_results(query)
+
+    if freshness is None:
+        freshness = SEARCH_FRESHNESS.get((task_type or "").lower(), SEARCH_DEFAULT_FRESHNESS)
+
+    key = hash_key({"query": query, "max_results": max_results, "search_depth": search_depth})
+    with CallTimer("search", "tavily") as timer:
+        if SEARCH_CACHE_ENABLED:
+            cached = _lookup_cache(key, freshness, api_key, query, max_results, search_depth)
+            if cached is not None:
+                timer.cached = True
+                return copy.deepcopy(cached)
+
         try:
-            with open('/workspaces/social-media-assistant/.cursor/debug.log', 'a') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"api-check","hypothesisId":"C","location":"tools/search.py:100","message":"Tavily API call failed","data":{"error":str(e),"error_type":type(e).__name__,"use_mock":use_mock},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
-        # #endregion
-        
-        # 如果 API key 无效或请求失败，且允许使用模拟数据，则回退到模拟数据
-        if use_mock or "invalid API key" in str(e).lower() or "unauthorized" in str(e).lower():
-            # #region agent log
-            try:
-                with open('/workspaces/social-media-assistant/.cursor/debug.log', 'a') as f:
-                    f.write(json.dumps({"sessionId":"debug-session","runId":"api-check","hypothesisId":"C","location":"tools/search.py:105","message":"Falling back to mock data due to API error","data":{"query":query},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-            except: pass
-            # #endregion
-            # 返回模拟数据用于测试
-            return f"""[1] AI Industry News - {query}
-来源: https://example.com/ai-news
-摘要: This is a mock search result for testing purposes. The query was: {query}. In a real scenario, this would contain actual search results from Tavily API.
-
-[2] Technology Trends - {query}
-来源: https://example.com/tech-trends
-摘要: Mock data for demonstration. Please set TAVILY_API_KEY in your .env file to get real search results."""
-        
-        error_msg = f"Tavily 搜索失败: {str(e)}"
-        raise RuntimeError(error_msg) from e
+            results, timer.coalesced = await _in_flight.ado_shared(
+                key, _afetch_results, api_key, query, max_results, search_depth, timer
+            )
+        except Exception as e:
+            return _handle_search_error(e, query, use_mock)
+
+        if SEARCH_CACHE_ENABLED and results and not timer.coalesced:
+            get_search_cache().set(key, copy.deepcopy(results))
+        # 合并的调用方与缓存各持有独立副本，调用方修改结果不会影响其他调用方
+        return copy.deepcopy(results) if timer.coalesced else results
+
+
+def search_content(
+    query: str,
+    max_results: int = 5,
+    use_mock: bool = False,
+    task_type: Optional[str] = None,
+    freshness: Optional[float] = None
+) -> str:
+    """
+    使用 Tavily 搜索内容并返回清洗后的网页文本摘要
+
+    Args:
+        query: 搜索查询字符串
+        max_results: 最大返回结果数量，默认 5
+        use_mock: 如果为 True，在缺少 API key 时使用模拟数据
+        task_type: 任务类型，用于选择缓存新鲜度窗口（brief/cv/paper）
+        freshness: 缓存新鲜度窗口（秒），优先于 task_type
+
+    Returns:
+        清洗后的网页文本摘要字符串
+    """
+    results = search_results(
+        query,
+        max_results=max_results,
+        use_mock=use_mock,
+        task_type=task_type,
+        freshness=freshness
+    )
+    return format_results(results, query)
+
+
+async def asearch_content(
+    query: str,
+    max_results: int = 5,
+    use_mock: bool = False,
+    task_type: Optional[str] = None,
+    freshness: Optional[float] = None
+) -> str:
+    """
+    search_content() 的异步版本
+
+    Returns:
+        清洗后的网页文本摘要字符串
+    """
+    results = await asearch_results(
+        query,
+        max_results=max_results,
+        use_mock=use_mock,
+        task_type=task_type,
+        freshness=freshness
+    )
+    return format_results(results, query)
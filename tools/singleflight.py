@@ -0,0 +1,121 @@
+"""
+请求合并（single-flight）
+相同键的并发调用只执行一次，其余调用方等待并共享同一个结果
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """
+    按键合并进行中的调用
+
+    异步调用（ado）可以加入进行中的同步调用（do），在事件循环中等待其结果而不阻塞线程；
+    反方向不合并：同步调用方不会加入进行中的异步调用（等待其他事件循环中的任务可能阻塞该循环），
+    而是自行执行。异步调用之间按事件循环分别合并。
+    enabled 为 False 时不合并，每次调用都直接执行（如基准测试需要测量未合并的延迟）。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._tasks: Dict[Tuple[int, str], "asyncio.Task[Any]"] = {}
+        self.shared = 0
+
+    def in_flight(self, key: str) -> bool:
+        """是否存在该键的进行中调用"""
+        with self._lock:
+            return key in self._calls or any(k == key for _, k in self._tasks)
+
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        同步执行 fn，若已有相同键的调用在进行中则等待其结果
+
+        Args:
+            key: 合并键
+            fn: 实际执行的函数
+
+        Returns:
+            fn 的返回值（异常同样会传递给所有等待方）
+        """
+        return self.do_shared(key, fn, *args, **kwargs)[0]
+
+    def do_shared(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        与 do() 相同，额外返回结果是否来自其他调用方发起的执行
+
+        Returns:
+            (fn 的返回值, 是否为共享结果)
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs), False
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        异步执行 fn，若已有相同键的调用在进行中则等待其结果
+
+        Args:
+            key: 合并键
+            fn: 实际执行的协程函数
+
+        Returns:
+            fn 的返回值（异常同样会传递给所有等待方）
+        """
+        return (await self.ado_shared(key, fn, *args, **kwargs))[0]
+
+    async def ado_shared(self, key: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        与 ado() 相同，额外返回结果是否来自其他调用方发起的执行
+
+        Returns:
+            (fn 的返回值, 是否为共享结果)
+        """
+        if not self.enabled:
+            return await fn(*args, **kwargs), False
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            future = self._calls.get(key)
+            task = self._tasks.get(task_key)
+            shared = future is not None or task is not None
+            if shared:
+                self.shared += 1
+            else:
+                task = loop.create_task(fn(*args, **kwargs))
+                self._tasks[task_key] = task
+                task.add_done_callback(lambda _: self._forget(task_key))
+
+        if future is not None:
+            return await asyncio.wrap_future(future), True
+        # shield：某个等待方被取消时不影响其他等待方
+        return await asyncio.shield(task), shared
+
+    def _forget(self, task_key: Tuple[int, str]) -> None:
+        """任务完成后移除记录"""
+        with self._lock:
+            self._tasks.pop(task_key, None)
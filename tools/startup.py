@@ -0,0 +1,111 @@
+"""
+启动耗时分析
+开启后记录每个顶层包的导入耗时（扣除其间导入的其他包）以及关键启动阶段的时间点，
+用于 main.py --profile-startup
+"""
+import sys
+import time
+import builtins
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+_enabled = False
+_start = 0.0
+_lock = threading.Lock()
+_original_import = builtins.__import__
+# 顶层包 -> 自身导入耗时（秒）
+_import_times: Dict[str, float] = {}
+_marks: List[Tuple[str, float]] = []
+_local = threading.local()
+
+
+def _profiled_import(name: str, globals: Any = None, locals: Any = None, fromlist: Any = (), level: int = 0) -> Any:
+    """包装 __import__：统计首次导入的模块并按顶层包汇总，嵌套导入的其他模块耗时从外层扣除"""
+    if level != 0 or not name or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with _lock:
+            root = name.partition(".")[0]
+            _import_times[root] = _import_times.get(root, 0.0) + elapsed - children
+
+
+def enable(since: Optional[float] = None) -> None:
+    """
+    开始记录（应在导入业务模块之前调用）
+
+    Args:
+        since: 启动阶段计时的起点（time.perf_counter() 的值），默认为调用时刻
+    """
+    global _enabled, _start
+    if _enabled:
+        return
+    _enabled = True
+    _start = since if since is not None else time.perf_counter()
+    builtins.__import__ = _profiled_import
+
+
+def record_import(name: str, seconds: float) -> None:
+    """
+    补记开启记录之前完成的导入（如 tools 包自身的初始化与 .env 加载）
+
+    Args:
+        name: 顶层包名
+        seconds: 导入耗时（秒）
+    """
+    with _lock:
+        _import_times[name] = _import_times.get(name, 0.0) + seconds
+
+
+def disable() -> None:
+    """停止记录导入耗时"""
+    builtins.__import__ = _original_import
+
+
+def mark(label: str) -> None:
+    """
+    记录一个启动阶段的时间点（未开启时忽略；同一标签只记录第一次）
+
+    Args:
+        label: 阶段名称，如 "graph compiled"、"first node"
+    """
+    if not _enabled:
+        return
+    with _lock:
+        if all(existing != label for existing, _ in _marks):
+            _marks.append((label, time.perf_counter() - _start))
+
+
+def report(top: int = 15) -> str:
+    """
+    生成启动耗时报告
+
+    Args:
+        top: 列出耗时最多的前 N 个包
+
+    Returns:
+        多行文本
+    """
+    with _lock:
+        imports = sorted(_import_times.items(), key=lambda item: item[1], reverse=True)
+        marks = list(_marks)
+    total = sum(seconds for _, seconds in imports)
+    lines = [f"📦 模块导入耗时（共 {total * 1000:.0f} ms，按顶层包统计，前 {top} 项）:"]
+    for name, seconds in imports[:top]:
+        lines.append(f"  - {name}: {seconds * 1000:.1f} ms")
+    if marks:
+        lines.append("⏱️  启动阶段（自 main.py 开始导入起）:")
+        for label, seconds in marks:
+            lines.append(f"  - {label}: {seconds * 1000:.0f} ms")
+    return "\n".join(lines)